@@ -2,7 +2,7 @@
 # FILE: admin_update_jobs.py
 # AUTHOR: David Ruvolo
 # CREATED: 2023-07-14
-# MODIFIED: 2023-07-14
+# MODIFIED: 2026-10-19
 # PURPOSE: update scheduled jobs reporting table
 # STATUS: in.progress
 # PACKAGES: **see below**
@@ -10,7 +10,15 @@
 #///////////////////////////////////////////////////////////////////////////////
 
 from cosastools.molgenis import Molgenis
-from datatable import dt, f, as_type
+from cosastools.reports import (
+  getJobStatistics,
+  getJobWatermark,
+  getPendingExecutions,
+  getJobExecutions,
+  updateJobStatistics,
+  jobStatisticsToFrame
+)
+from datatable import dt, f
 
 # ~ local ~
 from os import environ
@@ -37,57 +45,30 @@ schedule = dt.Frame(
 del schedule['_href']
 
 schedule.names = {'cronExpression':'cron'}
-schedule[:, dt.update(
-  dateLastRun=as_type(None, dt.Type.str32),
-  isStable=as_type(None, dt.Type.str32)
-)]
 
-# pull history of runs
-history = dt.Frame(
-  cosas.get(
-    'sys_job_ScriptJobExecution',
-    attributes='name,status,submissionDate'
-  )
+# update job statistics with the executions since the last run rather than
+# pulling the entire history of runs. If there are no statistics yet, the
+# entire history is retrieved once.
+statistics = getJobStatistics(cosas)
+executions = getJobExecutions(
+  cosas,
+  watermark=getJobWatermark(statistics),
+  exclude=['TEST'],
+  pending=getPendingExecutions(statistics)
 )
+statistics = updateJobStatistics(statistics, executions)
+statisticsDT = jobStatisticsToFrame(statistics)
 
-del history['_href']
-
-history['submissionDate'] = dt.Frame([
-  value.split('T')[0] if bool(value) else value
-  for value in history['submissionDate'].to_list()[0]
-])
+# map most recent run to scheduled jobs; jobs without a run are inactive
+recentRuns = statisticsDT[:, {
+  'name': f.name,
+  'dateLastRun': f.lastRun,
+  'isStable': f.lastStatus
+}]
+recentRuns.key = 'name'
 
-history[:, dt.update(
-  submissionDate=as_type(f.submissionDate, dt.Type.date32)
-)]
-
-
-# map data by cron expression as names and labels differ
-for job in schedule['cron'].to_list()[0]:
-  # filter history to known job
-  jobHistory = history[f.cron == job, :]
-  
-  if jobHistory.nrows:
-  
-    # find the most recent date and convert to date string and
-    # set date class to string
-    recentDate = jobHistory[:, f.submissionDate].max1().strftime('%Y-%m-%d')
-    jobHistory[:, dt.update(submissionDate=as_type(f.submissionDate, dt.Type.str32))]
-  
-    # find most recent run
-    recentRun = jobHistory[(f.name==job) & (f.submissionDate == recentDate), :]
-    
-    # update schedule dataset
-    schedule[f.name==job,f.dateLastRun] = recentRun['submissionDate'].to_list()[0][0]
-    schedule[f.name==job,f.isStable] = recentRun['status'].to_list()[0][0]
-  
-  else:
-    schedule[f.name==job, f.dateLastRun] = None
-    schedule[f.name==job, f.isStable] = 'INACTIVE'
-    
-
-dt.unique(history['name'])
-schedule[:, ['name','cron','dateLastRun','isStable']]
+schedule = schedule[:, :, dt.join(recentRuns)]
+schedule[:, dt.update(isStable=dt.ifelse(f.isStable == None, 'INACTIVE', f.isStable))]
 
 # recode values
 schedule['isStable'] = dt.Frame([
@@ -95,5 +76,7 @@ schedule['isStable'] = dt.Frame([
   for value in schedule['isStable'].to_list()[0]
 ])
 
-
-# cosas.importDatatableAsCsv('cosasreports_jobs', schedule)
\ No newline at end of file
+# `cosasreports_jobs` is built by cosasreports_jobs.py (job names are mapped
+# and inactive jobs are flagged there); only the statistics are imported here
+# cosas.importDatatableAsCsv('cosasreports_jobs', schedule)
+cosas.importDatatableAsCsv('cosasreports_jobstatistics', statisticsDT)
\ No newline at end of file
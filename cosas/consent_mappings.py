@@ -2,7 +2,7 @@
 # FILE: cosas_consent.py
 # AUTHOR: David Ruvolo
 # CREATED: 2022-11-10
-# MODIFIED: 2023-07-04
+# MODIFIED: 2026-10-19
 # PURPOSE: mapping script for consent dataset
 # STATUS: stable
 # PACKAGES: see below
@@ -10,7 +10,7 @@
 #///////////////////////////////////////////////////////////////////////////////
 
 from cosastools.molgenis import Molgenis,print2
-from cosastools.datatable import uniqueValuesById
+from cosastools.datatable import uniqueValuesById, wideToLong
 from datatable import dt, f
 import re
 
@@ -179,32 +179,29 @@ consent['allowDiagnosticUse'] = dt.Frame([
 # build: consents signed table --- stack attributes by form type
 collectedBy='geneticadiagnostiek'
 
-signedConsents = dt.rbind(
-  consent[:, {
-    'consentID': f.MDN_umcgnr,
-    'consentFormType': 'aanvraagforumulier',
-    'consentFormUsed': f.request_form,
-    'dateFormSigned': f.request_date_signed,
-    'collectedBy':  collectedBy
-  }],
-  consent[:, {
-    'consentID': f.MDN_umcgnr,
-    'consentFormType': 'toestemmingsforumlier',
-    'consentFormUsed': f.consent_form,
-    'dateFormSigned': f.consent_date_signed,
-    'collectedBy':  collectedBy,
-    'system': f.consent_system
-  }],
-  consent[:, {
-    'consentID': f.MDN_umcgnr,
-    'consentFormType': 'melden van incidental findings',
-    'consentFormUsed': f.incidental_form,
-    'dateFormSigned': f.incidental_date_signed,
-    'collectedBy':  collectedBy
-  }],
-  force = True
+signedConsents = wideToLong(
+  data = consent,
+  groups = {
+    'aanvraagforumulier': {
+      'consentFormUsed': 'request_form',
+      'dateFormSigned': 'request_date_signed'
+    },
+    'toestemmingsforumlier': {
+      'consentFormUsed': 'consent_form',
+      'dateFormSigned': 'consent_date_signed',
+      'system': 'consent_system'
+    },
+    'melden van incidental findings': {
+      'consentFormUsed': 'incidental_form',
+      'dateFormSigned': 'incidental_date_signed'
+    }
+  },
+  idColumns = {'consentID': 'MDN_umcgnr'},
+  index = 'consentFormType'
 )
 
+signedConsents['collectedBy'] = collectedBy
+
 #///////////////////////////////////////
 
 # ~ 2b ~
@@ -2,7 +2,7 @@
 # FILE: mappings_cosas.py
 # AUTHOR: David Ruvolo
 # CREATED: 2021-10-05
-# MODIFIED: 2023-07-04
+# MODIFIED: 2026-10-19
 # PURPOSE: primary mapping script for COSAS
 # STATUS: stable
 # PACKAGES: **see below**
@@ -10,7 +10,9 @@
 #////////////////////////////////////////////////////////////////////////////
 
 from cosastools.molgenis import Molgenis, print2
-from cosastools.logger import cosasLogger
+from cosastools.logger import cosasLogger, countRows
+from cosastools.pipeline import Pipeline
+from cosastools.datatable import wideToLong, summarizeFrame
 from datatable import dt, f, as_type, first
 from datetime import datetime
 import pytz
@@ -21,6 +23,32 @@ host = 'http://localhost/api/'
 token = '${molgenisToken}'
 createdBy = 'cosasbot'
 
+# memory profiling (slow; only enable when investigating memory usage)
+# allocations and table sizes are recorded for each step and saved to
+# `profileReport` alongside the processing step logs. While profiling, the
+# pipeline runs one stage at a time in the main process (`workers` and
+# `executor` are ignored)
+profile = False
+profileReport = 'cosas_daily_mappings_profile.json'
+
+# pipeline options: number of stages to run at the same time, run stages in
+# threads ('thread') or in forked worker processes ('process'), and the
+# location to cache the output of each stage (if None, all stages are always
+# run). Process mode is faster for large runs, but only enable it where the
+# script runner allows forking. The fetch stages are never cached, so the
+# latest exports are always used.
+workers = 4
+executor = 'thread'
+cacheDir = None
+
+# restartable runs: if `runDir` is set, the output of each stage is saved in
+# the run directory. If a run fails, set `resumeFrom` to the name of a stage
+# (e.g., 'buildClinical') to run that stage and all stages that depend on it
+# again, or to 'import' to skip all stages and only run the validation and
+# import steps. All other outputs are memory-mapped from the run directory.
+runDir = None
+resumeFrom = None
+
 def calcAge(earliest: datetime.date = None, recent: datetime.date = None):
   """Calculate Years of Age between two dates
   @param earliest: the earliest date (datetime: yyyy-mm-dd)
@@ -65,12 +93,13 @@ def collapseHpoColumns(*kwargs):
   else:
     return None
 
-def collapseTestCodes(subjectID, sampleID, requestID, column):
+def collapseTestCodes(data, subjectID, sampleID, requestID, column):
   """Collapse Test Codes
   In the COSAS samples table, find all matching alternative identifiers
   by id (subject-, sample-, and request identifiers), get distinct
   values, and collapse into a string
 
+  @param data datatable object (i.e., samples)
   @param subjectId subject ID to locate
   @param sampleId sample ID to locate
   @param requestId specific request associated with a sample
@@ -78,7 +107,7 @@ def collapseTestCodes(subjectID, sampleID, requestID, column):
   @return comma separated string containing one or more value
   """
   values = list(filter(None,
-    samples[
+    data[
       (f.belongsToSubject == subjectID) &
       (f.sampleID == sampleID) &
       (f.belongsToRequest == requestID),
@@ -182,6 +211,23 @@ def uniqueValuesById(data, groupby, column, keyGroupBy=True):
   if keyGroupBy: output.key = groupby
   return output
 
+def probeCompleteness(tablename: str, data):
+  """Probe Completeness
+  Summarize the completeness of a table after a mapping step and print all
+  columns that do not have any values (e.g., a mapping failed or the source
+  data has changed).
+
+  @param tablename name of the table
+  @param data datatable object
+  @return datatable object (see `summarizeFrame`)
+  """
+  summary = summarizeFrame(data, tablename)
+  if summary.nrows:
+    emptyColumns = summary[f.countOfValues == 0, f.databaseColumn].to_list()[0]
+    if emptyColumns:
+      print2(f'{tablename}: no values found in', ', '.join(emptyColumns))
+  return summary
+
 # //////////////////////////////////////////////////////////////////////////////
 
 # ~ 99 ~
@@ -198,11 +244,30 @@ db = Molgenis(url=host, token=token)
 # db = Molgenis(url=environ['MOLGENIS_ACC_HOST'])
 # db.login(environ['MOLGENIS_ACC_USR'], environ['MOLGENIS_ACC_PWD'])
 
-# init logs
+# only for offline dev and benchmarking (see utils/utils_create_snapshot.py)
+# from cosastools.snapshot import MolgenisSnapshot
+# db = MolgenisSnapshot('snapshots/cosas', outputDir='snapshots/imports')
+
+# init logs. When profiling, the pipeline records the input and output
+# Frames of each stage; the Frames in `globals()` are recorded for the
+# validation and import steps that run after the pipeline.
 print2('COSAS: starting job...')
-cosaslogs = cosasLogger(silent=True)
+cosaslogs = cosasLogger(
+  silent=True,
+  profile=profile,
+  profileNamespace=globals()
+)
 cosaslogs.start()
 
+# stages are registered in sections 0 to 4 (see `Pipeline`)
+pipeline = Pipeline(
+  logger=cosaslogs,
+  cacheDir=cacheDir,
+  workers=workers,
+  executor=executor,
+  checkpointDir=runDir
+)
+
 # //////////////////////////////////////////////////////////////////////////////
 
 # ~ 0 ~
@@ -213,69 +278,89 @@ cosaslogs.start()
 # then run the cosasportal_benchcnv_prep.py script. The prepped data will be
 # uploaded to 'cosasportal_benchcnv_prepped'.
 
-print2('COSAS Portal: Loading the latest data exports...')
-cosaslogs.startProcessingStepLog(
-  type='Data retrieval',
+@pipeline.stage(
+  outputs=[
+    'raw_subjects',
+    'raw_clinical',
+    'raw_benchcnv',
+    'raw_samples',
+    'raw_array_adlas',
+    'raw_array_darwin',
+    'raw_ngs_adlas',
+    'raw_ngs_darwin'
+  ],
   name='Fetch portal data',
-  tablename="cosasportal"
+  type='Data retrieval',
+  tablename='cosasportal',
+  local=True,
+  cache=False
 )
-
-# get raw data
-raw_subjects = dt.Frame(db.get('cosasportal_patients',batch_size=10000))
-raw_clinical = dt.Frame(db.get('cosasportal_diagnoses', batch_size=10000))
-raw_benchcnv = dt.Frame(db.get('cosasportal_cartagenia',batch_size=10000))
-raw_samples = dt.Frame(
-  db.get(
-    'cosasportal_samples',
-    attributes='DNA_NUMMER,UMCG_NUMMER,ADVVRG_ID,MATERIAAL,TEST_CODE,TEST_OMS',
-    batch_size=10000
+def fetchPortalData(step):
+  """Fetch portal data
+  @param step log of the current processing step
+  @return tuple of datatable objects
+  """
+  print2('COSAS Portal: Loading the latest data exports...')
+
+  # get raw data
+  raw_subjects = dt.Frame(db.get('cosasportal_patients',batch_size=10000))
+  raw_clinical = dt.Frame(db.get('cosasportal_diagnoses', batch_size=10000))
+  raw_benchcnv = dt.Frame(db.get('cosasportal_cartagenia',batch_size=10000))
+  raw_samples = dt.Frame(
+    db.get(
+      'cosasportal_samples',
+      attributes='DNA_NUMMER,UMCG_NUMMER,ADVVRG_ID,MATERIAAL,TEST_CODE,TEST_OMS',
+      batch_size=10000
+    )
   )
-)
 
-raw_array_adlas = dt.Frame(db.get('cosasportal_labs_array_adlas',batch_size=10000))
-raw_array_darwin = dt.Frame(db.get('cosasportal_labs_array_darwin',batch_size=10000))
-raw_ngs_adlas = dt.Frame(db.get('cosasportal_labs_ngs_adlas',batch_size=10000))
-raw_ngs_darwin = dt.Frame(db.get('cosasportal_labs_ngs_darwin',batch_size=10000))
-
-# delete _href column (not necessary, but helpful for local dev)
-# del raw_subjects['_href']
-# del raw_clinical['_href']
-# del raw_benchcnv['_href']
-# del raw_samples['_href']
-# del raw_array_adlas['_href']
-# del raw_array_darwin['_href']
-# del raw_ngs_adlas['_href']
-# del raw_ngs_darwin['_href']
-
-# ~ 0a ~
-# Before we move on, check to see if the objects are empty. If any of these
-# datasets are, then quit the job. It is likely that something failed during
-# the file import process.
-rawdata = {
-  'subjects': raw_subjects,
-  'samples': raw_samples,
-  'clinical': raw_clinical,
-  'array_adlas': raw_array_adlas,
-  'array_darwin': raw_array_darwin,
-  'ngs_adlas': raw_ngs_adlas,
-  'ngs_darwin': raw_ngs_darwin
-}
-
-# test nrows: stop at first empty dataset
-for dataset in rawdata:
-  if not rawdata[dataset].nrows:
-    cosaslogs.currentStep['status'] = 'Source Data Not Available'
-    cosaslogs.currentStep['comment'] = f'Object {dataset} is empty'
-    cosaslogs.stopProcessingStepLog()
-    cosaslogs.stop()
-    db.importData(entity='cosasreports_processingsteps',data=cosaslogs.processingStepLogs)
-    db.importData(entity='cosasreports_imports', data=[cosaslogs.log])
-    raise SystemError(f'Source data cannot be found for {dataset}')
-
-# continue
-del rawdata
-cosaslogs.currentStep['status'] = 'Success'
-cosaslogs.stopProcessingStepLog()
+  raw_array_adlas = dt.Frame(db.get('cosasportal_labs_array_adlas',batch_size=10000))
+  raw_array_darwin = dt.Frame(db.get('cosasportal_labs_array_darwin',batch_size=10000))
+  raw_ngs_adlas = dt.Frame(db.get('cosasportal_labs_ngs_adlas',batch_size=10000))
+  raw_ngs_darwin = dt.Frame(db.get('cosasportal_labs_ngs_darwin',batch_size=10000))
+
+  # delete _href column (not necessary, but helpful for local dev)
+  # del raw_subjects['_href']
+  # del raw_clinical['_href']
+  # del raw_benchcnv['_href']
+  # del raw_samples['_href']
+  # del raw_array_adlas['_href']
+  # del raw_array_darwin['_href']
+  # del raw_ngs_adlas['_href']
+  # del raw_ngs_darwin['_href']
+
+  # ~ 0a ~
+  # Before we move on, check to see if the objects are empty. If any of these
+  # datasets are, then quit the job. It is likely that something failed during
+  # the file import process.
+  rawdata = {
+    'subjects': raw_subjects,
+    'samples': raw_samples,
+    'clinical': raw_clinical,
+    'array_adlas': raw_array_adlas,
+    'array_darwin': raw_array_darwin,
+    'ngs_adlas': raw_ngs_adlas,
+    'ngs_darwin': raw_ngs_darwin
+  }
+
+  # test nrows: stop at first empty dataset
+  for dataset in rawdata:
+    if not rawdata[dataset].nrows:
+      step['status'] = 'Source Data Not Available'
+      step['comment'] = f'Object {dataset} is empty'
+      raise SystemError(f'Source data cannot be found for {dataset}')
+
+  step['status'] = 'Success'
+  return (
+    raw_subjects,
+    raw_clinical,
+    raw_benchcnv,
+    raw_samples,
+    raw_array_adlas,
+    raw_array_darwin,
+    raw_ngs_adlas,
+    raw_ngs_darwin
+  )
 
 # ~ 0b ~
 # Pull COSAS Mapping Tables
@@ -285,36 +370,62 @@ cosaslogs.stopProcessingStepLog()
 # not found". Add a new record in the corresponding table. Some tables may only
 # have a single mapping, but this may change in the future.
 
-print2('COSAS Mappings: Pulling mapping tables...')
-cosaslogs.startProcessingStepLog(
-  type='Data retrieval',
+@pipeline.stage(
+  outputs=[
+    'genderMappings',
+    'biospecimenTypeMappings',
+    'sampleReasonMappings',
+    'sequencerPlatformMappings',
+    'sequencerInstrumentMappings',
+    'genomeBuildMappings',
+    'cineasHpoMappings',
+    'activeTestCodes'
+  ],
   name='Fetch mapping tables',
-  tablename='cosasportal'
-)
-
-genderMappings = toKeyPairs(db.get('cosasmappings_genderatbirth'))
-biospecimenTypeMappings = toKeyPairs(db.get('cosasmappings_biospecimentype'))
-sampleReasonMappings = toKeyPairs(db.get('cosasmappings_samplereason'))
-sequencerPlatformMappings = toKeyPairs(db.get('cosasmappings_sequencerinfo'))
-sequencerInstrumentMappings = toKeyPairs(
-  data=db.get('cosasmappings_sequencerinfo'),
-  keyAttr='from',
-  valueAttr='toAlternate'
+  type='Data retrieval',
+  tablename='cosasportal',
+  local=True,
+  cache=False
 )
+def fetchMappingTables(step):
+  """Fetch mapping tables
+  @param step log of the current processing step
+  @return tuple of mappings (dict) and the active test codes
+  """
+  print2('COSAS Mappings: Pulling mapping tables...')
+
+  genderMappings = toKeyPairs(db.get('cosasmappings_genderatbirth'))
+  biospecimenTypeMappings = toKeyPairs(db.get('cosasmappings_biospecimentype'))
+  sampleReasonMappings = toKeyPairs(db.get('cosasmappings_samplereason'))
+  sequencerPlatformMappings = toKeyPairs(db.get('cosasmappings_sequencerinfo'))
+  sequencerInstrumentMappings = toKeyPairs(
+    data=db.get('cosasmappings_sequencerinfo'),
+    keyAttr='from',
+    valueAttr='toAlternate'
+  )
 
-genomeBuildMappings = toKeyPairs(db.get('cosasmappings_genomebuild'))
-
-cineasHpoMappings = toKeyPairs(
-  data=db.get('cosasmappings_cineasmappings', attributes='code,hpo'),
-  keyAttr='code',
-  valueAttr='hpo'
-)
+  genomeBuildMappings = toKeyPairs(db.get('cosasmappings_genomebuild'))
 
-# get labprocedures
-activeTestCodes = dt.Frame(db.get(entity='umdm_labProcedures', attributes='code'))
+  cineasHpoMappings = toKeyPairs(
+    data=db.get('cosasmappings_cineasmappings', attributes='code,hpo'),
+    keyAttr='code',
+    valueAttr='hpo'
+  )
 
-cosaslogs.currentStep['status'] = 'Success'
-cosaslogs.stopProcessingStepLog()
+  # get labprocedures
+  activeTestCodes = dt.Frame(db.get(entity='umdm_labProcedures', attributes='code'))
+
+  step['status'] = 'Success'
+  return (
+    genderMappings,
+    biospecimenTypeMappings,
+    sampleReasonMappings,
+    sequencerPlatformMappings,
+    sequencerInstrumentMappings,
+    genomeBuildMappings,
+    cineasHpoMappings,
+    activeTestCodes
+  )
 
 # //////////////////////////////////////////////////////////////////////////////
 
@@ -328,39 +439,6 @@ cosaslogs.stopProcessingStepLog()
 # in this export.
 #
 # NOTE: Row level metadata will be applied at the end of the script.
-#
-print2('Subjects: building initial table structure...')
-cosaslogs.startProcessingStepLog(
-  type='Data Processing',
-  name='Build initial table structure',
-  tablename='subjects'
-)
-
-# pull variables of interest from portal table
-subjects = raw_subjects[:, {
-  'subjectID': f.UMCG_NUMBER,
-  'belongsToFamily': f.FAMILIENUMMER,
-  'belongsToMother': f.UMCG_MOEDER,
-  'belongsToFather': f.UMCG_VADER,
-  'belongsWithFamilyMembers': f.FAMILIELEDEN,
-  'dateOfBirth': f.GEBOORTEDATUM,
-  'yearOfBirth': None,
-  'dateOfDeath': f.OVERLIJDENSDATUM,
-  'yearOfDeath': None,
-  'ageAtDeath': None,
-  'genderAtBirth': f.GESLACHT,
-  'ageAtDeath': None,
-  'primaryOrganization': 'UMCG'
-}][:, :, dt.sort(as_type(f.subjectID, int))]
-
-# create a list of unique subject identifiers --- very important!!!!
-cosasSubjectIdList = dt.unique(subjects['subjectID']).to_list()[0]
-
-# save row count and set status
-cosaslogs.currentStep['comment'] = f'Initial subjects count: {subjects.nrows}'
-cosaslogs.currentStep['status'] = 'Success' if subjects.nrows else 'Error'
-cosaslogs.stopProcessingStepLog()
-
 #
 # NOTE: Will not do step "1a" for now. If you changed `belongsWithFamilyMembers`
 # to type `mref`, then you will need to find patient identifiers that do not
@@ -368,237 +446,176 @@ cosaslogs.stopProcessingStepLog()
 # cosas/misc/mappings_extra.py to see code that extracts this information.
 #
 
-# ~ 1b ~
-# Identify new material identifiers
-#
-# In the subjects dataset, check all values in the the column `belongsToMother`
-# to make sure the ID exists in the `subjectID` column. Rather than removing
-# values from COSAS, unknown identifiers will be registered as new subjects.
-#
-print2('Subjects: Identifying new maternal identifiers...')
-cosaslogs.startProcessingStepLog(
-  type='Filtering',
-  name='Identify new maternalIDs',
-  tablename='subjects'
-)
-
-belongsToMother = dt.Frame([
-  {
-    'subjectID': tuple[0],
-    'belongsToFamily': tuple[1],
-    'genderAtBirth': 'Vrouw',
-    'comments': 'manually registered in COSAS'
-  }
-  for tuple in subjects[:, (f.belongsToMother, f.belongsToFamily)].to_tuples()
-  if not (tuple[0] is None) and not (tuple[0] in cosasSubjectIdList)
-])
-
-# log number of cases found
-print2('Subjects: found {} new maternal IDs'.format(belongsToMother.nrows))
-cosaslogs.currentStep['comment'] = f'New maternalIDs found: {belongsToMother.nrows}'
-cosaslogs.currentStep['status'] = 'Success'
-cosaslogs.stopProcessingStepLog()
-
-
-# ~ 1c ~
-# Identify new paternal identifiers
-#
-# Check all values in the column `belongsToFather` to make sure the ID
-# exists in the `subjectID` column.
-
-print2('Subjects: Identifying new paternal identifiers...')
-cosaslogs.startProcessingStepLog(
-  type='Filtering',
-  name='Identify new paternalIDs',
-  tablename='subjects'
-)
-
-belongsToFather = dt.Frame([
-  {
-    'subjectID': tuple[0],
-    'belongsToFamily': tuple[1],
-    'genderAtBirth': 'Man',
-    'comments': 'manually registered in COSAS'
-  }
-  for tuple in subjects[:, (f.belongsToFather, f.belongsToFamily)].to_tuples()
-  if not (tuple[0] is None) and not (tuple[0] in cosasSubjectIdList)
-])
-
-# log number of cases found
-print2('Subjects: Identified', belongsToFather.nrows, 'new maternal IDs')
-cosaslogs.currentStep['comment'] = f'New paternalIDs found: {belongsToFather.nrows}'
-cosaslogs.currentStep['status'] = 'Success'
-cosaslogs.stopProcessingStepLog()
-
-
-# ~ 1d ~
-# Combine all new subject identifiers
-#
-# Like the column `belongsWithFamilyMembers`, we will also check the columns
-# `belongsToMother` and `belongsToFather` to make sure all subjects are properly
-# registered in COSAS. The following code will also bind new family members so
-# that we can bind the data in one step.
-#
-print2('Subjects: combining all new subjects to register...')
-cosaslogs.startProcessingStepLog(
-  type='Aggregation',
-  name='Merge new parental IDs',
-  tablename='subjects'
-)
-
-# add `belongsWithFamilyMembers` if processed
-subjectsToRegister = dt.rbind(belongsToMother, belongsToFather, force=True)
-
-# log number of cases found
-print2('Subjects: Will register', subjectsToRegister.nrows, 'subjects')
-cosaslogs.currentStep['comment'] = f'Added {subjectsToRegister.nrows} rows'
-cosaslogs.currentStep['status'] = 'Success'
-cosaslogs.stopProcessingStepLog()
-
-# clean up
-del belongsToMother
-del belongsToFather
-
-# ~ 1e ~
-# Merge and format subject data
-#
-# In this step, we will create the table `umdm_subjects` using the objects
-# `subjects` and `subjectsToRegister`. Afterwards, several columns will need
-# to be recoded or formated for MOLGENIS.
-#
-# Bind `subjectsToRegister` with subjects so that all columns can be formated
-# at once. Make sure distinct cases are selected and the dataset is sorted by
-# ID.
-
-print2('Subjects: Binding subjects with new subjects...')
-cosaslogs.startProcessingStepLog(
-  type='Data Processing',
-  name='Combine all subjects',
-  tablename='subjects'
-)
-
-subjects = dt.rbind(subjects, subjectsToRegister, force=True)[
-  :, first(f[:]), dt.by(f.subjectID)
-][
-  :, :, dt.sort(as_type(f.subjectID, int))
-][f.subjectID != None, :]
-
-# log nrows
-cosaslogs.currentStep['comment'] = f'total subjects: {subjects.nrows}'
-cosaslogs.currentStep['status'] = 'Success' if subjects.nrows else 'Error'
-cosaslogs.stopProcessingStepLog()
-
-# transform variables
-cosaslogs.startProcessingStepLog(
-  type='Data Processing',
-  name='Transform columns',
-  tablename='subjects'
-)
-
-# Format `belongsWithFamilyMembers`: trimws, remove subject ID
-print2('Subjects: Formating linked Family IDs...')
-subjects['belongsWithFamilyMembers'] = dt.Frame([
-  collapseFamilyIDs(tuple[0], tuple[1])
-  for tuple in subjects[:, (f.belongsWithFamilyMembers, f.subjectID)].to_tuples()
-])
-
-# map gender values to `umdm_lookups_genderAtBirth`
-print2('Subjects: Recoding gender at birth...')
-subjects['genderAtBirth'] = dt.Frame([
-  recodeValue(mappings=genderMappings, value=value, label='genderAtBirth')
-  for value in subjects['genderAtBirth'].to_list()[0]
-])
-
-# format date columns to the correct format (yyyy-mm-dd)
-print2('Subjects: formating date attributes...')
-
-# format `dateOfBirth` as yyyy-mm-dd
-subjects['dateOfBirth'] = dt.Frame([
-  formatAsDate(date=date, pattern='%d-%m-%Y')
-  for date in subjects['dateOfBirth'].to_list()[0]
-])
-
-# format `yearOfBirth` as yyyy
-subjects['yearOfBirth'] = dt.Frame([
-  formatAsYear(date)
-  for date in subjects['dateOfBirth'].to_list()[0]
-])
-
-# format `dateOfDeath` as yyyy-mm-dd
-subjects['dateOfDeath'] = dt.Frame([
-  formatAsDate(date=date, pattern='%d-%m-%Y')
-  for date in subjects['dateOfDeath'].to_list()[0]
-])
-
-# format `yearOfDeath` as yyyy
-subjects['yearOfDeath'] = dt.Frame([
-  formatAsYear(date)
-  for date in subjects['dateOfDeath'].to_list()[0]
-])
-
-# using `dateOfDeath` set `subjectStatus`
-subjects['subjectStatus'] = dt.Frame([
-  'Dead' if bool(date) else None
-  for date in subjects['dateOfDeath'].to_list()[0]
-])
-
-# calcuate `ageAtDeath` if `dateOfDeath` is defined
-subjects['ageAtDeath'] = dt.Frame([
-  calcAge(earliest=tuple[0], recent=tuple[1])
-  for tuple in subjects[:, (f.dateOfBirth, f.dateOfDeath)].to_tuples()
-])
-
-# format dates as string now that age calcuations are complete. Otherwise, you
-# will get an error when the data is imported.
-subjects['dateOfBirth'] = dt.Frame([
-  str(date) if bool(date) else None
-  for date in subjects['dateOfBirth'].to_list()[0]
-])
-
-subjects['dateOfDeath'] = dt.Frame([
-  str(date) if bool(date) else None
-  for date in subjects['dateOfDeath'].to_list()[0]
-])
+@pipeline.stage(outputs=['subjects', 'cosasSubjectIdList'], tablename='subjects')
+def buildSubjects(raw_subjects, genderMappings, step):
+  """Build subjects
+  @param raw_subjects datatable object (`cosasportal_patients`)
+  @param genderMappings mappings for `genderAtBirth`
+  @param step log of the current processing step
+  @return tuple with the subjects and a list of the subject identifiers that
+    are in the export
+  """
+  print2('Subjects: building initial table structure...')
+
+  # pull variables of interest from portal table
+  subjects = raw_subjects[:, {
+    'subjectID': f.UMCG_NUMBER,
+    'belongsToFamily': f.FAMILIENUMMER,
+    'belongsToMother': f.UMCG_MOEDER,
+    'belongsToFather': f.UMCG_VADER,
+    'belongsWithFamilyMembers': f.FAMILIELEDEN,
+    'dateOfBirth': f.GEBOORTEDATUM,
+    'yearOfBirth': None,
+    'dateOfDeath': f.OVERLIJDENSDATUM,
+    'yearOfDeath': None,
+    'ageAtDeath': None,
+    'genderAtBirth': f.GESLACHT,
+    'ageAtDeath': None,
+    'primaryOrganization': 'UMCG'
+  }][:, :, dt.sort(as_type(f.subjectID, int))]
+
+  # create a list of unique subject identifiers --- very important!!!!
+  cosasSubjectIdList = dt.unique(subjects['subjectID']).to_list()[0]
+
+  # ~ 1b ~
+  # Identify new material identifiers
+  #
+  # In the subjects dataset, check all values in the the column
+  # `belongsToMother` to make sure the ID exists in the `subjectID` column.
+  # Rather than removing values from COSAS, unknown identifiers will be
+  # registered as new subjects.
+  print2('Subjects: Identifying new maternal identifiers...')
+  belongsToMother = dt.Frame([
+    {
+      'subjectID': tuple[0],
+      'belongsToFamily': tuple[1],
+      'genderAtBirth': 'Vrouw',
+      'comments': 'manually registered in COSAS'
+    }
+    for tuple in subjects[:, (f.belongsToMother, f.belongsToFamily)].to_tuples()
+    if not (tuple[0] is None) and not (tuple[0] in cosasSubjectIdList)
+  ])
+  print2('Subjects: found {} new maternal IDs'.format(belongsToMother.nrows))
+
+  # ~ 1c ~
+  # Identify new paternal identifiers
+  #
+  # Check all values in the column `belongsToFather` to make sure the ID
+  # exists in the `subjectID` column.
+  print2('Subjects: Identifying new paternal identifiers...')
+  belongsToFather = dt.Frame([
+    {
+      'subjectID': tuple[0],
+      'belongsToFamily': tuple[1],
+      'genderAtBirth': 'Man',
+      'comments': 'manually registered in COSAS'
+    }
+    for tuple in subjects[:, (f.belongsToFather, f.belongsToFamily)].to_tuples()
+    if not (tuple[0] is None) and not (tuple[0] in cosasSubjectIdList)
+  ])
+  print2('Subjects: Identified', belongsToFather.nrows, 'new paternal IDs')
+
+  # ~ 1d ~
+  # Combine all new subject identifiers
+  #
+  # Like the column `belongsWithFamilyMembers`, we will also check the columns
+  # `belongsToMother` and `belongsToFather` to make sure all subjects are
+  # properly registered in COSAS. The following code will also bind new family
+  # members so that we can bind the data in one step.
+  subjectsToRegister = dt.rbind(belongsToMother, belongsToFather, force=True)
+  print2('Subjects: Will register', subjectsToRegister.nrows, 'subjects')
+  step['comment'] = (
+    f'Initial subjects count: {subjects.nrows}; '
+    f'New maternalIDs found: {belongsToMother.nrows}; '
+    f'New paternalIDs found: {belongsToFather.nrows}'
+  )
 
-# track records and cleanup
-print2('Subjects: Mapped {} new records'.format(subjects.nrows))
-cosaslogs.currentStep['status'] = 'Success' if subjects.nrows else 'Error'
-cosaslogs.stopProcessingStepLog()
-del subjectsToRegister
+  # ~ 1e ~
+  # Merge and format subject data
+  #
+  # Bind `subjectsToRegister` with subjects so that all columns can be formated
+  # at once. Make sure distinct cases are selected and the dataset is sorted by
+  # ID. Afterwards, several columns will need to be recoded or formated for
+  # MOLGENIS.
+  print2('Subjects: Binding subjects with new subjects...')
+  subjects = dt.rbind(subjects, subjectsToRegister, force=True)[
+    :, first(f[:]), dt.by(f.subjectID)
+  ][
+    :, :, dt.sort(as_type(f.subjectID, int))
+  ][f.subjectID != None, :]
+
+  # Format `belongsWithFamilyMembers`: trimws, remove subject ID
+  print2('Subjects: Formating linked Family IDs...')
+  subjects['belongsWithFamilyMembers'] = dt.Frame([
+    collapseFamilyIDs(tuple[0], tuple[1])
+    for tuple in subjects[:, (f.belongsWithFamilyMembers, f.subjectID)].to_tuples()
+  ])
+
+  # map gender values to `umdm_lookups_genderAtBirth`
+  print2('Subjects: Recoding gender at birth...')
+  subjects['genderAtBirth'] = dt.Frame([
+    recodeValue(mappings=genderMappings, value=value, label='genderAtBirth')
+    for value in subjects['genderAtBirth'].to_list()[0]
+  ])
+
+  # format date columns to the correct format (yyyy-mm-dd)
+  print2('Subjects: formating date attributes...')
+
+  # format `dateOfBirth` as yyyy-mm-dd
+  subjects['dateOfBirth'] = dt.Frame([
+    formatAsDate(date=date, pattern='%d-%m-%Y')
+    for date in subjects['dateOfBirth'].to_list()[0]
+  ])
+
+  # format `yearOfBirth` as yyyy
+  subjects['yearOfBirth'] = dt.Frame([
+    formatAsYear(date)
+    for date in subjects['dateOfBirth'].to_list()[0]
+  ])
+
+  # format `dateOfDeath` as yyyy-mm-dd
+  subjects['dateOfDeath'] = dt.Frame([
+    formatAsDate(date=date, pattern='%d-%m-%Y')
+    for date in subjects['dateOfDeath'].to_list()[0]
+  ])
+
+  # format `yearOfDeath` as yyyy
+  subjects['yearOfDeath'] = dt.Frame([
+    formatAsYear(date)
+    for date in subjects['dateOfDeath'].to_list()[0]
+  ])
+
+  # using `dateOfDeath` set `subjectStatus`
+  subjects['subjectStatus'] = dt.Frame([
+    'Dead' if bool(date) else None
+    for date in subjects['dateOfDeath'].to_list()[0]
+  ])
+
+  # calcuate `ageAtDeath` if `dateOfDeath` is defined
+  subjects['ageAtDeath'] = dt.Frame([
+    calcAge(earliest=tuple[0], recent=tuple[1])
+    for tuple in subjects[:, (f.dateOfBirth, f.dateOfDeath)].to_tuples()
+  ])
+
+  # format dates as string now that age calcuations are complete. Otherwise,
+  # you will get an error when the data is imported.
+  subjects['dateOfBirth'] = dt.Frame([
+    str(date) if bool(date) else None
+    for date in subjects['dateOfBirth'].to_list()[0]
+  ])
+
+  subjects['dateOfDeath'] = dt.Frame([
+    str(date) if bool(date) else None
+    for date in subjects['dateOfDeath'].to_list()[0]
+  ])
+
+  print2('Subjects: Mapped {} new records'.format(subjects.nrows))
+  step['status'] = 'Success' if subjects.nrows else 'Error'
+  return subjects, cosasSubjectIdList
 
 # //////////////////////////////////////////////////////////////////////////////
 
 # ~ 2 ~
-# Build Phenotypic Data from workbench export
-#
-# This dataset provides historical records on observedPhenotypes for older cases.
-# This allows us to populate the COSAS Clinical table with extra information.
-
-print2('Clinical: mapping historical phenotypic data...')
-cosaslogs.startProcessingStepLog(
-  type='Data Processing',
-  name='Prepare phenotypic data',
-  tablename='clinical'
-)
-
-# Process data from external provider
-confirmedHpoDF = raw_benchcnv[:, {'clinicalID': f.subjectID, 'hpo': f.observedPhenotype}]
-confirmedHpoDF['keep'] = dt.Frame([
-  d in cosasSubjectIdList
-  for d in confirmedHpoDF['clinicalID'].to_list()[0]
-])
-
-confirmedHpoDF = confirmedHpoDF[f.keep == True, :]
-confirmedHpoDF.key = 'clinicalID'
-del confirmedHpoDF['keep']
-
-# save log
-print2('Clinical: prepped {} subjects'.format(confirmedHpoDF.nrows))
-cosaslogs.currentStep['comment'] = f'prepped phenotypic data for: {confirmedHpoDF.nrows} subjects'
-cosaslogs.currentStep['status'] = 'Success' if confirmedHpoDF.nrows else 'Error'
-cosaslogs.stopProcessingStepLog()
-
-# ~ 2a ~
 # Build COSAS Clinical Table
 #
 # Map data from the portal into the preferred structure of the harmonized
@@ -616,209 +633,188 @@ cosaslogs.stopProcessingStepLog()
 # Since we do not have a unique clinical diagnostic identifier, subjectID will
 # be used instead.
 
-print2('Clinical: building base structure...')
-cosaslogs.startProcessingStepLog(
-  type='Data Processing',
-  name='Build initial table structure',
-  tablename='clinical'
-)
-
-clinical = dt.rbind(
-  raw_clinical[:, {
-    'clinicalID': f.UMCG_NUMBER,
-    'belongsToSubject': f.UMCG_NUMBER,
-    'code': f.HOOFDDIAGNOSE,
-    'certainty': f.HOOFDDIAGNOSE_ZEKERHEID
-  }],
-  raw_clinical[:, {
-    'clinicalID': f.UMCG_NUMBER,
-    'belongsToSubject': f.UMCG_NUMBER,
-    'code': f.EXTRA_DIAGNOSE,
-    'certainty': f.EXTRA_DIAGNOSE_ZEKERHEID
-  }]
-)[(f.clinicalID != None) & (f.code != '-') & (f.code != None), :]
-
-cosaslogs.currentStep['comment'] = f'Initial structure has {clinical.nrows} rows'
-cosaslogs.currentStep['status'] = 'Success' if clinical.nrows else 'Error'
-cosaslogs.stopProcessingStepLog()
-
-# ~ 2b ~
-# Map CINEAS to HPO
-# Extract CINEAS code for string before mapping to HPO
-
-print2('Clinical: mapping CINEAS codes to HPO...')
-cosaslogs.startProcessingStepLog(
-  type='Data Processing',
-  name='Map CINEAS to HPO',
-  tablename='clinical'
-)
-
-clinical['code'] = dt.Frame([
-  code.split(':')[0] if code else None
-  for code in clinical['code'].to_list()[0]
-])
-
-clinical['hpo'] = dt.Frame([
-  recodeValue(mappings=cineasHpoMappings, value=code, label='Cineas-HPO', warn=False)
-  for code in clinical['code'].to_list()[0]
-])
-
-cosaslogs.stopProcessingStepLog()
-
-# ~ 2c ~
-# Process HPO codes based on certainty ratings
-# Certainty is used to determine which code is a provisional or an unobserved
-# phenotype code. Confirmed phenotype is only available in the Cartagenia
-# export.
-
-print2('Clinical: Formating certainty ratings and triaging HPO codes...')
-cosaslogs.startProcessingStepLog(
-  type='Data Processing',
-  name='Process codes based on certainty ratings',
-  tablename='clinical'
-)
-
-clinical['certainty'] = dt.Frame([
-  value.lower().replace(' ', '-') if (value != '-') and (value) else None
-  for value in clinical['certainty'].to_list()[0]
-])
-
-# create `observedPhenotype`
-clinical['observedPhenotype'] = dt.Frame([
-  tuple[0] if (tuple[1] == 'zeker') and tuple[0] else None
-  for tuple in clinical[:, (f.hpo, f.certainty)].to_tuples()
-])
-
-# create `provisionalPhenotype`: uncertain and missing
-provisionalCertaintyRatings = ['niet-zeker', 'onzeker', None]
-clinical['provisionalPhenotype'] = dt.Frame([
-  tuple[0] if (tuple[1] in provisionalCertaintyRatings) and (tuple[0]) else None
-  for tuple in clinical[:, (f.hpo, f.certainty)].to_tuples()
-])
-
-# create `excludedPhenotype`: zeker-niet
-clinical['unobservedPhenotype'] = dt.Frame([
-  tuple[0] if tuple[1] in ['zeker-niet'] else None
-  for tuple in clinical[:, (f.hpo, f.certainty)].to_tuples()
-])
-
-cosaslogs.stopProcessingStepLog()
-
-# ~ 2d ~
-# Collapse all phenotypic codes by subject
-#
-# Now that all codes have been identified and mapped to HPO, we can prepare
-# the dataset. The shape of the clinical dataset is: one row per subject
-# and all HPO codes collapsed into the correct phenotype column. Since we
-# aren't capturing phenotype by date (it isn't necessary for COSAS), all codes
-# need to be collapsed into a single string. The following function filters
-# the dataset for by subject, pulls all HPO codes, and collapses the values
-# into a string.
-
-print2('Clinical: collapsing HPO columns...')
-cosaslogs.startProcessingStepLog(
-  type='Data Processing',
-  name='Collapsing HPO codes by subject',
-  tablename='clinical'
-)
-
-# collapse observedPhenotype codes by ID
-subjectObservedPhenotype = uniqueValuesById(
-  data = clinical[f.observedPhenotype!=None, (f.clinicalID, f.observedPhenotype)],
-  groupby = 'clinicalID',
-  column = 'observedPhenotype'
-)
-
-# collapse unobservedPhenotype codes by ID
-subjectUnobservedPhenotype = uniqueValuesById(
-  data = clinical[f.unobservedPhenotype!=None, (f.clinicalID, f.unobservedPhenotype)],
-  groupby = 'clinicalID',
-  column = 'unobservedPhenotype'
-)
-
-# collapse provisionalPhenotype codes by ID
-subjectProvisionalPhenotype = uniqueValuesById(
-  data = clinical[f.provisionalPhenotype!=None, (f.clinicalID, f.provisionalPhenotype)],
-  groupby = 'clinicalID',
-  column = 'provisionalPhenotype'
-)
-
-# update log
-cosaslogs.stopProcessingStepLog()
-
-# ~ 2e ~
-# Finalize data
-#
-# Now that the clinical dataset is prepped and all codes have been collapsed
-# by subject ID, merge HPO data and select distinct rows. Make sure all
-# subject IDs in the clinical table exist in the subjects dataset.
-
-print2('Clinical: Selecting distinct rows and merging HPO data...')
-cosaslogs.startProcessingStepLog(
-  type='Data Processing',
-  name='Merging summarized HPO objects',
-  tablename='clinical'
-)
-
-# select distinct rows
-clinicalDT = clinical[:, first(f[1:]), dt.by(f.clinicalID)][:,(f.clinicalID, f.belongsToSubject)]
-
-# join HPO data
-clinicalDT.key = 'clinicalID'
-subjectObservedPhenotype.key = 'clinicalID'
-subjectUnobservedPhenotype.key = 'clinicalID'
-subjectProvisionalPhenotype.key = 'clinicalID'
-
-clinicalDT = clinicalDT[:, :, dt.join(subjectObservedPhenotype)]
-clinicalDT = clinicalDT[:, :, dt.join(subjectUnobservedPhenotype)]
-clinicalDT = clinicalDT[:, :, dt.join(subjectProvisionalPhenotype)]
-clinicalDT = clinicalDT[:, :, dt.join(confirmedHpoDF)][
-  :, :, dt.sort(as_type(f.clinicalID, int))
-]
-
-# collapse observedPhenotype and Cartagenia HPO codes  
-clinicalDT['observedPhenotype'] = dt.Frame([
-  collapseHpoColumns(tuple[0], tuple[1])
-  for tuple in clinicalDT[:,(f.observedPhenotype, f.hpo)].to_tuples()
-])
-del clinicalDT['hpo']
-
-# Check IDs: Make sure all IDs in the clinical dataset exist in subjects
-clinicalDT['idExists'] = dt.Frame([
-  id in cosasSubjectIdList for id in clinicalDT['belongsToSubject'].to_list()[0]
-])
-
-# remove rows that do not have any data (i.e., only clincialID and subjectID)
-clinicalDT['rowsToRemove'] = dt.Frame([
-  ((tuple[0] == None) | (tuple[0] == '')) & (tuple[1] == None) & (tuple[2] == None)
-  for tuple in clinicalDT[:,
-    (f.observedPhenotype, f.unobservedPhenotype, f.provisionalPhenotype)
-  ].to_tuples()
-])
-
-clinicalDT = clinicalDT[f.rowsToRemove == False, :]
-
+@pipeline.stage(outputs='clinicalDT', tablename='clinical')
+def buildClinical(raw_clinical, raw_benchcnv, cineasHpoMappings, cosasSubjectIdList, step):
+  """Build clinical
+  @param raw_clinical datatable object (`cosasportal_diagnoses`)
+  @param raw_benchcnv datatable object (`cosasportal_cartagenia`)
+  @param cineasHpoMappings mappings of CINEAS codes to HPO
+  @param cosasSubjectIdList list of known subject identifiers
+  @param step log of the current processing step
+  @return datatable object
+  """
 
-# If there are unknown IDs, remove and log counts
-if clinicalDT[f.idExists == False, :].nrows > 0:
-  print2(
-    'Clinical: ERROR Excepted 0 flagged cases, but found',
-    clinicalDT[f.idExists == False, :].nrows
-  )
-  cosaslogs.currentStep['comment'] = 'Rows removed {}'.format(
-    cosaslogs.currentStep['comment'],
-    clinicalDT[f.idExists == False, :].nrows
+  # ~ 2a ~
+  # Build Phenotypic Data from workbench export
+  #
+  # This dataset provides historical records on observedPhenotypes for older
+  # cases. This allows us to populate the COSAS Clinical table with extra
+  # information.
+  print2('Clinical: mapping historical phenotypic data...')
+  confirmedHpoDF = raw_benchcnv[:, {'clinicalID': f.subjectID, 'hpo': f.observedPhenotype}]
+  confirmedHpoDF['keep'] = dt.Frame([
+    d in cosasSubjectIdList
+    for d in confirmedHpoDF['clinicalID'].to_list()[0]
+  ])
+
+  confirmedHpoDF = confirmedHpoDF[f.keep == True, :]
+  confirmedHpoDF.key = 'clinicalID'
+  del confirmedHpoDF['keep']
+  print2('Clinical: prepped {} subjects'.format(confirmedHpoDF.nrows))
+
+  # build base structure
+  print2('Clinical: building base structure...')
+  clinical = wideToLong(
+    data = raw_clinical,
+    groups = {
+      'HOOFDDIAGNOSE': {
+        'code': 'HOOFDDIAGNOSE',
+        'certainty': 'HOOFDDIAGNOSE_ZEKERHEID'
+      },
+      'EXTRA_DIAGNOSE': {
+        'code': 'EXTRA_DIAGNOSE',
+        'certainty': 'EXTRA_DIAGNOSE_ZEKERHEID'
+      }
+    },
+    idColumns = {'clinicalID': 'UMCG_NUMBER', 'belongsToSubject': 'UMCG_NUMBER'}
+  )[(f.clinicalID != None) & (f.code != '-') & (f.code != None), :]
+
+  # ~ 2b ~
+  # Map CINEAS to HPO
+  # Extract CINEAS code for string before mapping to HPO
+  print2('Clinical: mapping CINEAS codes to HPO...')
+  clinical['code'] = dt.Frame([
+    code.split(':')[0] if code else None
+    for code in clinical['code'].to_list()[0]
+  ])
+
+  clinical['hpo'] = dt.Frame([
+    recodeValue(mappings=cineasHpoMappings, value=code, label='Cineas-HPO', warn=False)
+    for code in clinical['code'].to_list()[0]
+  ])
+
+  # ~ 2c ~
+  # Process HPO codes based on certainty ratings
+  # Certainty is used to determine which code is a provisional or an unobserved
+  # phenotype code. Confirmed phenotype is only available in the Cartagenia
+  # export.
+  print2('Clinical: Formating certainty ratings and triaging HPO codes...')
+  clinical['certainty'] = dt.Frame([
+    value.lower().replace(' ', '-') if (value != '-') and (value) else None
+    for value in clinical['certainty'].to_list()[0]
+  ])
+
+  # create `observedPhenotype`
+  clinical['observedPhenotype'] = dt.Frame([
+    tuple[0] if (tuple[1] == 'zeker') and tuple[0] else None
+    for tuple in clinical[:, (f.hpo, f.certainty)].to_tuples()
+  ])
+
+  # create `provisionalPhenotype`: uncertain and missing
+  provisionalCertaintyRatings = ['niet-zeker', 'onzeker', None]
+  clinical['provisionalPhenotype'] = dt.Frame([
+    tuple[0] if (tuple[1] in provisionalCertaintyRatings) and (tuple[0]) else None
+    for tuple in clinical[:, (f.hpo, f.certainty)].to_tuples()
+  ])
+
+  # create `excludedPhenotype`: zeker-niet
+  clinical['unobservedPhenotype'] = dt.Frame([
+    tuple[0] if tuple[1] in ['zeker-niet'] else None
+    for tuple in clinical[:, (f.hpo, f.certainty)].to_tuples()
+  ])
+
+  # ~ 2d ~
+  # Collapse all phenotypic codes by subject
+  #
+  # Now that all codes have been identified and mapped to HPO, we can prepare
+  # the dataset. The shape of the clinical dataset is: one row per subject
+  # and all HPO codes collapsed into the correct phenotype column. Since we
+  # aren't capturing phenotype by date (it isn't necessary for COSAS), all
+  # codes need to be collapsed into a single string.
+  print2('Clinical: collapsing HPO columns...')
+
+  # collapse observedPhenotype codes by ID
+  subjectObservedPhenotype = uniqueValuesById(
+    data = clinical[f.observedPhenotype!=None, (f.clinicalID, f.observedPhenotype)],
+    groupby = 'clinicalID',
+    column = 'observedPhenotype'
   )
-  clinicalDT = clinicalDT[f.idExists, :]
 
+  # collapse unobservedPhenotype codes by ID
+  subjectUnobservedPhenotype = uniqueValuesById(
+    data = clinical[f.unobservedPhenotype!=None, (f.clinicalID, f.unobservedPhenotype)],
+    groupby = 'clinicalID',
+    column = 'unobservedPhenotype'
+  )
 
-print2('Clinical: processed {} new records'.format(clinicalDT.nrows))
-cosaslogs.currentStep['status'] = 'Success' if clinicalDT.nrows else 'Error'
+  # collapse provisionalPhenotype codes by ID
+  subjectProvisionalPhenotype = uniqueValuesById(
+    data = clinical[f.provisionalPhenotype!=None, (f.clinicalID, f.provisionalPhenotype)],
+    groupby = 'clinicalID',
+    column = 'provisionalPhenotype'
+  )
 
-del clinicalDT['idExists']
-del confirmedHpoDF
+  # ~ 2e ~
+  # Finalize data
+  #
+  # Now that the clinical dataset is prepped and all codes have been collapsed
+  # by subject ID, merge HPO data and select distinct rows. Make sure all
+  # subject IDs in the clinical table exist in the subjects dataset.
+  print2('Clinical: Selecting distinct rows and merging HPO data...')
+
+  # select distinct rows
+  clinicalDT = clinical[:, first(f[1:]), dt.by(f.clinicalID)][:,(f.clinicalID, f.belongsToSubject)]
+
+  # join HPO data
+  clinicalDT.key = 'clinicalID'
+  subjectObservedPhenotype.key = 'clinicalID'
+  subjectUnobservedPhenotype.key = 'clinicalID'
+  subjectProvisionalPhenotype.key = 'clinicalID'
+
+  clinicalDT = clinicalDT[:, :, dt.join(subjectObservedPhenotype)]
+  clinicalDT = clinicalDT[:, :, dt.join(subjectUnobservedPhenotype)]
+  clinicalDT = clinicalDT[:, :, dt.join(subjectProvisionalPhenotype)]
+  clinicalDT = clinicalDT[:, :, dt.join(confirmedHpoDF)][
+    :, :, dt.sort(as_type(f.clinicalID, int))
+  ]
 
-cosaslogs.stopProcessingStepLog()
+  # collapse observedPhenotype and Cartagenia HPO codes
+  clinicalDT['observedPhenotype'] = dt.Frame([
+    collapseHpoColumns(tuple[0], tuple[1])
+    for tuple in clinicalDT[:,(f.observedPhenotype, f.hpo)].to_tuples()
+  ])
+  del clinicalDT['hpo']
+
+  # Check IDs: Make sure all IDs in the clinical dataset exist in subjects
+  clinicalDT['idExists'] = dt.Frame([
+    id in cosasSubjectIdList for id in clinicalDT['belongsToSubject'].to_list()[0]
+  ])
+
+  # remove rows that do not have any data (i.e., only clincialID and subjectID)
+  clinicalDT['rowsToRemove'] = dt.Frame([
+    ((tuple[0] == None) | (tuple[0] == '')) & (tuple[1] == None) & (tuple[2] == None)
+    for tuple in clinicalDT[:,
+      (f.observedPhenotype, f.unobservedPhenotype, f.provisionalPhenotype)
+    ].to_tuples()
+  ])
+
+  clinicalDT = clinicalDT[f.rowsToRemove == False, :]
+
+  # If there are unknown IDs, remove and log counts
+  if clinicalDT[f.idExists == False, :].nrows > 0:
+    print2(
+      'Clinical: ERROR Excepted 0 flagged cases, but found',
+      clinicalDT[f.idExists == False, :].nrows
+    )
+    step['comment'] = 'Rows removed {}'.format(
+      clinicalDT[f.idExists == False, :].nrows
+    )
+    clinicalDT = clinicalDT[f.idExists, :]
+
+  print2('Clinical: processed {} new records'.format(clinicalDT.nrows))
+  step['status'] = 'Success' if clinicalDT.nrows else 'Error'
+  del clinicalDT['idExists']
+  return clinicalDT
 
 # //////////////////////////////////////////////////////////////////////////////
 
@@ -833,87 +829,72 @@ cosaslogs.stopProcessingStepLog()
 # into Molgenis.
 #
 
-# ~ 3a ~
-# Build initial table structure
-#
-# Pull columns of interest and pull unique rows as we aren't interested in
-# keeping request IDs, dates, etc. If this information is needed, you will
-# need to adjust this step.
-print2('Samples: building base structure...')
-cosaslogs.startProcessingStepLog(
-  type='Data Processing',
-  name='Build initial table structure',
-  tablename='samples'
-)
-
-# Pull attributes of interest
-# Add: 'belongsToRequest': f.ADVVRG_ID (if needed again)
-samples = raw_samples[:, {
-  'sampleID': f.DNA_NUMMER,
-  'belongsToSubject': f.UMCG_NUMMER,
-  'biospecimenType': f.MATERIAAL
-}]
-
-# pull unique rows only since codes were duplicated
-samples = samples[:, first(f[:]), dt.by(f.sampleID)][
-  :, :, dt.sort(as_type(f.belongsToSubject, int))
-]
-
-cosaslogs.currentStep['comment'] = f'Samples row count: {samples.nrows}'
-cosaslogs.currentStep['status'] = 'Success' if samples.nrows else 'Error'
-cosaslogs.stopProcessingStepLog()
-
-# ~ 3b ~
-# Transform Columns
-#
-# Transform and recode columns that require it. Add additional transformations
-# here. If you need additional mapping tables, consider putting the mapping
-# dataset in the 'cosasmappings' package and importing the data in step 0.
-
-cosaslogs.startProcessingStepLog(
-  type='Data Processing',
-  name='Transform columns',
-  tablename='samples'
-)
-
-samples['biospecimenType'] = dt.Frame([
-  recodeValue(
-    mappings=biospecimenTypeMappings,
-    value=d.lower(),
-    label='biospecimenType'
-  )
-  for d in samples['biospecimenType'].to_list()[0]
-])
-
-cosaslogs.stopProcessingStepLog()
-
-# ~ 3b ~
-# Finalize dataset
-#
-# Make sure all IDs in the samples table exist in other tables. If an ID does
-# not exist, remove it and log counts.
-
-print2('Samples: Validating subject IDs in the samples dataset...')
-cosaslogs.startProcessingStepLog(
-  type='Filtering',
-  name='Filtering data',
-  tablename='samples'
-)
-
-samples['idExists'] = dt.Frame([
-  id in cosasSubjectIdList for id in samples['belongsToSubject'].to_list()[0]
-])
+@pipeline.stage(outputs='samples', tablename='samples')
+def buildSamples(raw_samples, biospecimenTypeMappings, cosasSubjectIdList, step):
+  """Build samples
+  @param raw_samples datatable object (`cosasportal_samples`)
+  @param biospecimenTypeMappings mappings for `biospecimenType`
+  @param cosasSubjectIdList list of known subject identifiers
+  @param step log of the current processing step
+  @return datatable object
+  """
 
-if samples[f.idExists == False, :].nrows > 0:
-  samples = samples[f.idExists, :]
-  print2('Samples: ERROR excepted 0 flagged cases, but found ',samples.nrows)
-  cosaslogs.currentStep['comment'] = f'Rows removed {samples.nrows}'
+  # ~ 3a ~
+  # Build initial table structure
+  #
+  # Pull columns of interest and pull unique rows as we aren't interested in
+  # keeping request IDs, dates, etc. If this information is needed, you will
+  # need to adjust this step.
+  print2('Samples: building base structure...')
+
+  # Pull attributes of interest
+  # Add: 'belongsToRequest': f.ADVVRG_ID (if needed again)
+  samples = raw_samples[:, {
+    'sampleID': f.DNA_NUMMER,
+    'belongsToSubject': f.UMCG_NUMMER,
+    'biospecimenType': f.MATERIAAL
+  }]
 
-print2('Samples: processed {} new records'.format(samples.nrows))
-cosaslogs.currentStep['status'] = 'Success' if samples.nrows else 'Error'
-del samples['idExists']
+  # pull unique rows only since codes were duplicated
+  samples = samples[:, first(f[:]), dt.by(f.sampleID)][
+    :, :, dt.sort(as_type(f.belongsToSubject, int))
+  ]
 
-cosaslogs.stopProcessingStepLog()
+  # ~ 3b ~
+  # Transform Columns
+  #
+  # Transform and recode columns that require it. Add additional
+  # transformations here. If you need additional mapping tables, consider
+  # putting the mapping dataset in the 'cosasmappings' package and importing
+  # the data in step 0.
+  samples['biospecimenType'] = dt.Frame([
+    recodeValue(
+      mappings=biospecimenTypeMappings,
+      value=d.lower(),
+      label='biospecimenType'
+    )
+    for d in samples['biospecimenType'].to_list()[0]
+  ])
+
+  # ~ 3c ~
+  # Finalize dataset
+  #
+  # Make sure all IDs in the samples table exist in other tables. If an ID does
+  # not exist, remove it and log counts.
+  print2('Samples: Validating subject IDs in the samples dataset...')
+  samples['idExists'] = dt.Frame([
+    id in cosasSubjectIdList for id in samples['belongsToSubject'].to_list()[0]
+  ])
+
+  if samples[f.idExists == False, :].nrows > 0:
+    samples = samples[f.idExists, :]
+    print2('Samples: ERROR excepted 0 flagged cases, but found ',samples.nrows)
+    step['comment'] = f'Rows removed {samples.nrows}'
+
+  print2('Samples: processed {} new records'.format(samples.nrows))
+  step['status'] = 'Success' if samples.nrows else 'Error'
+  del samples['idExists']
+  return samples
 
 # //////////////////////////////////////////////////////////////////////////////
 
@@ -929,80 +910,80 @@ cosaslogs.stopProcessingStepLog()
 #
 
 # ~ 4a ~
-# Build Array Adlas dataset
+# Build Array dataset
 # Pull the required columns from the array-adlas dataset. The following
 # will further reduce the dataset by distinct rows only. This object will
-# be joined with the object defined in the next step.
-
-print2('SamplePrep & Sequencing: building array dataset...')
-cosaslogs.startProcessingStepLog(
-  type='Data Processing',
-  name='Build array dataset',
-  tablename='samples-sampleprep-seq'
-)
-
-# ~ 4a.i ~
-# Build array-aldas data
-print2('SamplePrep & Sequencing: processing array-aldas data...')
-array_adlas = raw_array_adlas[:, {
-    'belongsToSubject': f.UMCG_NUMBER,
-    'belongsToRequest': f.ADVVRG_ID,
-    'sampleID': f.DNA_NUMMER,
-    'belongsToSamplePreparation': f.DNA_NUMMER,
-    'belongsToLabProcedure': f.TEST_CODE
-  }
-][
-  :, first(f[:]),  # returns distinct records
-  dt.by(
-    f.belongsToSubject,
-    f.belongsToRequest,
-    f.sampleID,
-    f.belongsToLabProcedure
-  )
-][
-  :,
-  (
-    f.belongsToSubject,
-    f.belongsToRequest,
-    f.sampleID,
-    f.belongsToLabProcedure
-  ),
-  dt.sort(as_type(f.belongsToSubject, int))
-]
-
-# ~ 4a.ii ~
-# Build array-darwin data
-print2('SamplePrep & Sequencing: processing array-darwin data...')
-array_darwin = raw_array_darwin[:, {
-    'belongsToSubject': f.UmcgNr,
-    'belongsToLabProcedure': f.TestId,  # codes are written into ID
-    'sequencingDate': f.TestDatum,  # recode date
-    'reasonForSequencing': f.Indicatie,  # format lab indication
-    'sequencingMethod': None,
-}][
-  # get distinct rows only
-  :, first(f[:]), dt.by(f.belongsToSubject, f.belongsToLabProcedure)
-][:, (
-    f.belongsToSubject,
-    f.belongsToLabProcedure,
-    f.sequencingDate,
-    f.reasonForSequencing
-  ),
-  dt.sort(as_type(f.belongsToSubject, int))
-]
+# be joined with the array-darwin data.
+
+@pipeline.stage(outputs='arrayData', tablename='samples-sampleprep-seq')
+def buildArrayData(raw_array_adlas, raw_array_darwin, step):
+  """Build array dataset
+  @param raw_array_adlas datatable object (`cosasportal_labs_array_adlas`)
+  @param raw_array_darwin datatable object (`cosasportal_labs_array_darwin`)
+  @param step log of the current processing step
+  @return datatable object
+  """
+  print2('SamplePrep & Sequencing: building array dataset...')
+
+  # ~ 4a.i ~
+  # Build array-aldas data
+  print2('SamplePrep & Sequencing: processing array-aldas data...')
+  array_adlas = raw_array_adlas[:, {
+      'belongsToSubject': f.UMCG_NUMBER,
+      'belongsToRequest': f.ADVVRG_ID,
+      'sampleID': f.DNA_NUMMER,
+      'belongsToSamplePreparation': f.DNA_NUMMER,
+      'belongsToLabProcedure': f.TEST_CODE
+    }
+  ][
+    :, first(f[:]),  # returns distinct records
+    dt.by(
+      f.belongsToSubject,
+      f.belongsToRequest,
+      f.sampleID,
+      f.belongsToLabProcedure
+    )
+  ][
+    :,
+    (
+      f.belongsToSubject,
+      f.belongsToRequest,
+      f.sampleID,
+      f.belongsToLabProcedure
+    ),
+    dt.sort(as_type(f.belongsToSubject, int))
+  ]
 
-# ~ 4a.iii ~
-# Create full arrayData object
-print2('SamplePrep & Sequencing: joining array objects...')
-array_darwin.key = ['belongsToSubject', 'belongsToLabProcedure']
-arrayData = array_adlas[:, :, dt.join(array_darwin)]
+  # ~ 4a.ii ~
+  # Build array-darwin data
+  print2('SamplePrep & Sequencing: processing array-darwin data...')
+  array_darwin = raw_array_darwin[:, {
+      'belongsToSubject': f.UmcgNr,
+      'belongsToLabProcedure': f.TestId,  # codes are written into ID
+      'sequencingDate': f.TestDatum,  # recode date
+      'reasonForSequencing': f.Indicatie,  # format lab indication
+      'sequencingMethod': None,
+  }][
+    # get distinct rows only
+    :, first(f[:]), dt.by(f.belongsToSubject, f.belongsToLabProcedure)
+  ][:, (
+      f.belongsToSubject,
+      f.belongsToLabProcedure,
+      f.sequencingDate,
+      f.reasonForSequencing
+    ),
+    dt.sort(as_type(f.belongsToSubject, int))
+  ]
 
-# save logs
-cosaslogs.currentStep['comment'] = f'Row count for array data: {arrayData.nrows}'
-cosaslogs.currentStep['status'] = 'Success' if arrayData.nrows else 'Error'
-cosaslogs.stopProcessingStepLog()
+  # ~ 4a.iii ~
+  # Create full arrayData object
+  print2('SamplePrep & Sequencing: joining array objects...')
+  array_darwin.key = ['belongsToSubject', 'belongsToLabProcedure']
+  arrayData = array_adlas[:, :, dt.join(array_darwin)]
 
-del array_darwin, array_adlas
+  step['comment'] = f'Row count for array data: {arrayData.nrows}'
+  step['status'] = 'Success' if arrayData.nrows else 'Error'
+  return arrayData
 
 # ~ 4b ~
 # Build NGS Dataset
@@ -1012,71 +993,71 @@ del array_darwin, array_adlas
 # The NGS and Adlas dataset will be merged to create the main dataset that
 # will be used create teh sampleprep and sequencing tables.
 
-print2('SamplePrep & Sequencing: building NGS dataset...')
-cosaslogs.startProcessingStepLog(
-  type='Data Processing',
-  name='Build NGS dataset',
-  tablename='samples-sampleprep-seq'
-)
-
-# ~ 4b.i ~
-# Process ngs-aldas data
-print2('SamplePrep & Sequencing: processing ngs-adlas data...')
-ngs_adlas = raw_ngs_adlas[:, {
-    'belongsToSubject': f.UMCG_NUMBER,
-    'belongsToRequest': f.ADVVRG_ID,
-    'sampleID': f.DNA_NUMMER,
-    'belongsToSamplePreparation': f.DNA_NUMMER,
-    'belongsToLabProcedure': f.TEST_CODE
-}][
-  :, first(f[:]),
-  dt.by(
-    f.belongsToSubject,
-    f.belongsToRequest,
-    f.sampleID,
-    f.belongsToLabProcedure
-  )
-][
-  :, (
-    f.belongsToSubject,
-    f.belongsToRequest,
-    f.sampleID,
-    f.belongsToLabProcedure
-  ),
-  dt.sort(as_type(f.belongsToSubject, int))
-]
-
-# ~ 4b.ii ~
-# reshape: NGS data from Darwin
-print2('SamplePrep & Sequencing: processing ngs-darwin data...')
-ngs_darwin = raw_ngs_darwin[:, {
-  'belongsToSubject': f.UmcgNr,
-  'belongsToLabProcedure': f.TestId,
-  'sequencingDate': f.TestDatum,
-  'reasonForSequencing': f.Indicatie,
-  'sequencingPlatform': f.Sequencer,
-  'sequencingInstrumentModel': f.Sequencer,
-  'sequencingMethod': None,
-  'belongsToBatch': f.BatchNaam,
-  'referenceGenomeUsed': f.GenomeBuild
-}][
-  :, first(f[:]), dt.by(f.belongsToSubject, f.belongsToLabProcedure)
-][
-  :, :, dt.sort(as_type(f.belongsToSubject, int))
-]
+@pipeline.stage(outputs='ngsData', tablename='samples-sampleprep-seq')
+def buildNgsData(raw_ngs_adlas, raw_ngs_darwin, step):
+  """Build NGS dataset
+  @param raw_ngs_adlas datatable object (`cosasportal_labs_ngs_adlas`)
+  @param raw_ngs_darwin datatable object (`cosasportal_labs_ngs_darwin`)
+  @param step log of the current processing step
+  @return datatable object
+  """
+  print2('SamplePrep & Sequencing: building NGS dataset...')
+
+  # ~ 4b.i ~
+  # Process ngs-aldas data
+  print2('SamplePrep & Sequencing: processing ngs-adlas data...')
+  ngs_adlas = raw_ngs_adlas[:, {
+      'belongsToSubject': f.UMCG_NUMBER,
+      'belongsToRequest': f.ADVVRG_ID,
+      'sampleID': f.DNA_NUMMER,
+      'belongsToSamplePreparation': f.DNA_NUMMER,
+      'belongsToLabProcedure': f.TEST_CODE
+  }][
+    :, first(f[:]),
+    dt.by(
+      f.belongsToSubject,
+      f.belongsToRequest,
+      f.sampleID,
+      f.belongsToLabProcedure
+    )
+  ][
+    :, (
+      f.belongsToSubject,
+      f.belongsToRequest,
+      f.sampleID,
+      f.belongsToLabProcedure
+    ),
+    dt.sort(as_type(f.belongsToSubject, int))
+  ]
 
-# ~ 4b.iii ~
-# Create ngsData
-print2('SamplePrep & Sequencing: merging ngs data...')
-ngs_darwin.key = ['belongsToSubject', 'belongsToLabProcedure']
-ngsData = ngs_adlas[:, :, dt.join(ngs_darwin)]
+  # ~ 4b.ii ~
+  # reshape: NGS data from Darwin
+  print2('SamplePrep & Sequencing: processing ngs-darwin data...')
+  ngs_darwin = raw_ngs_darwin[:, {
+    'belongsToSubject': f.UmcgNr,
+    'belongsToLabProcedure': f.TestId,
+    'sequencingDate': f.TestDatum,
+    'reasonForSequencing': f.Indicatie,
+    'sequencingPlatform': f.Sequencer,
+    'sequencingInstrumentModel': f.Sequencer,
+    'sequencingMethod': None,
+    'belongsToBatch': f.BatchNaam,
+    'referenceGenomeUsed': f.GenomeBuild
+  }][
+    :, first(f[:]), dt.by(f.belongsToSubject, f.belongsToLabProcedure)
+  ][
+    :, :, dt.sort(as_type(f.belongsToSubject, int))
+  ]
 
-# save logs
-cosaslogs.currentStep['comment'] = f'Row count for array data: {ngsData.nrows}'
-cosaslogs.currentStep['status'] = 'Success' if ngsData.nrows else 'Error'
-cosaslogs.stopProcessingStepLog()
+  # ~ 4b.iii ~
+  # Create ngsData
+  print2('SamplePrep & Sequencing: merging ngs data...')
+  ngs_darwin.key = ['belongsToSubject', 'belongsToLabProcedure']
+  ngsData = ngs_adlas[:, :, dt.join(ngs_darwin)]
 
-del ngs_darwin, ngs_adlas
+  step['comment'] = f'Row count for NGS data: {ngsData.nrows}'
+  step['status'] = 'Success' if ngsData.nrows else 'Error'
+  return ngsData
 
 # ~ 4c ~
 # Create main sample-labs dataset
@@ -1091,147 +1072,139 @@ del ngs_darwin, ngs_adlas
 #   - This step also removes unknown samples, i.e. samples that aren't
 #       listed in the `samples` table.
 
-print2('SamplePrep & Sequencing: merging ngs and array datasets...')
-cosaslogs.startProcessingStepLog(
-  type='Data Processing',
-  name='Combine Array and NGS data',
-  tablename='samples-sampleprep-seq'
-)
-
-sampleSequencingData = dt.rbind(arrayData, ngsData, force=True)
-
-# duplicate IDs for later
-sampleSequencingData[:, dt.update(
-  belongsToSample=f.sampleID,
-  belongsToSamplePreparation=f.sampleID
-)]
-
-del arrayData, ngsData
-
-# save row count before filtering
-cosaslogs.currentStep['status'] = 'Success' if sampleSequencingData.nrows else 'Error'
-cosaslogs.stopProcessingStepLog()
-
-# ~ 4c.ii ~
-# Filter dataset for known samples
-#
-# Remove entries that aren't registered in samples table. It isn't clear why a
-# sample appears in the darwin data and not the adlas dataset. It is possible
-# that some of the samples aren't authorized, or were never authorized, by the
-# lab.
-
-print2('SamplePrep & Sequencing: filtering data for known samples...')
-cosaslogs.startProcessingStepLog(
-  type='Filtering',
-  name='Filtering data',
-  tablename='samples-sampleprep-seq'
-)
-
-registeredSamples = dt.unique(samples['sampleID']).to_list()[0]
-sampleSequencingData['idExists'] = dt.Frame([
-  id in registeredSamples
-  for id in sampleSequencingData['belongsToSample'].to_list()[0]
-])
-
-if sampleSequencingData[f.idExists == False, :].nrows > 0:
-  print2(
-    "SamplePrep & Sequencing: WARNING removing",
-    sampleSequencingData[f.idExists == False, :].nrows,
-    "records where the ID does not exist"
-  )
-  cosaslogs.currentStep['comment'] = 'Rows removed {}'.format(
-    sampleSequencingData[f.idExists == False, :].nrows
-  )
-  sampleSequencingData = sampleSequencingData[f.idExists, :]
-
-# log new row count
-cosaslogs.currentStep['status'] = 'Success' if sampleSequencingData.nrows else 'Error'
-cosaslogs.stopProcessingStepLog()
-
-# ~ 4c.iii ~
-# Prepare data
-#
-# Apply additional transformations and any recoding. In order to make
-# each sample 'unique' the row identifier is a concatenation of multiple IDs.
-# These are: sampleID + requestID + labProcedure. At some point, we may want
-# to change this format
-
-print2('SamplePrep & Sequencing: Setting unqiue identifiers (primary key)...')
-cosaslogs.startProcessingStepLog(
-  type='Data Processing',
-  name='Transform columns',
-  tablename='samples-sampleprep-seq'
-)
-
-# create unique identifier: sampleID + request + belongsToLabProcedure (i.e., test code)
-# create IDs for multiple tables
-sampleSequencingData[['belongsToSamplePreparation', 'sequencingID']] = dt.Frame([
-  f'{tuple[0]}_{tuple[1]}_{tuple[2]}'
-  for tuple in sampleSequencingData[
-    :, (f.belongsToSample, f.belongsToRequest, f.belongsToLabProcedure)
-  ].to_tuples()
-])
-
-# format `sequencingDate` as yyyy-mm-dd
-print2('SamplePrep & Sequencing: Formatting sequencing date...')
-sampleSequencingData['sequencingDate'] = dt.Frame([
-  formatAsDate(
-    date=date,
-    pattern='%d-%m-%Y %H:%M:%S',
-    asString=True
-  )
-  for date in sampleSequencingData['sequencingDate'].to_list()[0]
-])
-
-# format `labIndication`: use urdm_lookups_samplingReason
-print2('SamplePrep & Sequencing: recoding "reason for sequencing"...')
-sampleSequencingData['reasonForSequencing'] = dt.Frame([
-  recodeValue(
-    mappings=sampleReasonMappings,
-    value=value.lower(),
-    label='reasonForSequencing'
-  ) if bool(value) else None
-  for value in sampleSequencingData['reasonForSequencing'].to_list()[0]
-])
-
-# set facility (links with umdm_organizations)
-sampleSequencingData['sequencingFacilityOrganization'] = 'UMCG'
-
-# recode `sequencingPlatform`
-print2('SamplePrep & Sequencing: recoding sequencing platform...')
-sampleSequencingData['sequencingPlatform'] = dt.Frame([
-  recodeValue(
-    mappings=sequencerPlatformMappings,
-    value=value,
-    label='sequencingPlatform'
-  )
-  for value in sampleSequencingData['sequencingPlatform'].to_list()[0]
-])
-
-# recode `sequencingInstrumentModel`
-print2('SamplePrep & Sequencing: recoding sequencing instrument model...')
-sampleSequencingData['sequencingInstrumentModel'] = dt.Frame([
-  recodeValue(
-    mappings=sequencerInstrumentMappings,
-    value=value,
-    label='sequencing instrument'
-  ) for value in sampleSequencingData['sequencingInstrumentModel'].to_list()[0]
-])
-
-# recode `genomeBuild`
-print2('SamplePrep & Sequencing: recoding reference genome...')
-sampleSequencingData['referenceGenomeUsed'] = dt.Frame([
-  recodeValue(
-    mappings=genomeBuildMappings,
-    value=value,
-    label='genome build'
-  )
-  for value in sampleSequencingData['referenceGenomeUsed'].to_list()[0]
-])
-
-cosaslogs.stopProcessingStepLog()
-
-# //////////////////////////////////////
+@pipeline.stage(outputs='sampleSequencingData', tablename='samples-sampleprep-seq')
+def buildSampleSequencingData(
+  arrayData,
+  ngsData,
+  samples,
+  sampleReasonMappings,
+  sequencerPlatformMappings,
+  sequencerInstrumentMappings,
+  genomeBuildMappings,
+  step
+):
+  """Build sample-labs dataset
+  @param arrayData datatable object (see `buildArrayData`)
+  @param ngsData datatable object (see `buildNgsData`)
+  @param samples datatable object (see `buildSamples`)
+  @param sampleReasonMappings mappings for `reasonForSequencing`
+  @param sequencerPlatformMappings mappings for `sequencingPlatform`
+  @param sequencerInstrumentMappings mappings for `sequencingInstrumentModel`
+  @param genomeBuildMappings mappings for `referenceGenomeUsed`
+  @param step log of the current processing step
+  @return datatable object
+  """
+  print2('SamplePrep & Sequencing: merging ngs and array datasets...')
+  sampleSequencingData = dt.rbind(arrayData, ngsData, force=True)
+
+  # duplicate IDs for later
+  sampleSequencingData[:, dt.update(
+    belongsToSample=f.sampleID,
+    belongsToSamplePreparation=f.sampleID
+  )]
+
+  # ~ 4c.ii ~
+  # Filter dataset for known samples
+  #
+  # Remove entries that aren't registered in samples table. It isn't clear why
+  # a sample appears in the darwin data and not the adlas dataset. It is
+  # possible that some of the samples aren't authorized, or were never
+  # authorized, by the lab.
+  print2('SamplePrep & Sequencing: filtering data for known samples...')
+  registeredSamples = dt.unique(samples['sampleID']).to_list()[0]
+  sampleSequencingData['idExists'] = dt.Frame([
+    id in registeredSamples
+    for id in sampleSequencingData['belongsToSample'].to_list()[0]
+  ])
+
+  if sampleSequencingData[f.idExists == False, :].nrows > 0:
+    print2(
+      "SamplePrep & Sequencing: WARNING removing",
+      sampleSequencingData[f.idExists == False, :].nrows,
+      "records where the ID does not exist"
+    )
+    step['comment'] = 'Rows removed {}'.format(
+      sampleSequencingData[f.idExists == False, :].nrows
+    )
+    sampleSequencingData = sampleSequencingData[f.idExists, :]
+
+  # ~ 4c.iii ~
+  # Prepare data
+  #
+  # Apply additional transformations and any recoding. In order to make
+  # each sample 'unique' the row identifier is a concatenation of multiple IDs.
+  # These are: sampleID + requestID + labProcedure. At some point, we may want
+  # to change this format
+  print2('SamplePrep & Sequencing: Setting unqiue identifiers (primary key)...')
+
+  # create unique identifier: sampleID + request + belongsToLabProcedure (i.e., test code)
+  # create IDs for multiple tables
+  sampleSequencingData[['belongsToSamplePreparation', 'sequencingID']] = dt.Frame([
+    f'{tuple[0]}_{tuple[1]}_{tuple[2]}'
+    for tuple in sampleSequencingData[
+      :, (f.belongsToSample, f.belongsToRequest, f.belongsToLabProcedure)
+    ].to_tuples()
+  ])
+
+  # format `sequencingDate` as yyyy-mm-dd
+  print2('SamplePrep & Sequencing: Formatting sequencing date...')
+  sampleSequencingData['sequencingDate'] = dt.Frame([
+    formatAsDate(
+      date=date,
+      pattern='%d-%m-%Y %H:%M:%S',
+      asString=True
+    )
+    for date in sampleSequencingData['sequencingDate'].to_list()[0]
+  ])
+
+  # format `labIndication`: use urdm_lookups_samplingReason
+  print2('SamplePrep & Sequencing: recoding "reason for sequencing"...')
+  sampleSequencingData['reasonForSequencing'] = dt.Frame([
+    recodeValue(
+      mappings=sampleReasonMappings,
+      value=value.lower(),
+      label='reasonForSequencing'
+    ) if bool(value) else None
+    for value in sampleSequencingData['reasonForSequencing'].to_list()[0]
+  ])
+
+  # set facility (links with umdm_organizations)
+  sampleSequencingData['sequencingFacilityOrganization'] = 'UMCG'
+
+  # recode `sequencingPlatform`
+  print2('SamplePrep & Sequencing: recoding sequencing platform...')
+  sampleSequencingData['sequencingPlatform'] = dt.Frame([
+    recodeValue(
+      mappings=sequencerPlatformMappings,
+      value=value,
+      label='sequencingPlatform'
+    )
+    for value in sampleSequencingData['sequencingPlatform'].to_list()[0]
+  ])
+
+  # recode `sequencingInstrumentModel`
+  print2('SamplePrep & Sequencing: recoding sequencing instrument model...')
+  sampleSequencingData['sequencingInstrumentModel'] = dt.Frame([
+    recodeValue(
+      mappings=sequencerInstrumentMappings,
+      value=value,
+      label='sequencing instrument'
+    ) for value in sampleSequencingData['sequencingInstrumentModel'].to_list()[0]
+  ])
+
+  # recode `genomeBuild`
+  print2('SamplePrep & Sequencing: recoding reference genome...')
+  sampleSequencingData['referenceGenomeUsed'] = dt.Frame([
+    recodeValue(
+      mappings=genomeBuildMappings,
+      value=value,
+      label='genome build'
+    )
+    for value in sampleSequencingData['referenceGenomeUsed'].to_list()[0]
+  ])
+
+  step['status'] = 'Success' if sampleSequencingData.nrows else 'Error'
+  return sampleSequencingData
 
 # ~ 4d ~
 # Create SamplePreparation and Sequencing tables
@@ -1246,57 +1219,112 @@ cosaslogs.stopProcessingStepLog()
 # In addition, we will also need to add `sequencingMethod`. I'm not sure what
 # mappings should be used. This will require further discussion.
 
-print2('Sample Preparation: Selecting relevant columns...')
-cosaslogs.startProcessingStepLog(
-  type='Data Processing',
-  name='Finalize table',
-  tablename='sample-preparation'
-)
-
-# create: sampleprepation
-# Use sequencing ID for table key so that refs can be made with other tables
-samplePreparation = sampleSequencingData[:, (
-  f.sequencingID,
-  f.belongsToLabProcedure,
-  f.belongsToSample,
-  f.belongsToRequest,
-  # f.libraryPreparationKit,
-  # f.targetEnrichmentKit,
-  f.belongsToBatch
-)]
-
-# rename columns and select distinct rows only
-samplePreparation.names = {'sequencingID': 'samplePreparationID'}
-samplePreparation = samplePreparation[:, first(f[:]), dt.by(f.samplePreparationID)]
-
-print2('Sample Preparation: Processed',samplePreparation.nrows,'new records')
-cosaslogs.currentStep['status'] = 'Success' if samplePreparation.nrows else 'Error'
-cosaslogs.stopProcessingStepLog()
-
-# create sequencing table
-print2('Sequencing: Selecting relevant columns...')
-cosaslogs.startProcessingStepLog(
-  type='Data Processing',
-  name='Finalize table',
-  tablename='sequencing'
-)
+@pipeline.stage(outputs='samplePreparation', tablename='sample-preparation')
+def buildSamplePreparation(sampleSequencingData, step):
+  """Build sample preparation
+  @param sampleSequencingData datatable object (see `buildSampleSequencingData`)
+  @param step log of the current processing step
+  @return datatable object
+  """
+  print2('Sample Preparation: Selecting relevant columns...')
 
-sequencing = sampleSequencingData[:, (
-  f.sequencingID,
-  f.belongsToLabProcedure,
-  f.belongsToSamplePreparation,
-  f.reasonForSequencing,
-  f.sequencingDate,
-  f.sequencingFacilityOrganization,
-  f.sequencingPlatform,
-  f.sequencingInstrumentModel,
-  # f.sequencingMethod,
-  f.referenceGenomeUsed
-)]
-
-print2('Sequencing: Processed {} new records'.format(sequencing.nrows))
-cosaslogs.currentStep['status'] = 'Success' if sequencing.nrows else 'Error'
-cosaslogs.stopProcessingStepLog()
+  # Use sequencing ID for table key so that refs can be made with other tables
+  samplePreparation = sampleSequencingData[:, (
+    f.sequencingID,
+    f.belongsToLabProcedure,
+    f.belongsToSample,
+    f.belongsToRequest,
+    # f.libraryPreparationKit,
+    # f.targetEnrichmentKit,
+    f.belongsToBatch
+  )]
+
+  # rename columns and select distinct rows only
+  samplePreparation.names = {'sequencingID': 'samplePreparationID'}
+  samplePreparation = samplePreparation[:, first(f[:]), dt.by(f.samplePreparationID)]
+
+  print2('Sample Preparation: Processed',samplePreparation.nrows,'new records')
+  step['status'] = 'Success' if samplePreparation.nrows else 'Error'
+  return samplePreparation
+
+@pipeline.stage(outputs='sequencing', tablename='sequencing')
+def buildSequencing(sampleSequencingData, step):
+  """Build sequencing
+  @param sampleSequencingData datatable object (see `buildSampleSequencingData`)
+  @param step log of the current processing step
+  @return datatable object
+  """
+  print2('Sequencing: Selecting relevant columns...')
+  sequencing = sampleSequencingData[:, (
+    f.sequencingID,
+    f.belongsToLabProcedure,
+    f.belongsToSamplePreparation,
+    f.reasonForSequencing,
+    f.sequencingDate,
+    f.sequencingFacilityOrganization,
+    f.sequencingPlatform,
+    f.sequencingInstrumentModel,
+    # f.sequencingMethod,
+    f.referenceGenomeUsed
+  )]
+
+  print2('Sequencing: Processed {} new records'.format(sequencing.nrows))
+  step['status'] = 'Success' if sequencing.nrows else 'Error'
+  return sequencing
+
+# ~ 4e ~
+# Run pipeline
+#
+# Stages are run in order of their inputs. The data is fetched from the portal
+# in the main process. The clinical, samples, and lab data stages only depend
+# on the list of subject identifiers, and are run at the same time if `workers`
+# is greater than one. Most of the time is spent in list comprehensions, so
+# set `executor` to 'process' to make use of all cores where possible. If
+# `cacheDir` is set, stages whose inputs and code have not changed since the
+# last run are loaded from the cache. If `runDir` is set, all outputs are saved
+# so that the run can be resumed (see `resumeFrom`). If a stage fails, the logs
+# are imported before the job stops.
+
+try:
+  if resumeFrom == 'import':
+    results = pipeline.restore()
+  else:
+    results = pipeline.run(resumeFrom=resumeFrom)
+except Exception:
+  cosaslogs.stop()
+  db.importDatatableAsCsv(
+    pkg_entity='cosasreports_processingsteps',
+    data=dt.Frame(cosaslogs.processingStepLogs)
+  )
+  db.importDatatableAsCsv(
+    pkg_entity='cosasreports_imports',
+    data=dt.Frame([cosaslogs.log])
+  )
+  raise
+
+raw_samples = results['raw_samples']
+raw_array_adlas = results['raw_array_adlas']
+raw_array_darwin = results['raw_array_darwin']
+raw_ngs_adlas = results['raw_ngs_adlas']
+raw_ngs_darwin = results['raw_ngs_darwin']
+activeTestCodes = results['activeTestCodes']
+subjects = results['subjects']
+clinicalDT = results['clinicalDT']
+samples = results['samples']
+samplePreparation = results['samplePreparation']
+sequencing = results['sequencing']
+del results
+
+# print the columns of each table that do not have any values (the full
+# summary is imported by cosasreports_attribute_summary.py)
+for tablename, data in [
+  ('subjects', subjects),
+  ('clinical', clinicalDT),
+  ('samples', samples),
+  ('samplePreparation', samplePreparation),
+  ('sequencing', sequencing)
+]:
+  probeCompleteness(tablename, data)
 
 # //////////////////////////////////////////////////////////////////////////////
 
@@ -1333,21 +1361,23 @@ testcodes['codeExists'] = dt.Frame([
 ])
 
 # select new cases
-if testcodes[f.codeExists == False, :].nrows:
-  newTestCodes = testcodes[
-    f.codeExists == False,
-    {'code': f.TEST_CODE, 'description': f.TEST_OMS}
-  ]
-
+cosaslogs.currentStep['rowsIn'] = countRows(testcodes)
+newTestCodes = testcodes[
+  f.codeExists == False,
+  {'code': f.TEST_CODE, 'description': f.TEST_OMS}
+]
+if newTestCodes.nrows:
   print2('Validation: Identified {} new codes'.format(newTestCodes.nrows))
   cosaslogs.currentStep['comment'] = 'Identified {} new codes'.format(newTestCodes.nrows)
 
   print2('Validation: Importing new testcodes')
   db.importDatatableAsCsv(pkg_entity = 'umdm_labProcedures', data = newTestCodes)
-  del newTestCodes
 else:
     print2('Validation: all testcodes passed')
 
+cosaslogs.stopProcessingStepLog(rowsOut=countRows(newTestCodes))
+del newTestCodes
+
 # //////////////////////////////////////////////////////////////////////////////
 
 # ~ 6 ~
@@ -1393,66 +1423,71 @@ print2('COSAS Import: Importing data...')
 
 # ~ 5b.i ~
 # Import data into `umdm_subjects`
-cosaslogs.startProcessingStepLog(
+with cosaslogs.step(
   type='Import',
   name='import-subjects',
-  tablename='subjects'
-)
-
-db.importDatatableAsCsv(pkg_entity='umdm_subjects', data = subjects)
-cosaslogs.stopProcessingStepLog()
+  tablename='subjects',
+  rowsIn=countRows(subjects)
+) as step:
+  response = db.importDatatableAsCsv(pkg_entity='umdm_subjects', data=subjects)
+  step['status'] = 'Success' if (response.status_code // 100) == 2 else 'Error'
+  step['rowsOut'] = countRows(subjects) if step['status'] == 'Success' else 0
 
 # ~ 5b.ii ~
 # Import data into 'umdm_clinical'
 # This table has an xref with umdm_subjects
-cosaslogs.startProcessingStepLog(
+with cosaslogs.step(
   type='Import',
   name='import-clinical',
-  tablename='clinical'
-)
-
-db.importDatatableAsCsv(pkg_entity = 'umdm_clinical', data = clinicalDT)
-cosaslogs.stopProcessingStepLog()
+  tablename='clinical',
+  rowsIn=countRows(clinicalDT)
+) as step:
+  response = db.importDatatableAsCsv(pkg_entity='umdm_clinical', data=clinicalDT)
+  step['status'] = 'Success' if (response.status_code // 100) == 2 else 'Error'
+  step['rowsOut'] = countRows(clinicalDT) if step['status'] == 'Success' else 0
 
 # ~ 5b.ii ~
 # Import data into 'umdm_samples'
 # There is a xref with umdm_subjects. Make sure all subjects in the samples
 # dataset exist in the samples table prior to import. (See step 3.)
-cosaslogs.startProcessingStepLog(
-    type='Import',
-    name='import-samples',
-    tablename='samples'
-)
-
-db.importDatatableAsCsv(pkg_entity = 'umdm_samples', data = samples)
-cosaslogs.stopProcessingStepLog()
+with cosaslogs.step(
+  type='Import',
+  name='import-samples',
+  tablename='samples',
+  rowsIn=countRows(samples)
+) as step:
+  response = db.importDatatableAsCsv(pkg_entity='umdm_samples', data=samples)
+  step['status'] = 'Success' if (response.status_code // 100) == 2 else 'Error'
+  step['rowsOut'] = countRows(samples) if step['status'] == 'Success' else 0
 
 # ~ 5b.iii
 # Import data into umdm_samplePreparation
 # This table has an xref with `umdm_samples`. All sample IDs and subject IDs
 # must be imported and exist before importing. This should already have been
 # handled in step 4.
-cosaslogs.startProcessingStepLog(
+with cosaslogs.step(
   type='Import',
   name='import-samplepreparation',
-  tablename='samplepreparation'
-)
-
-db.importDatatableAsCsv(pkg_entity = 'umdm_samplePreparation',data = samplePreparation)
-cosaslogs.stopProcessingStepLog()
+  tablename='samplepreparation',
+  rowsIn=countRows(samplePreparation)
+) as step:
+  response = db.importDatatableAsCsv(pkg_entity='umdm_samplePreparation', data=samplePreparation)
+  step['status'] = 'Success' if (response.status_code // 100) == 2 else 'Error'
+  step['rowsOut'] = countRows(samplePreparation) if step['status'] == 'Success' else 0
 
 # ~ 5b.iv ~
 # Import data into 'umdm_sequencing'
 # This table has an xref with `umdm_samplePreparation`. All sample IDs should
 # have been validated (see step 4).
-cosaslogs.startProcessingStepLog(
+with cosaslogs.step(
   type='Import',
   name='import-sequencing',
-  tablename='sequencing'
-)
-
-db.importDatatableAsCsv(pkg_entity = 'umdm_sequencing', data = sequencing)
-cosaslogs.stopProcessingStepLog()
+  tablename='sequencing',
+  rowsIn=countRows(sequencing)
+) as step:
+  response = db.importDatatableAsCsv(pkg_entity='umdm_sequencing', data=sequencing)
+  step['status'] = 'Success' if (response.status_code // 100) == 2 else 'Error'
+  step['rowsOut'] = countRows(sequencing) if step['status'] == 'Success' else 0
 
 # ~ 5b.v ~
 # import logs
@@ -1469,4 +1504,7 @@ db.importDatatableAsCsv(
   data=dt.Frame([cosaslogs.log])
 )
 
+if profile:
+  cosaslogs.writeProfileReport(profileReport)
+
 db.logout()
@@ -2,17 +2,18 @@
 #' FILE: cosasreports_attribute_summary.py
 #' AUTHOR: David Ruvolo
 #' CREATED: 2022-04-19
-#' MODIFIED: 2022-08-01
+#' MODIFIED: 2026-10-19
 #' PURPOSE: generate a coverage report of all attributes in COSAS
 #' STATUS: stable
 #' PACKAGES: **see below**
 #' COMMENTS: NA
 #'////////////////////////////////////////////////////////////////////////////
 
-import molgenis.client as molgenis
+from cosastools.molgenis import Molgenis
+from cosastools.datatable import summarizeFrame, diffByKey
+from cosastools.reports import buildCompletenessSnapshot
 from datetime import datetime
 from datatable import dt,f
-import numpy as np
 import pytz
 import re
 
@@ -20,46 +21,49 @@ import re
 # from dotenv import load_dotenv
 # from os import environ
 # load_dotenv()
-# cosas= molgenis.Session(environ['MOLGENIS_ACC_HOST'])
+# cosas= Molgenis(environ['MOLGENIS_ACC_HOST'])
 # cosas.login(environ['MOLGENIS_ACC_USR'], environ['MOLGENIS_ACC_PWD'])
 
 host='http://localhost/api'
 token='${molgenisToken}'
 
-def summarizeData(tablename, data) -> dict:
-  """Summarize Data
-  For all columns in a datatable object, get the count of non-NoneType vaues
-  and the total number of values (i.e., rows)
-  
-  @param tablename name of the table
-  @param data a datatable object
-  
-  @return dictionary
+# If True, the number of values per attribute is counted on the server. Set
+# to False to download all tables and count the values locally. Both methods
+# count empty mrefs as missing values (see `Molgenis.countValues`).
+useServerSideCounts=True
+
+def getAttributeLabels(pkg, tables):
+  """Get Attribute Labels
+  Retrieve the metadata of all attributes of the selected tables in a single
+  (paged) request to `sys_md_Attribute`, rather than querying each attribute
+  separately.
+
+  @param pkg name of the package (e.g., 'umdm')
+  @param tables list of table names (without package)
+
+  @return datatable object keyed by databaseTable and databaseColumn
   """
-  datatable = data
-  data = []
-  for column in datatable.names:
-    data.append({
-      'databaseTable': tablename,
-      'databaseColumn': column,
-      'countOfValues': len([x for x in datatable[:, [column]].to_list()[0] if x is not None]),
-      'totalValues': datatable[:, [column]].nrows
-    })
-  return data
-  
-def getAttributeLabel(pkg, table, column):
   response = cosas.get(
     entity = 'sys_md_Attribute',
-    q = f'entity=={pkg}_{table};name=={column}'
+    q = f"entity=in=({','.join([f'{pkg}_{table}' for table in tables])})",
+    attributes = 'name,label,entity',
+    batch_size = 10000
   )
-  try:
-    return response[0]['label']
-  except KeyError as error:
-    print('Column', column, 'does not exist in', pkg,'_',table, '\n',str(error))
-    return None
-  except IndexError as error:
-    print('No results found for "',column,'" in', pkg,'_',table, '\n',str(error))
-    return None
+
+  labels = {}
+  for row in response:
+    entity = row.get('entity', {}).get('id')
+    if entity and entity.startswith(f'{pkg}_'):
+      labels[(entity[len(pkg) + 1:], row.get('name'))] = row.get('label')
+
+  data = dt.Frame(
+    databaseTable = [key[0] for key in labels.keys()],
+    databaseColumn = [key[1] for key in labels.keys()],
+    displayName = list(labels.values()),
+    types = [dt.Type.str32] * 3
+  )
+  data.key = ['databaseTable', 'databaseColumn']
+  return data
 
 # define attributes that are currently used
 cosasTables={
@@ -114,7 +118,7 @@ cosasTables={
 # ~ 1 ~
 # GET INPUT DATA
 # Fetch all data from the UMDM schema and flatten attributes
-cosas=molgenis.Session(url=host,token=token)
+cosas=Molgenis(url=host,token=token)
 
 
 # ~ 1a ~
@@ -139,104 +143,125 @@ cosas.update_one(
 print('Preparing data....')
 
 # ~ 1b ~
-# Get Data
-print('Fetching COSAS data....')
-
-subjectData = cosas.get(
-    entity='umdm_subjects',
-    batch_size=10000,
-    attributes= ','.join(cosasTables['subjects'])
-)
+# Count values
+# By default, all counts are retrieved using count queries (see
+# `Molgenis.countValues`). Alternatively, all tables are downloaded,
+# nested attributes are flattened, and values are counted locally.
+if useServerSideCounts:
+  print('Counting values per attribute....')
+  cosasSummary = []
+  for table, columns in cosasTables.items():
+    for row in cosas.countValues(entity=f'umdm_{table}', attributes=columns):
+      cosasSummary.append({
+        'databaseTable': table,
+        'databaseColumn': row['attribute'],
+        'countOfValues': row['countOfValues'],
+        'totalValues': row['totalValues']
+      })
+
+else:
+  print('Fetching COSAS data....')
+
+  subjectData = cosas.get(
+      entity='umdm_subjects',
+      batch_size=10000,
+      attributes= ','.join(cosasTables['subjects'])
+  )
 
-clinicalData = cosas.get(
-    entity='umdm_clinical',
-    batch_size=10000,
-    attributes=','.join(cosasTables['clinical'])
-)
+  clinicalData = cosas.get(
+      entity='umdm_clinical',
+      batch_size=10000,
+      attributes=','.join(cosasTables['clinical'])
+  )
 
-samplesData = cosas.get(
-    entity='umdm_samples',
-    batch_size=10000,
-    attributes=','.join(cosasTables['samples'])
-)
+  samplesData = cosas.get(
+      entity='umdm_samples',
+      batch_size=10000,
+      attributes=','.join(cosasTables['samples'])
+  )
 
-samplePrepData = cosas.get(
-    entity='umdm_samplePreparation',
-    batch_size=10000,
-    attributes=','.join(cosasTables['samplePreparation'])
-)
+  samplePrepData = cosas.get(
+      entity='umdm_samplePreparation',
+      batch_size=10000,
+      attributes=','.join(cosasTables['samplePreparation'])
+  )
 
-sequencingData = cosas.get(
-    entity='umdm_sequencing',
-    batch_size=10000,
-    attributes=','.join(cosasTables['sequencing'])
-)
+  sequencingData = cosas.get(
+      entity='umdm_sequencing',
+      batch_size=10000,
+      attributes=','.join(cosasTables['sequencing'])
+  )
 
-# ~ 1c ~
-# Flatten attributes
-print('Flattening nested attributes....')
-
-for row in subjectData:
-    row['belongsToMother'] = row.get('belongsToMother',{}).get('subjectID')
-    row['belongsToFather'] = row.get('belongsToFather',{}).get('subjectID')
-    row['subjectStatus'] = row.get('subjectStatus',{}).get('value')
-    row['genderAtBirth'] = row.get('genderAtBirth',{}).get('value')
-    row['primaryOrganization'] = row.get('primaryOrganization',{}).get('value')
-
-for row in clinicalData:
-    row['belongsToSubject'] = row.get('belongsToSubject',{}).get('subjectID')
-    row['observedPhenotype'] = len(row.get('observedPhenotype')) if row.get('observedPhenotype') is not None else None
-    row['unobservedPhenotype'] = len(row.get('unobservedPhenotype')) if row.get('unobservedPhenotype') is not None else None
-    row['provisionalPhenotype'] = len(row.get('provisionalPhenotype')) if row.get('provisionalPhenotype') is not None else None
-    
-for row in samplesData:
-    row['belongsToSubject'] = row.get('belongsToSubject',{}).get('subjectID')
-    row['biospecimenType'] = row.get('biospecimenType', {}).get('value')
-
-for row in samplePrepData:
-    row['belongsToSample'] = row.get('belongsToSample', {}).get('sampleID')
-    row['belongsToLabProcedure'] = row.get('belongsToLabProcedure', {}).get('code')
-    row['belongsToRequest'] = row.get('belongsToRequest')
-    row['belongsToBatch'] = row.get('belongsToBatch')
-
-for row in sequencingData:
-    row['belongsToLabProcedure'] = row.get('belongsToLabProcedure', {}).get('code')
-    row['belongsToSamplePreparation'] = row.get('belongsToSamplePreparation', {}).get('sampleID')
-    row['reasonForSequencing'] = row.get('reasonForSequencing', {}).get('value')
-    row['sequencingFacilityOrganization'] = row.get('sequencingFacilityOrganization', {}).get('value')
-    row['sequencingPlatform'] = row.get('sequencingPlatform', {}).get('value')
-    row['sequencingInstrumentModel'] = row.get('sequencingInstrumentModel', {}).get('value')
-    row['referenceGenomeUsed'] = row.get('referenceGenomeUsed', {}).get('value')
-
-# ~ 1d ~
-# Convert to DataTable object
-print('Converting objects to datatables....')
-
-subjects = dt.Frame(subjectData)
-clinical = dt.Frame(clinicalData)
-samples = dt.Frame(samplesData)
-samplePrep = dt.Frame(samplePrepData)
-sequencing = dt.Frame(sequencingData)
-
-del subjects['_href']
-del clinical['_href']
-del samples['_href']
-del samplePrep['_href']
-del sequencing['_href']
+  # ~ 1c ~
+  # Flatten attributes
+  print('Flattening nested attributes....')
+
+  for row in subjectData:
+      row['belongsToMother'] = row.get('belongsToMother',{}).get('subjectID')
+      row['belongsToFather'] = row.get('belongsToFather',{}).get('subjectID')
+      row['subjectStatus'] = row.get('subjectStatus',{}).get('value')
+      row['genderAtBirth'] = row.get('genderAtBirth',{}).get('value')
+      row['primaryOrganization'] = row.get('primaryOrganization',{}).get('value')
+
+  for row in clinicalData:
+      row['belongsToSubject'] = row.get('belongsToSubject',{}).get('subjectID')
+      row['observedPhenotype'] = len(row.get('observedPhenotype')) if row.get('observedPhenotype') else None
+      row['unobservedPhenotype'] = len(row.get('unobservedPhenotype')) if row.get('unobservedPhenotype') else None
+      row['provisionalPhenotype'] = len(row.get('provisionalPhenotype')) if row.get('provisionalPhenotype') else None
+
+  for row in samplesData:
+      row['belongsToSubject'] = row.get('belongsToSubject',{}).get('subjectID')
+      row['biospecimenType'] = row.get('biospecimenType', {}).get('value')
+
+  for row in samplePrepData:
+      row['belongsToSample'] = row.get('belongsToSample', {}).get('sampleID')
+      row['belongsToLabProcedure'] = row.get('belongsToLabProcedure', {}).get('code')
+      row['belongsToRequest'] = row.get('belongsToRequest')
+      row['belongsToBatch'] = row.get('belongsToBatch')
+
+  for row in sequencingData:
+      row['belongsToLabProcedure'] = row.get('belongsToLabProcedure', {}).get('code')
+      row['belongsToSamplePreparation'] = row.get('belongsToSamplePreparation', {}).get('sampleID')
+      row['reasonForSequencing'] = row.get('reasonForSequencing', {}).get('value')
+      row['sequencingFacilityOrganization'] = row.get('sequencingFacilityOrganization', {}).get('value')
+      row['sequencingPlatform'] = row.get('sequencingPlatform', {}).get('value')
+      row['sequencingInstrumentModel'] = row.get('sequencingInstrumentModel', {}).get('value')
+      row['referenceGenomeUsed'] = row.get('referenceGenomeUsed', {}).get('value')
+
+  # ~ 1d ~
+  # Convert to DataTable object
+  print('Converting objects to datatables....')
+
+  subjects = dt.Frame(subjectData)
+  clinical = dt.Frame(clinicalData)
+  samples = dt.Frame(samplesData)
+  samplePrep = dt.Frame(samplePrepData)
+  sequencing = dt.Frame(sequencingData)
+
+  del subjects['_href']
+  del clinical['_href']
+  del samples['_href']
+  del samplePrep['_href']
+  del sequencing['_href']
+
+  # ~ 1e ~
+  # Summarize Data
+  print('Summarizing data....')
+  cosasSummary = dt.rbind(
+    summarizeFrame(subjects, 'subjects'),
+    summarizeFrame(clinical, 'clinical'),
+    summarizeFrame(samples, 'samples'),
+    summarizeFrame(samplePrep, 'samplePreparation'),
+    summarizeFrame(sequencing, 'sequencing')
+  )[:, ['databaseTable', 'databaseColumn', 'countOfValues', 'totalValues']]
 
 #//////////////////////////////////////////////////////////////////////////////
 
 # ~ 2 ~
 # Summarize Data
 
-print('Summarizing data....')
-cosasSummary=summarizeData('subjects', subjects)
-cosasSummary.extend(summarizeData('clinical', clinical))
-cosasSummary.extend(summarizeData('samples', samples))
-cosasSummary.extend(summarizeData('samplePreparation', samplePrep))
-cosasSummary.extend(summarizeData('sequencing', sequencing))
-
 cosasSummaryDT = dt.Frame(cosasSummary)
+cosasSummaryDT = cosasSummaryDT[:, ['databaseTable', 'databaseColumn', 'countOfValues', 'totalValues']]
 
 # ~ 2b ~
 # Add and transform columns
@@ -248,19 +273,17 @@ cosasSummaryDT['identifier'] = dt.Frame([
     for row in cosasSummaryDT[:, (f.databaseTable, f.databaseColumn)].to_tuples()
 ])
 
-# find the number of missing values (i.e., None)
-print('Calculating difference in values (total - count)....')
-cosasSummaryDT['differenceInValues'] = dt.Frame([
-    row[1] - row[0]
-    for row in cosasSummaryDT[:, (f.countOfValues, f.totalValues)].to_tuples()
-])
-
-# calculate the percentage of coverage (i.e., how many values out of the total)
-print('Calculating percentage of coverage (count / total)....')
-cosasSummaryDT['percentComplete'] = dt.Frame([
-    round(row[0] / row[1], 2)
-    for row in cosasSummaryDT[:, (f.countOfValues, f.totalValues)].to_tuples()
-])
+# find the number of missing values (i.e., None) and calculate the percentage
+# of coverage (i.e., how many values out of the total)
+print('Calculating difference in values and percentage of coverage....')
+cosasSummaryDT[:, dt.update(
+  differenceInValues = f.totalValues - f.countOfValues,
+  percentComplete = dt.ifelse(
+    f.totalValues > 0,
+    dt.math.round(f.countOfValues / f.totalValues, ndigits=2),
+    None
+  )
+)]
 
 
 # set key type based on the presence of 'belongs' and 'ID'
@@ -273,24 +296,76 @@ cosasSummaryDT['databaseKey'] = dt.Frame([
 ])
 
 # set display name
-cosasSummaryDT['displayName'] = dt.Frame([
-  getAttributeLabel(pkg='umdm', table=d[0], column=d[1])
-  for d in cosasSummaryDT[:, ['databaseTable', 'databaseColumn']].to_tuples()
-])
+print('Retrieving attribute labels....')
+attributeLabels = getAttributeLabels(pkg='umdm', tables=list(cosasTables.keys()))
+cosasSummaryDT = cosasSummaryDT[:, :, dt.join(attributeLabels)]
 
-cosasSummaryDT['displayName'] = dt.Frame([
-  d[1] if d[0] is None else d[0]
-  for d in cosasSummaryDT[:, ['displayName', 'databaseColumn']].to_tuples()
-])
+missingLabels = cosasSummaryDT[f.displayName == None, f.identifier].to_list()[0]
+if missingLabels:
+  print('No labels found for:', ', '.join(missingLabels))
 
-# set date last updated
+cosasSummaryDT[:, dt.update(
+  displayName = dt.ifelse(f.displayName == None, f.databaseColumn, f.displayName)
+)]
+
+# set date last updated. Unchanged rows are not imported (see ~ 3 ~), so
+# `dateLastUpdated` is the date the summary of an attribute last changed
+# rather than the date of the last run.
 cosasSummaryDT['dateLastUpdated'] = datetime.utcnow().strftime('%Y-%m-%d')
 
 #//////////////////////////////////////////////////////////////////////////////
 
 # ~ 3 ~
 # Import
+# Compare the summary with the current contents of the table and import new
+# or changed rows only (`dateLastUpdated` is not compared). Rows that are no
+# longer part of the summary are removed. The date of the last run is kept in
+# `cosasreports_imports` and the daily values in the history table (~ 3b ~).
+# Rows are retrieved in upload format: references (e.g., `databaseKey`) are
+# returned as identifiers rather than objects, so they can be compared with
+# the values in the summary.
+print('Comparing summary with existing data....')
+currentSummary = dt.Frame(
+  cosas.get(
+    entity='cosasreports_attributesummary',
+    batch_size=10000,
+    uploadable=True
+  )
+)
+
+summaryChanges = diffByKey(
+  current = currentSummary,
+  data = cosasSummaryDT,
+  key = 'identifier',
+  columns = [
+    column for column in cosasSummaryDT.names
+    if column not in ['identifier', 'dateLastUpdated']
+  ]
+)
+
 print('Importing data....')
-importData = cosasSummaryDT.to_pandas().replace({np.nan: None}).to_dict('records')
-cosas.delete(entity='cosasreports_attributesummary')
-cosas.add_all(entity='cosasreports_attributesummary', entities=importData)
+if summaryChanges['changed'].nrows:
+  print('Rows to add or update:', summaryChanges['changed'].nrows)
+  cosas.importDatatableAsCsv(
+    pkg_entity = 'cosasreports_attributesummary',
+    data = summaryChanges['changed']
+  )
+else:
+  print('No changes in attribute summary')
+
+if summaryChanges['removed']:
+  print('Rows to remove:', len(summaryChanges['removed']))
+  cosas.delete_list(
+    entity = 'cosasreports_attributesummary',
+    entities = summaryChanges['removed']
+  )
+
+# ~ 3b ~
+# Add today's snapshot to the history table
+# Use `cosastools.reports.getCompletenessHistory` to retrieve the completeness
+# of an attribute over a number of days.
+print('Importing snapshot into history....')
+cosas.importDatatableAsCsv(
+  pkg_entity = 'cosasreports_attributesummaryhistory',
+  data = buildCompletenessSnapshot(cosasSummaryDT, date=dateToday)
+)
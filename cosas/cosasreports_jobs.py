@@ -2,7 +2,7 @@
 # FILE: cosasreports_jobs.py
 # AUTHOR: David Ruvolo
 # CREATED: 2023-07-25
-# MODIFIED: 2023-08-25
+# MODIFIED: 2026-10-19
 # PURPOSE: update jobs table status
 # STATUS: stable
 # PACKAGES: **see below**
@@ -10,6 +10,14 @@
 #///////////////////////////////////////////////////////////////////////////////
 
 from cosastools.molgenis import Molgenis
+from cosastools.reports import (
+  getJobStatistics,
+  getJobWatermark,
+  getPendingExecutions,
+  getJobExecutions,
+  updateJobStatistics,
+  jobStatisticsToFrame
+)
 from datatable import dt, f, as_type
 
 # ~ LOCAL ~
@@ -40,28 +48,32 @@ scheduleDT = dt.Frame(
 )
 del scheduleDT['_href']
 
-# init columns
-scheduleDT[:, dt.update(
-  dateLastRun = as_type(None, dt.Type.str32),
-  isStable = as_type(None, dt.Type.str32)
-)]
-
 scheduleDT.names = {
   'cronExpression': 'cron',
   'active': 'isActive'
 }
 
 
-# get job execution history
-historyDT = dt.Frame(
-  cosas.get(
-    'sys_job_ScriptJobExecution',
-    attributes='name,status,submissionDate',
-    q='submissionDate=ge=2023-07-01T00:00:00Z;name!=TEST'
-  )
+# get job statistics and update them with the executions that were submitted
+# since the last run (see `cosasreports_jobstatistics`) and the executions that
+# were still pending. If the table is empty, all executions are retrieved.
+jobStatistics = getJobStatistics(cosas)
+watermark = getJobWatermark(jobStatistics)
+jobExecutions = getJobExecutions(
+  cosas,
+  watermark=watermark,
+  exclude=['TEST'],
+  pending=getPendingExecutions(jobStatistics)
 )
+jobStatistics = updateJobStatistics(jobStatistics, jobExecutions)
+jobStatisticsDT = jobStatisticsToFrame(jobStatistics)
 
-del historyDT['_href']
+# most recent execution per job
+historyDT = jobStatisticsDT[f.lastSubmissionDate != None, {
+  'name': f.name,
+  'status': f.lastStatus,
+  'submissionDate': f.lastSubmissionDate
+}]
 
 #///////////////////////////////////////////////////////////////////////////////
 
@@ -75,91 +87,53 @@ mapping = {
   'COSAS REPORTS: Generate Attribute Summary': 'COSAS: Generate Attribute Summary',
 }
 
-historyDT['name'] = dt.Frame([
+# get the most recent execution per job. The history is reduced to one row per
+# job name before names are recoded, and reduced again afterwards in case
+# multiple names are mapped to the same scheduled job.
+recentRunsDT = historyDT[:, dt.last(f[:]), dt.by(f.name), dt.sort(f.submissionDate)]
+recentRunsDT['name'] = dt.Frame(name=[
   mapping[value] if value in mapping else value
-  for value in historyDT['name'].to_list()[0]
-])
-
-# Change submissionDate to date
-historyDT['submissionDate'] = dt.Frame([
-  value.split('T')[0]
-  for value in historyDT['submissionDate'].to_list()[0]
-])
-
-historyDT[:, dt.update(submissionDate=as_type(f.submissionDate, dt.Type.date32))]
-
-# Merge status and date last run with scheduled jobs
-for job in scheduleDT['name'].to_list()[0]:
-  
-  # isoloate job history and get the last date script was executed
-  jobHistoryDT = historyDT[f.name == job, :]
-  jobRecentDate = jobHistoryDT[:, dt.max(f.submissionDate)].to_list()[0][0].strftime('%Y-%m-%d')
-  
-  # get row containing the most recent job execution
-  jobHistoryDT[:, dt.update(submissionDate=as_type(f.submissionDate, dt.Type.str32))]
-  jobRecentRunDT = jobHistoryDT[(f.name == job) & (f.submissionDate==jobRecentDate), :]
-  
-  # update schedule table
-  scheduleDT[f.name == job, (f.dateLastRun, f.isStable)] = jobRecentRunDT[
-    :, (f.submissionDate, f.status)
-  ].to_tuples()[0]
-  
-
-# Recode `isStable` values to bool and convert to string for import
-scheduleDT['isStable'] = dt.Frame([
-  value == 'SUCCESS' for value in scheduleDT['isStable'].to_list()[0]
-])
+  for value in recentRunsDT['name'].to_list()[0]
+], type=dt.Type.str32)
+
+recentRunsDT = recentRunsDT[:, dt.last(f[:]), dt.by(f.name), dt.sort(f.submissionDate)]
+recentRunsDT = recentRunsDT[:, {
+  'name': f.name,
+  'dateLastRun': dt.str.slice(f.submissionDate, 0, 10),
+  'isStable': f.status == 'SUCCESS'
+}]
+recentRunsDT.key = 'name'
+
+# merge status and date last run with scheduled jobs
+scheduleDT = scheduleDT[:, :, dt.join(recentRunsDT)]
+scheduleDT[:, dt.update(isStable = dt.ifelse(f.isStable == None, False, f.isStable))]
 
 #///////////////////////////////////////////////////////////////////////////////
 
 # ~ 2 ~
 # Update Data Sources
 # For all jobs, update the data sources table to indicate if there is an issue
-# in the overall workflow
-
-# set cosas sources: Adlas and Darwin
-cosasJobsDT = scheduleDT[dt.re.match(f.name, 'COSAS.*'), ['isActive','isStable']]
-for row in cosasJobsDT.to_tuples():
-  if (row[0] is False) or (row[1] is False):
-    sourcesDT[dt.re.match(f.source, 'ADLAS|Darwin'),'status'] = -1
-  else:
-    sourcesDT[dt.re.match(f.source, 'ADLAS|Darwin'),'status'] = 1
-
-
-# set alissa sources
-alissaJobsDT = scheduleDT[dt.re.match(f.name, 'Alissa.*'), ['isActive','isStable']]
-for row in alissaJobsDT.to_tuples():
-  if (row[0] is False) or (row[1] is False):
-    sourcesDT[dt.re.match(f.source, 'Alissa'), 'status'] = -1
-  else:
-    sourcesDT[dt.re.match(f.source, 'Alissa'), 'status'] = 1
-    
-    
-# set cartagenia source
-cartageniaJobDT = scheduleDT[dt.re.match(f.name, 'Cartagenia.*'), ['isActive','isStable']]
-for row in cartageniaJobDT.to_tuples():
-  if (row[0] is False) or (row[1] is False):
-    sourcesDT[dt.re.match(f.source, 'Cartagenia.*'), 'status'] = -1
-  else:
-    sourcesDT[dt.re.match(f.source, 'Cartagenia.*'), 'status'] = 1
-    
-    
-# set consent source status
-consentJobDT = scheduleDT[dt.re.match(f.name, 'Consent.*'), ['isActive','isStable']]
-for row in consentJobDT.to_tuples():
-  if (row[0] is False) or (row[1] is False): 
-    sourcesDT[f.source=='Consent Files', 'status'] = -1
-  else:
-    sourcesDT[f.source=='Consent Files', 'status'] = 1
-
-
-# set file metadata processing status
-filesJobDT = scheduleDT[dt.re.match(f.name,'.*Daily file.*'), ['isActive', 'isStable']]
-for row in filesJobDT.to_tuples():
-  if (row[0] is False) or (row[1] is False):
-    sourcesDT[dt.re.match(f.source,'Analyis.*'), 'status'] = -1
-  else:
-    sourcesDT[dt.re.match(f.source,'Analyis.*'), 'status'] = 1
+# in the overall workflow. Jobs are linked to data sources using a pattern
+# that matches the name of the job and a pattern that matches the name of the
+# source. A source is offline (-1) if any of the jobs is inactive or was not
+# successful, and online (1) otherwise.
+jobSourceMappings = [
+  {'jobs': 'COSAS.*', 'sources': 'ADLAS|Darwin'},
+  {'jobs': 'Alissa.*', 'sources': 'Alissa'},
+  {'jobs': 'Cartagenia.*', 'sources': 'Cartagenia.*'},
+  {'jobs': 'Consent.*', 'sources': 'Consent Files'},
+  {'jobs': '.*Daily file.*', 'sources': 'Analyis.*'}
+]
+
+for sourceMapping in jobSourceMappings:
+  jobStatusDT = scheduleDT[
+    dt.re.match(f.name, sourceMapping['jobs']),
+    dt.min((f.isActive == True) & (f.isStable == True))
+  ]
+  if jobStatusDT.nrows and jobStatusDT[0, 0] is not None:
+    sourcesDT[dt.re.match(f.source, sourceMapping['sources']), 'status'] = (
+      1 if jobStatusDT[0, 0] else -1
+    )
 
 #///////////////////////////////////////////////////////////////////////////////
 
@@ -173,5 +147,6 @@ scheduleDT[:, dt.update(
 
 cosas.importDatatableAsCsv('cosasreports_datasources', sourcesDT)
 cosas.importDatatableAsCsv('cosasreports_jobs', scheduleDT)
+cosas.importDatatableAsCsv('cosasreports_jobstatistics', jobStatisticsDT)
 
 cosas.logout()
@@ -0,0 +1,93 @@
+#///////////////////////////////////////////////////////////////////////////////
+# FILE: cosasreports_processingsteps.py
+# AUTHOR: David Ruvolo
+# CREATED: 2026-10-19
+# MODIFIED: 2026-10-19
+# PURPOSE: analyse the duration and throughput of processing steps
+# STATUS: in.progress
+# PACKAGES: **see below**
+# COMMENTS: NA
+#///////////////////////////////////////////////////////////////////////////////
+
+from cosastools.molgenis import Molgenis, print2
+from cosastools.reports import analyseProcessingSteps
+from datatable import dt, f
+from datetime import datetime, timedelta
+
+# ~ LOCAL ~
+# from os import environ
+# from dotenv import load_dotenv
+# load_dotenv()
+# cosas = Molgenis(environ['MOLGENIS_ACC_HOST'])
+# cosas.login(environ['MOLGENIS_ACC_USR'], environ['MOLGENIS_ACC_PWD'])
+
+# ~ PROD ~
+cosas = Molgenis('http://localhost/api/', '${molgenisToken}')
+
+# ~ OPTIONS ~
+# `historyDays`: number of days of processing steps used to calculate the
+# trailing median. `reportDays`: number of days to import into the trends
+# table (older steps were imported in previous runs). A step is a regression
+# when it took `threshold` times longer than the median of the previous
+# `window` runs.
+historyDays = 90
+reportDays = 7
+window = 14
+threshold = 1.5
+
+#///////////////////////////////////////////////////////////////////////////////
+
+# ~ 0 ~
+# Retrieve data
+print2('Retrieving processing steps....')
+
+today = datetime.now()
+historyStartDate = (today - timedelta(days=historyDays)).strftime('%Y-%m-%d')
+reportStartDate = (today - timedelta(days=reportDays)).strftime('%Y-%m-%d')
+
+steps = cosas.get(
+  'cosasreports_processingsteps',
+  q=f'date=ge={historyStartDate}',
+  batch_size=10000
+)
+
+imports = cosas.get(
+  'cosasreports_imports',
+  q=f'date=ge={historyStartDate}',
+  batch_size=10000
+)
+
+#///////////////////////////////////////////////////////////////////////////////
+
+# ~ 1 ~
+# Analyse steps
+print2('Analysing', len(steps), 'processing steps....')
+
+trendsDT = analyseProcessingSteps(
+  steps=steps,
+  imports=imports,
+  window=window,
+  threshold=threshold
+)
+
+trendsDT = trendsDT[f.date >= reportStartDate, :]
+
+# print regressions
+regressionsDT = trendsDT[f.isRegression, :]
+for row in regressionsDT[:, ['date', 'name', 'databaseTable', 'elapsedTime', 'trailingMedian']].to_tuples():
+  print2(
+    f"Regression: '{row[1]}' ({row[2]}) took {row[3]} seconds on {row[0]}",
+    f"(median: {row[4]} seconds)"
+  )
+
+print2('Steps flagged as regression:', regressionsDT.nrows)
+
+#///////////////////////////////////////////////////////////////////////////////
+
+# ~ 2 ~
+# Import
+if trendsDT.nrows:
+  trendsDT['isRegression'] = trendsDT[:, dt.as_type(f.isRegression, dt.Type.str32)]
+  cosas.importDatatableAsCsv('cosasreports_processingsteptrends', trendsDT)
+
+cosas.logout()
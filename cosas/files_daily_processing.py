@@ -2,7 +2,7 @@
 # FILE: files_daily_processing.py
 # AUTHOR: David Ruvolo
 # CREATED: 2023-07-04
-# MODIFIED: 2023-07-04
+# MODIFIED: 2026-10-19
 # PURPOSE: script for daily processing of file metadata 
 # STATUS: stable
 # PACKAGES: **see below**
@@ -10,22 +10,31 @@
 #///////////////////////////////////////////////////////////////////////////////
 
 from cosastools.molgenis import Molgenis, print2
+from cosastools.files import (
+  normaliseFileMetadata,
+  getIdentifierIndex,
+  getIngestedFiles,
+  updateIngestedFiles,
+  isNewOrModified
+)
 from datatable import dt, f
 from datetime import datetime
-import re
-
-def getFileType(value): 
-  if re.search(r'(vcf.gz(.tbi)?)|(.vcf)|(vcf.bgz.tbi)$', value):
-    value = 'vcf'
-  elif re.search(r'.bam.cram$', value):
-    value = 'cram'
-  elif re.search(r'.bam$', value):
-    value = 'bam'
-  elif re.search(r'.fq.gz$', value):
-    value = 'fastq'
-  else:
-    value = None
-  return value
+from os import path
+
+# ~ OPTIONS ~
+# If `incremental` is True, only files that are not in umdm_files (or that
+# were modified since the last import) are processed. `cacheDir` is used to
+# store the ingested file identifiers and the subject- and sample identifiers
+# between runs. The identifiers are refreshed once they are older than
+# `identifierMaxAge` (hours) and the ingested files once they are older than
+# `ingestedMaxAge` (hours). Set `cacheDir` to None to retrieve the ingested
+# files and identifiers from COSAS on each run.
+incremental = True
+cacheDir = None
+identifierMaxAge = 24
+ingestedMaxAge = 168
+
+ingestedFilesCache = path.join(cacheDir, 'umdm_files.jay') if cacheDir else None
 
 #///////////////////////////////////////////////////////////////////////////////
 
@@ -52,24 +61,18 @@ print2('Retrieving metadata....')
 portaldata = dt.Frame(cosas.get('cosasportal_files',batch_size=10000))
 del portaldata['_href']
 
-# get patient IDs
-patientIDs = dt.Frame(
-  cosas.get(
-    'umdm_subjects',
-    attributes='subjectID',
-    batch_size=10000
-  )
-)['subjectID'].to_list()[0]
-
+# get patient- and sample IDs
+identifiers = getIdentifierIndex(cosas, cacheDir=cacheDir, maxAge=identifierMaxAge)
 
-# get sample IDs
-sampleIDs = dt.Frame(
-  cosas.get(
-    'umdm_samples',
-    attributes='sampleID',
-    batch_size=10000
+# get files that were previously imported
+if incremental:
+  print2('Retrieving previously imported files....')
+  ingestedFiles = getIngestedFiles(
+    cosas,
+    cacheFile=ingestedFilesCache,
+    maxAge=ingestedMaxAge
   )
-)['sampleID'].to_list()[0]
+  print2(f"Previously imported files: {len(ingestedFiles)}")
 
 #///////////////////////////////////////////////////////////////////////////////
 
@@ -83,42 +86,12 @@ for column in portaldata.names:
     del portaldata[column]
 
 
-# format dna nummer
-print2('Formatting DNAnr....')
-portaldata['belongsToSample'] = dt.Frame([
-  re.sub(r'^(DNA)', 'DNA-', d)
-  for d in portaldata['dnaID'].to_list()[0]
-])
-
-# recode missing or blank file names
-print2('Recoding missing filenames....')
-portaldata['filename'] = dt.Frame([
-  None if value == 'N/A' else value
-  for value in portaldata['filename'].to_list()[0]
-])
-
-# remove instances of 2 or more slashes
-print2('Formatting filepaths....')
-portaldata['filepath'] = dt.Frame([
-  re.sub(r'\/{2,}', '/', d)
-  for d in portaldata['filepath'].to_list()[0]
-])
-
-# recode file formats
+# format DNA number (belongsToSample), recode missing or blank file names,
+# remove instances of 2 or more slashes, recode file formats, and create the
+# file identifier (filepath + filename)
 # portaldata[:, dt.count(), dt.by(f.fileFormat)]
-print2('Recoding file format....')
-portaldata['fileFormat'] = dt.Frame([
-  getFileType(value) if value else value
-  for value in portaldata['filename'].to_list()[0]
-])
-
-
-# create file identifier
-print2('Generating table identifiers')
-portaldata['fileID'] = dt.Frame([
-  ''.join(row) if all(row) else None
-  for row in portaldata[:, ['filepath', 'filename']].to_tuples()
-])
+print2('Normalising file metadata....')
+portaldata = normaliseFileMetadata(portaldata)
 
 # drop empty rows
 print2('Removing records where a file ID cannot be created....')
@@ -132,6 +105,14 @@ print2(f"New row count: {portaldata.nrows}")
 if dt.unique(portaldata['fileID']).nrows != portaldata.nrows:
   raise SystemError('Number of unique file IDs must equal total possible rows')
 
+# select new and modified files
+if incremental:
+  print2('Selecting new or modified files....')
+  portaldata['isNewOrModified'] = dt.Frame(isNewOrModified(portaldata, ingestedFiles))
+  portaldata = portaldata[f.isNewOrModified, :]
+  del portaldata['isNewOrModified']
+  print2(f"New row count: {portaldata.nrows}")
+
 #///////////////////////////////////////////////////////////////////////////////
 
 # ~ 2 ~
@@ -143,14 +124,14 @@ if dt.unique(portaldata['fileID']).nrows != portaldata.nrows:
 # check incoming patient IDs
 print2('Validating incoming patientIDs....')
 portaldata['patientIdExists'] = dt.Frame([
-  value in patientIDs for value in portaldata['umcgID'].to_list()[0]
-])
+  value in identifiers['subjects'] for value in portaldata['umcgID'].to_list()[0]
+], type=dt.Type.bool8)
 
 # check incoming sample IDs
 print2('Validating incoming sampleIDs....')
 portaldata['sampleIdExists'] = dt.Frame([
-  value in sampleIDs for value in portaldata['belongsToSample'].to_list()[0]
-])
+  value in identifiers['samples'] for value in portaldata['belongsToSample'].to_list()[0]
+], type=dt.Type.bool8)
 
 #///////////////////////////////////////
  
@@ -176,5 +157,11 @@ umdm_files['recordCreatedBy'] = 'cosasbot'
 
 # ~ 3 ~
 # import
-cosas.importDatatableAsCsv('umdm_files', umdm_files)
+if umdm_files.nrows:
+  response = cosas.importDatatableAsCsv('umdm_files', umdm_files)
+  if incremental and (response.status_code // 100) == 2:
+    updateIngestedFiles(ingestedFiles, umdm_files, cacheFile=ingestedFilesCache)
+else:
+  print2('No new or modified files to import')
+
 cosas.logout()
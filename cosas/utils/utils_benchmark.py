@@ -0,0 +1,92 @@
+#///////////////////////////////////////////////////////////////////////////////
+# FILE: utils_benchmark.py
+# AUTHOR: David Ruvolo
+# CREATED: 2026-10-19
+# MODIFIED: 2026-10-19
+# PURPOSE: benchmark COSAS jobs against synthetic data
+# STATUS: experimental
+# PACKAGES: cosastools, datatable
+# COMMENTS: Runs the daily mappings, consent mappings, file processing,
+# Cartagenia ingest, VIP samplesheets, and Alissa variants jobs against local
+# servers with synthetic data (see cosastools.benchmark). Wall time, peak
+# memory usage, and rows per second are recorded for each job and scale.
+# Results are compared with the baseline and the script exits with an error
+# if a job regresses beyond the thresholds, the absolute tolerances, and the
+# noise of the repeated runs. Run from the root of the
+# repository, e.g., `python cosas/utils/utils_benchmark.py`.
+#///////////////////////////////////////////////////////////////////////////////
+
+from cosastools.benchmark import (
+  runBenchmarks,
+  compareResults,
+  readResults,
+  writeResults,
+  defaultThresholds,
+  defaultTolerances,
+  defaultMinSeconds
+)
+from cosastools.molgenis import print2
+import sys
+
+# jobs to run (None runs all jobs), number of subjects in the synthetic data,
+# and the number of runs per job (the median of the runs is kept). Smaller
+# scales finish in less than a second, which is mostly start up time.
+jobs = None
+scales = [10000, 50000]
+repeat = 5
+seed = 1
+timeout = 3600
+
+# maximum relative change of wall time and memory used by the job before a
+# job is considered a regression (e.g., 0.2 is 20%). Changes smaller than the
+# tolerances (seconds and megabytes) or `noise` times the median absolute
+# deviation of the runs are ignored, and the wall time of jobs that run for
+# less than `minSeconds` is not compared.
+thresholds = dict(defaultThresholds)
+tolerances = dict(defaultTolerances)
+minSeconds = defaultMinSeconds
+noise = 3.0
+
+# location of the baseline and the results of this run. Set `updateBaseline`
+# to True to save the results as the new baseline (e.g., after a change that
+# is expected to change performance).
+baselineFile = 'benchmarks/baseline.json'
+resultsFile = 'benchmarks/results.json'
+updateBaseline = False
+
+# jobs are run in new processes that import this file, so the benchmark is
+# only run in the main process
+if __name__ == '__main__':
+  results = runBenchmarks(
+    names=jobs,
+    scales=scales,
+    repeat=repeat,
+    seed=seed,
+    repoDir='.',
+    timeout=timeout
+  )
+  writeResults(results, resultsFile)
+
+  baseline = readResults(baselineFile)
+  if updateBaseline or baseline is None:
+    print2('Saving results as baseline:', baselineFile)
+    writeResults(results, baselineFile)
+    baseline = results
+
+  regressions = compareResults(
+    results,
+    baseline,
+    thresholds=thresholds,
+    tolerances=tolerances,
+    minSeconds=minSeconds,
+    noise=noise
+  )
+  for regression in regressions:
+    print2(
+      f"Regression in {regression['id']} ({regression['metric']}):",
+      regression['baseline'], '->', regression['value']
+    )
+
+  if regressions:
+    sys.exit(1)
+  print2('No regressions found')
@@ -0,0 +1,34 @@
+#///////////////////////////////////////////////////////////////////////////////
+# FILE: utils_create_snapshot.py
+# AUTHOR: David Ruvolo
+# CREATED: 2026-10-19
+# MODIFIED: 2026-10-19
+# PURPOSE: create a local snapshot of the portal, mapping, and umdm tables
+# STATUS: experimental
+# PACKAGES: cosastools, datatable
+# COMMENTS: The snapshot can be used in place of the Molgenis class to run
+# and benchmark scripts offline, e.g.,
+#
+#   from cosastools.snapshot import MolgenisSnapshot
+#   db = MolgenisSnapshot('snapshots/cosas', outputDir='snapshots/imports')
+#
+#///////////////////////////////////////////////////////////////////////////////
+
+from cosastools.molgenis import Molgenis
+from cosastools.snapshot import createSnapshot
+from dotenv import load_dotenv
+from os import environ
+load_dotenv()
+
+# tables that start with one of these prefixes are included in the snapshot
+prefixes = ['cosasportal_', 'cosasmappings_', 'umdm_']
+outputDir = 'snapshots/cosas'
+
+db = Molgenis(url=environ['MOLGENIS_ACC_HOST'])
+db.login(environ['MOLGENIS_ACC_USR'], environ['MOLGENIS_ACC_PWD'])
+
+manifest = createSnapshot(session=db, outputDir=outputDir, prefixes=prefixes)
+db.logout()
+
+for entity, table in manifest['entities'].items():
+  print(f"{entity}: {table['rows']} rows")
@@ -0,0 +1,36 @@
+#///////////////////////////////////////////////////////////////////////////////
+# FILE: utils_create_synthetic_snapshot.py
+# AUTHOR: David Ruvolo
+# CREATED: 2026-10-19
+# MODIFIED: 2026-10-19
+# PURPOSE: create a snapshot of synthetic portal data for benchmarking
+# STATUS: experimental
+# PACKAGES: cosastools, datatable
+# COMMENTS: Generates the ADLAS, Darwin, and Cartagenia exports (cosasportal)
+# at production scale (with the default ratios, a subject has roughly 4.5
+# rows across all tables; 2.2M subjects is around 10M rows). Use the snapshot
+# in the daily mappings script, e.g.,
+#
+#   from cosastools.snapshot import MolgenisSnapshot
+#   db = MolgenisSnapshot('snapshots/synthetic', outputDir='snapshots/imports')
+#
+#///////////////////////////////////////////////////////////////////////////////
+
+from cosastools.synthetic import writePortalSnapshot
+
+# number of subjects, random seed, and fraction of dirty values
+subjects = 10000
+seed = 1
+dirty = 0.02
+outputDir = 'snapshots/synthetic'
+
+manifest = writePortalSnapshot(
+  outputDir=outputDir,
+  subjects=subjects,
+  seed=seed,
+  lookupsDir='lookups',
+  dirty=dirty
+)
+
+for entity, table in manifest['entities'].items():
+  print(f"{entity}: {table['rows']} rows")
@@ -0,0 +1,456 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qsl
+from datetime import datetime, timedelta
+import threading
+import random
+import json
+import time
+import uuid
+import os
+
+_genes = [
+  ('BRCA1', 'NM_007294.4', '17'), ('BRCA2', 'NM_000059.4', '13'),
+  ('MYH7', 'NM_000257.4', '14'), ('TTN', 'NM_001267550.2', '2'),
+  ('SCN5A', 'NM_198056.3', '3'), ('KCNQ1', 'NM_000218.3', '11'),
+  ('FBN1', 'NM_000138.5', '15'), ('CFTR', 'NM_000492.4', '7'),
+  ('DMD', 'NM_004006.3', 'X'), ('PKD1', 'NM_001009944.3', '16'),
+  ('LMNA', 'NM_170707.4', '1'), ('MLH1', 'NM_000249.4', '3')
+]
+
+_classifications = [
+  'Pathogenic', 'Likely pathogenic', 'VOUS', 'Likely benign', 'Benign', None
+]
+
+
+def _date(rng, start: str = '2019-01-01', days: int = 1800):
+  """Random ISO 8601 date time"""
+  value = datetime.fromisoformat(start) + timedelta(
+    days=rng.randrange(days),
+    seconds=rng.randrange(86400)
+  )
+  return value.strftime('%Y-%m-%dT%H:%M:%S.000+0000')
+
+
+def generateAlissaData(
+  subjects: list = None,
+  patients: int = 100,
+  analyses: tuple = (1, 3),
+  variants: tuple = (0, 30),
+  inheritance: float = 0.25,
+  seed: int = 1
+):
+  """Generate Alissa data
+  Create synthetic patients, analyses, and inheritance analyses in the
+  format that is returned by the Alissa Interpret Public API (v5.3). Only the
+  number of variants per analysis is stored; variants are generated when an
+  export is requested (see `generateVariants`), so large datasets can be
+  served without keeping all variants in memory. Analyses without variants
+  behave like analyses without an export (404).
+
+  @param subjects optional list of tuples (umcgNr, familieNr). If None,
+    subjects are generated. The accession number is `familieNr_umcgNr`.
+  @param patients number of patients to generate if subjects is None
+  @param analyses minimum and maximum number of analyses per patient
+  @param variants minimum and maximum number of variants per analysis
+  @param inheritance fraction of patients that have an inheritance analysis
+  @param seed random seed
+
+  @return dict
+  """
+  rng = random.Random(seed)
+  if subjects is None:
+    subjects = []
+    for index in range(patients):
+      family = f"F{rng.randrange(max(patients // 2, 1)):07d}"
+      subjects.append((f"{1000000 + index}", family))
+
+  data = {'patients': [], 'analyses': {}, 'inheritance': {}, 'variants': {}}
+  analysisId = 10000
+  for index, (umcgNr, familieNr) in enumerate(subjects):
+    patientId = 1000 + index
+    created = _date(rng)
+    data['patients'].append({
+      'id': patientId,
+      'accessionNumber': f"{familieNr}_{umcgNr}",
+      'familyIdentifier': familieNr,
+      'gender': rng.choice(['MALE', 'FEMALE', 'UNKNOWN']),
+      'comments': rng.choice([None, '', 'Sample received from external lab']),
+      'createdBy': 'cosas-api',
+      'createdOn': created,
+      'lastUpdatedBy': 'cosas-api',
+      'lastUpdatedOn': created,
+      'folderName': rng.choice(['Default', 'Exome', 'Cardio', 'Oncogenetics'])
+    })
+
+    data['analyses'][patientId] = []
+    for _ in range(rng.randint(*analyses)):
+      analysisId += 1
+      data['analyses'][patientId].append({
+        'id': analysisId,
+        'reference': f"{umcgNr}_{rng.randrange(100000, 999999)}",
+        'analysisType': 'PATIENT',
+        'status': rng.choices(['COMPLETED', 'IN_PROGRESS', 'FAILED'], [8, 1, 1])[0],
+        'targetPanelNames': rng.sample(['Cardio', 'Exome', 'Oncology', 'Neuro'], rng.randint(1, 2)),
+        'genomeBuild': rng.choice(['GRCh37', 'GRCh38']),
+        'createdBy': 'cosas-api',
+        'createdOn': created,
+        'lastUpdatedBy': 'cosas-api',
+        'lastUpdatedOn': _date(rng),
+        'patientId': patientId
+      })
+      data['variants'][analysisId] = rng.randint(*variants)
+
+    if rng.random() < inheritance:
+      analysisId += 1
+      parents = [
+        1000 + (index + 1 + rng.randrange(len(subjects) - 1)) % len(subjects)
+        for _ in range(2)
+      ] if len(subjects) > 1 else []
+      record = {
+        'id': analysisId,
+        'reference': f"{umcgNr}_trio",
+        'analysisType': 'INHERITANCE',
+        'status': 'COMPLETED',
+        'targetPanelNames': ['Exome'],
+        'genomeBuild': 'GRCh37',
+        'createdBy': 'cosas-api',
+        'createdOn': created,
+        'lastUpdatedBy': 'cosas-api',
+        'lastUpdatedOn': _date(rng),
+        'patientId': patientId,
+        'maternalPatientId': parents[0] if parents else None,
+        'paternalPatientId': parents[1] if parents else None
+      }
+      data['analyses'][patientId].append(dict(record))
+      data['inheritance'][analysisId] = record
+      data['variants'][analysisId] = rng.randint(*variants)
+
+  return data
+
+
+def generateVariants(analysisId: int, count: int, seed: int = 1):
+  """Generate variants
+  Create the molecular variant export of an analysis. The nested attributes
+  (assessments, database references, classification tree, custom fields,
+  external databases, and platform datasets) follow the structure of the
+  export so that the flattening in the Alissa scripts can be benchmarked.
+
+  @param analysisId identifier of the analysis
+  @param count number of variants
+  @param seed random seed (combined with the analysis identifier)
+
+  @return list of dictionaries
+  """
+  rng = random.Random(f"{seed}-{analysisId}")
+  records = []
+  for _ in range(count):
+    gene, transcript, chromosome = rng.choice(_genes)
+    start = rng.randrange(100000, 150000000)
+    reference, alternative = rng.sample(['A', 'C', 'G', 'T'], 2)
+    classification = rng.choice(_classifications)
+    position = rng.randrange(1, 9000)
+    records.append({
+      'chromosome': chromosome,
+      'start': start,
+      'stop': start,
+      'reference': reference,
+      'alternative': alternative,
+      'gene': gene,
+      'transcript': transcript,
+      'cDotNotation': f"c.{position}{reference}>{alternative}",
+      'pDotNotation': rng.choice([None, f"p.(Arg{position // 3}Ter)", f"p.(Gly{position // 3}Ser)"]),
+      'exon': str(rng.randint(1, 60)),
+      'zygosity': rng.choice(['HETEROZYGOUS', 'HOMOZYGOUS', 'HEMIZYGOUS']),
+      'classification': classification,
+      'markedForReview': True,
+      'markedIncludeInReport': rng.random() < 0.3,
+      'variantAssessment': {
+        'id': rng.randrange(100000),
+        'classification': classification,
+        'lastUpdatedOn': _date(rng),
+        'lastUpdatedBy': rng.choice(['lab-user-1', 'lab-user-2'])
+      } if classification else None,
+      'variantAssessmentLabels': rng.choice([[], 'Reviewed', 'Reviewed, Reported']),
+      'variantAssessmentNotes': rng.choice([[], 'Segregates with disease <br> - see report']),
+      'geneProfileReport': {'gene': gene, 'inheritance': rng.choice(['AD', 'AR', 'XL'])},
+      'databaseReferences': {
+        'dbSNP': rng.choice([None, f"rs{rng.randrange(10**7, 10**9)}"]),
+        'clinVar': rng.choice([None, str(rng.randrange(10**5, 10**6))]),
+        'omim': rng.choice([None, str(rng.randrange(10**5, 7 * 10**5))])
+      },
+      'classificationTreeLabelsScore': {
+        'labels': rng.sample(['PVS1', 'PS1', 'PM2', 'PP3', 'BP4', 'BS1'], rng.randint(0, 3)),
+        'score': rng.randint(-5, 12)
+      },
+      'customFields': rng.choice([{}, {'Panel version': f"v{rng.randint(1, 9)}", 'Lab note': 'n/a'}]),
+      'externalDatabases': {
+        'gnomAD (exomes)': {
+          'alleleFrequency': round(rng.random() / 100, 6),
+          'homozygotes': rng.randint(0, 10)
+        },
+        'ClinVar': {
+          'clinicalSignificance': rng.choice(['Pathogenic', 'Uncertain significance', 'Benign'])
+        } if rng.random() < 0.5 else {}
+      },
+      'platformDatasets': {
+        'UMCG In-house frequency': {
+          'count': rng.randint(0, 200),
+          'frequency': round(rng.random() / 10, 6)
+        },
+        'Disease-specific': {} if rng.random() < 0.5 else {'hits': rng.randint(1, 5)}
+      }
+    })
+  return records
+
+
+class AlissaServer:
+  """Alissa Server
+  A local stand-in for the endpoints of the Alissa Interpret Public API that
+  are used by the Alissa class (oauth token, patients, analyses, inheritance
+  analyses, and molecular variant exports). Data is generated using
+  `generateAlissaData` and the server runs in a background thread, e.g.,
+  `Alissa(host=server.url, clientId='cosas', clientSecret='cosas',
+  username='cosas', password='cosas')`.
+
+  The oauth client refuses plain http, so OAUTHLIB_INSECURE_TRANSPORT is set
+  when the server is started.
+  """
+  def __init__(
+    self,
+    data: dict = None,
+    seed: int = 1,
+    latency: float = 0.0,
+    rowLatency: float = 0.0,
+    host: str = '127.0.0.1',
+    port: int = 0,
+    **kwargs
+  ):
+    """Alissa Server
+    @param data output of `generateAlissaData`. If None, data is generated
+      using the seed and **kwargs
+    @param seed random seed for generated data and variants
+    @param latency seconds added to each request
+    @param rowLatency seconds added per record that is returned
+    @param host host to bind the server to
+    @param port port to bind the server to (0 selects a free port)
+    @param **kwargs arguments passed to `generateAlissaData`
+    """
+    self.data = data or generateAlissaData(seed=seed, **kwargs)
+    self.seed = seed
+    self.latency = latency
+    self.rowLatency = rowLatency
+    self.host = host
+    self.port = port
+    self.token = uuid.uuid4().hex
+    self.requests = []
+    self.exports = {}
+    self._lock = threading.Lock()
+    self._server = None
+    self._thread = None
+    self._analyses = {
+      analysis['id']: analysis
+      for records in self.data['analyses'].values()
+      for analysis in records
+    }
+    self._patients = {patient['id']: patient for patient in self.data['patients']}
+
+  @property
+  def url(self):
+    return f"http://{self.host}:{self.port}"
+
+  def start(self):
+    """Start the server in a background thread
+    @return AlissaServer
+    """
+    server = self
+    class Handler(_AlissaRequestHandler):
+      alissa = server
+
+    os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
+    self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+    self._server.daemon_threads = True
+    self.port = self._server.server_address[1]
+    self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+    self._thread.start()
+    return self
+
+  def stop(self):
+    """Stop the server"""
+    if self._server:
+      self._server.shutdown()
+      self._server.server_close()
+      self._thread.join()
+      self._server = None
+
+  def __enter__(self):
+    return self.start()
+
+  def __exit__(self, *args):
+    self.stop()
+
+  def getPatients(self, params: dict):
+    """Filter patients
+    The accession number matches partially (as in Alissa); dates are compared
+    as ISO 8601 strings.
+
+    @param params query parameters
+    @return list of dictionaries
+    """
+    patients = self.data['patients']
+    filters = {
+      'accessionNumber': lambda patient, value: value in patient['accessionNumber'],
+      'familyIdentifier': lambda patient, value: patient['familyIdentifier'] == value,
+      'createdBy': lambda patient, value: patient['createdBy'] == value,
+      'lastUpdatedBy': lambda patient, value: patient['lastUpdatedBy'] == value,
+      'createdAfter': lambda patient, value: patient['createdOn'] > value,
+      'createdBefore': lambda patient, value: patient['createdOn'] < value,
+      'lastUpdatedAfter': lambda patient, value: patient['lastUpdatedOn'] > value,
+      'lastUpdatedBefore': lambda patient, value: patient['lastUpdatedOn'] < value
+    }
+    for name, value in params.items():
+      if name in filters:
+        patients = [patient for patient in patients if filters[name](patient, value)]
+    return patients
+
+  def requestExport(self, analysisId: int, inheritance: bool = False):
+    """Request a variant export
+    @param analysisId identifier of the analysis
+    @param inheritance if True, the analysis must be an inheritance analysis
+    @return export identifier or None if the analysis does not have variants
+    """
+    analysis = self._analyses.get(analysisId)
+    if not analysis or (analysis['analysisType'] == 'INHERITANCE') != inheritance:
+      return None
+    if not self.data['variants'].get(analysisId):
+      return None
+
+    exportId = str(uuid.UUID(int=random.Random(f"{self.seed}-export-{analysisId}").getrandbits(128)))
+    with self._lock:
+      self.exports[exportId] = analysisId
+    return exportId
+
+
+class _AlissaRequestHandler(BaseHTTPRequestHandler):
+  """Request handler for AlissaServer"""
+  alissa = None
+  protocol_version = 'HTTP/1.1'
+  disable_nagle_algorithm = True
+
+  def log_message(self, *args):
+    pass
+
+  def _send(self, status: int, body=None):
+    content = json.dumps(body).encode('utf-8') if body is not None else b''
+    self.send_response(status)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(content)))
+    self.end_headers()
+    self.wfile.write(content)
+    self.status = status
+
+  def _notFound(self, message: str):
+    self._send(404, {'errorCode': 'NOT_FOUND', 'message': message})
+
+  def _records(self, records):
+    count = len(records) if isinstance(records, list) else 1
+    time.sleep(self.alissa.rowLatency * count)
+    self._send(200, records)
+
+  def _handle(self, method: str):
+    server = self.alissa
+    started = time.perf_counter()
+    self.status = None
+    length = int(self.headers.get('Content-Length') or 0)
+    content = self.rfile.read(length) if length else b''
+    url = urlparse(self.path)
+    params = dict(parse_qsl(url.query))
+    time.sleep(server.latency)
+
+    try:
+      if url.path == '/auth/oauth/token' and method == 'POST':
+        form = dict(parse_qsl(content.decode('utf-8')))
+        if form.get('grant_type') != 'password' or not form.get('username'):
+          self._send(400, {'error': 'invalid_grant'})
+        else:
+          self._send(200, {
+            'access_token': server.token,
+            'token_type': 'bearer',
+            'expires_in': 3600,
+            'scope': 'read write'
+          })
+        return
+
+      if self.headers.get('Authorization') != f"Bearer {server.token}":
+        self._send(401, {'error': 'unauthorized'})
+        return
+
+      prefix = '/interpret/api/2/'
+      if not url.path.startswith(prefix):
+        self._notFound(f"No endpoint {method} {url.path}")
+        return
+
+      parts = url.path[len(prefix):].strip('/').split('/')
+      self._route(method, parts, params)
+    finally:
+      with server._lock:
+        server.requests.append({
+          'method': method,
+          'path': url.path,
+          'status': self.status,
+          'elapsed': round(time.perf_counter() - started, 6)
+        })
+
+  def _route(self, method: str, parts: list, params: dict):
+    server = self.alissa
+    def toId(value):
+      return int(value) if value.isdigit() else None
+
+    if method == 'GET' and parts == ['patients']:
+      self._records(server.getPatients(params))
+    elif method == 'GET' and parts[0] == 'patients' and len(parts) in (2, 3):
+      patient = server._patients.get(toId(parts[1]))
+      if patient is None:
+        self._notFound(f"Patient {parts[1]} not found")
+      elif len(parts) == 2:
+        self._records(patient)
+      elif parts[2] == 'analyses':
+        self._records(server.data['analyses'].get(patient['id'], []))
+      else:
+        self._notFound(f"No endpoint {method} {self.path}")
+    elif method == 'GET' and parts[0] == 'inheritance_analyses' and len(parts) == 2:
+      analysis = server.data['inheritance'].get(toId(parts[1]))
+      if analysis is None:
+        self._notFound(f"Inheritance analysis {parts[1]} not found")
+      else:
+        self._records(analysis)
+    elif (
+      parts[0] in ('patient_analyses', 'inheritance_analyses')
+      and parts[2:4] == ['molecular_variants', 'exports']
+    ):
+      analysisId = toId(parts[1])
+      inheritance = parts[0] == 'inheritance_analyses'
+      if method == 'POST' and len(parts) == 4:
+        exportId = server.requestExport(analysisId, inheritance)
+        if exportId is None:
+          self._notFound(f"No molecular variants found for analysis {parts[1]}")
+        else:
+          self._send(200, {'exportId': exportId})
+      elif method == 'GET' and len(parts) == 5:
+        if server.exports.get(parts[4]) != analysisId:
+          self._notFound(f"Export {parts[4]} not found")
+        else:
+          self._records(generateVariants(
+            analysisId=analysisId,
+            count=server.data['variants'][analysisId],
+            seed=server.seed
+          ))
+      else:
+        self._notFound(f"No endpoint {method} {self.path}")
+    else:
+      self._notFound(f"No endpoint {method} {self.path}")
+
+  def do_GET(self):
+    self._handle('GET')
+
+  def do_POST(self):
+    self._handle('POST')
@@ -0,0 +1,648 @@
+from cosastools.molgenis import Molgenis, now, print2
+from cosastools.logger import peakMemoryUsage
+from cosastools.molgenisserver import MolgenisServer
+from cosastools.alissaserver import AlissaServer, generateAlissaData
+from cosastools.synthetic import (
+  generatePortalData,
+  generateCartageniaPayload,
+  generateConsentData,
+  generateFileListings
+)
+from cosastools.files import formatDnaId
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from os import path, makedirs
+import multiprocessing
+import statistics
+import ast
+import tempfile
+import threading
+import resource
+import runpy
+import json
+import time
+import traceback
+import os
+
+# columns of `alissa_variantexports` (sys_md_Attribute)
+_alissaVariantColumns = [
+  'id', 'analysisReference', 'umcgNr', 'gene', 'chromosome', 'start', 'stop',
+  'reference', 'transcript', 'exon', 'genomeBuild', 'targetPanelNames',
+  'zygosity', 'classification', 'classificationTreeLabels',
+  'databaseReferences_dbSNP', 'customFields', 'geneProfileReport',
+  'accessionNumber', 'patientId', 'analysisId', 'variantExportId',
+  'dateFirstRun', 'dateLastUpdated'
+]
+
+# maximum relative change before a result is considered a regression. Memory
+# is compared using the memory used by the job (the peak memory usage minus the
+# memory of the interpreter and imported packages at the start of the job).
+# Rows per second is not compared by default, as it only differs from the
+# wall time if the synthetic data changes.
+defaultThresholds = {
+  'seconds': 0.2,
+  'jobMemoryMb': 0.2
+}
+
+# absolute changes that are never considered a regression (e.g., a job that
+# takes 0.5 seconds longer or uses 20MB more memory)
+defaultTolerances = {
+  'seconds': 1.0,
+  'jobMemoryMb': 20.0
+}
+
+# wall time and rows per second are not compared for jobs that run faster than
+# this number of seconds (start up time and scheduling dominate these runs)
+defaultMinSeconds = 2.0
+
+
+def _portalRows(portal: dict):
+  return sum(len(rows) for entity, rows in portal.items() if entity.startswith('cosasportal_'))
+
+
+def _umdmTables(portal: dict):
+  """Build umdm tables
+  Create the tables that the daily mappings produce (subjects, samples,
+  sample preparation, sequencing, clinical, and files) from synthetic portal
+  data. References are returned as identifiers.
+
+  @param portal output of `generatePortalData`
+  @return dict of table identifiers and arguments for MolgenisServer.addTable
+  """
+  gender = {'Man': 'assigned male at birth', 'Vrouw': 'assigned female at birth'}
+  subjectIDs = set()
+  subjects = []
+  for row in portal['cosasportal_patients']:
+    if row['UMCG_NUMBER'] in subjectIDs:
+      continue
+    subjectIDs.add(row['UMCG_NUMBER'])
+    subjects.append({
+      'subjectID': row['UMCG_NUMBER'],
+      'belongsToFamily': row.get('FAMILIENUMMER'),
+      'belongsToMother': row.get('UMCG_MOEDER'),
+      'belongsToFather': row.get('UMCG_VADER'),
+      'genderAtBirth': gender.get(row.get('GESLACHT')),
+      'yearOfBirth': int(row['GEBOORTEDATUM'][-4:]) if row.get('GEBOORTEDATUM') else None
+    })
+
+  samples, samplePreparation, sequencing, files = [], [], [], []
+  families = {row['UMCG_NUMBER']: row.get('FAMILIENUMMER') for row in portal['cosasportal_patients']}
+  codes = [
+    row['code'] for row in portal['umdm_labProcedures']
+    if 'exoom' in row.get('description', '').lower()
+  ] or [row['code'] for row in portal['umdm_labProcedures']]
+  for row in portal['cosasportal_samples']:
+    if row['UMCG_NUMMER'] not in subjectIDs:
+      continue
+    sampleID = formatDnaId(row['DNA_NUMMER'])
+    samples.append({'sampleID': sampleID, 'belongsToSubject': row['UMCG_NUMMER']})
+
+    # family members are tested using the same lab procedure
+    family = families.get(row['UMCG_NUMMER'])
+    code = codes[int(family) % len(codes)] if family and family.strip().isdigit() else None
+    samplePreparation.append({
+      'samplePreparationID': f"{sampleID}_{row['ADVVRG_ID']}",
+      'belongsToSample': sampleID,
+      'belongsToLabProcedure': code
+    })
+    sequencing.append({
+      'sequencingID': f"{sampleID}_{row['ADVVRG_ID']}",
+      'belongsToLabProcedure': code,
+      'referenceGenomeUsed': 'GRCh37'
+    })
+    for extension, fileFormat in [('.vcf.gz', 'vcf'), ('.bam.cram', 'cram')]:
+      fileName = f"{sampleID}_{row['UMCG_NUMMER']}{extension}"
+      files.append({
+        'fileID': f"/groups/umcg-gd/prm05/{fileName}",
+        'belongsToSubject': row['UMCG_NUMMER'],
+        'fileName': fileName,
+        'filePath': '/groups/umcg-gd/prm05',
+        'fileFormat': fileFormat
+      })
+
+  clinical = [
+    {
+      'clinicalID': row['subjectID'],
+      'belongsToSubject': row['subjectID'],
+      'observedPhenotype': row['observedPhenotype'].split(',')
+    }
+    for row in portal['cosasportal_cartagenia']
+    if row['subjectID'] in subjectIDs
+  ]
+
+  return {
+    'umdm_subjects': {
+      'rows': subjects,
+      'refs': {
+        'belongsToMother': 'umdm_subjects',
+        'belongsToFather': 'umdm_subjects',
+        'genderAtBirth': 'umdm_lookups_genderAtBirth'
+      }
+    },
+    'umdm_lookups_genderAtBirth': {
+      'rows': [{'value': value} for value in gender.values()]
+    },
+    'umdm_samples': {
+      'rows': samples,
+      'refs': {'belongsToSubject': 'umdm_subjects'}
+    },
+    'umdm_samplePreparation': {
+      'rows': samplePreparation,
+      'refs': {'belongsToSample': 'umdm_samples', 'belongsToLabProcedure': 'umdm_labProcedures'}
+    },
+    'umdm_sequencing': {
+      'rows': sequencing,
+      'refs': {
+        'belongsToLabProcedure': 'umdm_labProcedures',
+        'referenceGenomeUsed': 'umdm_lookups_genomeBuild'
+      }
+    },
+    'umdm_lookups_genomeBuild': {'rows': [{'value': 'GRCh37'}]},
+    'umdm_lookups_phenotype': {
+      'rows': [{'code': code} for code in sorted({c for row in clinical for c in row['observedPhenotype']})]
+    },
+    'umdm_clinical': {
+      'rows': clinical,
+      'refs': {'belongsToSubject': 'umdm_subjects', 'observedPhenotype': 'umdm_lookups_phenotype'}
+    },
+    'umdm_files': {
+      'rows': files,
+      'refs': {'belongsToSubject': 'umdm_subjects'}
+    }
+  }
+
+
+def _setupDailyMappings(portal: dict, seed: int):
+  tables = {entity: {'rows': rows} for entity, rows in portal.items()}
+  for entity, idAttribute in [
+    ('umdm_subjects', 'subjectID'),
+    ('umdm_clinical', 'clinicalID'),
+    ('umdm_samples', 'sampleID'),
+    ('umdm_samplePreparation', 'samplePreparationID'),
+    ('umdm_sequencing', 'sequencingID'),
+    ('cosasreports_processingsteps', 'identifier'),
+    ('cosasreports_imports', 'identifier')
+  ]:
+    tables[entity] = {'rows': [], 'idAttribute': idAttribute}
+  return {'tables': tables, 'rows': _portalRows(portal)}
+
+
+def _setupConsentMappings(portal: dict, seed: int):
+  consent = generateConsentData(portal['cosasportal_patients'], seed=seed)
+  return {
+    'tables': {
+      'umdm_subjects': {
+        'rows': [{'subjectID': row['UMCG_NUMBER']} for row in portal['cosasportal_patients']]
+      },
+      'cosasportal_consent': {'rows': consent},
+      'umdm_signedconsents': {'rows': [], 'idAttribute': 'consentID'},
+      'umdm_consent': {'rows': [], 'idAttribute': 'consentID'}
+    },
+    'rows': len(consent)
+  }
+
+
+def _setupFilesProcessing(portal: dict, seed: int):
+  files = generateFileListings(portal['cosasportal_samples'], seed=seed)
+  return {
+    'tables': {
+      'cosasportal_files': {'rows': files},
+      'umdm_subjects': {
+        'rows': [{'subjectID': row['UMCG_NUMBER']} for row in portal['cosasportal_patients']]
+      },
+      'umdm_samples': {
+        'rows': [
+          {'sampleID': formatDnaId(row['DNA_NUMMER'])}
+          for row in portal['cosasportal_samples']
+        ]
+      },
+      'umdm_files': {'rows': [], 'idAttribute': 'fileID'}
+    },
+    'rows': len(files)
+  }
+
+
+def _setupCartagenia(portal: dict, seed: int):
+  payload = generateCartageniaPayload(portal['cosasportal_cartagenia'], seed=seed)
+  return {
+    'tables': {'cosasportal_cartagenia': {'rows': []}},
+    'cartagenia': payload,
+    'rows': len(ast.literal_eval(payload['Output']))
+  }
+
+
+def _setupVipSamplesheet(portal: dict, seed: int):
+  tables = _umdmTables(portal)
+  tables['umdm_labProcedures'] = {'rows': portal['umdm_labProcedures']}
+  tables['cosasexports_vip'] = {'rows': [], 'idAttribute': 'individual_id'}
+  return {'tables': tables, 'rows': len(tables['umdm_samplePreparation']['rows'])}
+
+
+def _setupAlissaVariants(portal: dict, seed: int):
+  subjects = [
+    (row['UMCG_NUMBER'], row.get('FAMILIENUMMER', 'F0'))
+    for row in portal['cosasportal_patients']
+    if 'F' not in row['UMCG_NUMBER']
+  ]
+  data = generateAlissaData(subjects=subjects[:max(len(subjects) // 10, 1)], seed=seed)
+  patients = [
+    {
+      'umcgNr': patient['accessionNumber'].split('_')[-1],
+      'famileNr': patient['familyIdentifier'],
+      'alissaInternalID': str(patient['id']),
+      'accessionNr': patient['accessionNumber'],
+      'hasError': False
+    }
+    for patient in data['patients']
+  ]
+  analyses = [
+    {
+      'id': f"{analysis['patientId']}_{analysis['id']}",
+      'patientId': str(analysis['patientId']),
+      'analysisId': str(analysis['id']),
+      'reference': analysis['reference'],
+      'analysisType': analysis['analysisType'],
+      'status': analysis['status'],
+      'genomeBuild': analysis['genomeBuild'],
+      'targetPanelNames': ','.join(analysis['targetPanelNames'])
+    }
+    for records in data['analyses'].values()
+    for analysis in records
+    if analysis['analysisType'] == 'PATIENT'
+  ]
+  return {
+    'tables': {
+      'alissa_patients': {'rows': patients},
+      'alissa_analyses': {'rows': analyses},
+      'alissa_variantexports': {'rows': [], 'idAttribute': 'id'},
+      'sys_md_Attribute': {
+        'rows': [
+          {'id': f"variantexports{index}", 'entity': 'alissa_variantexports', 'name': name, 'sequenceNr': index}
+          for index, name in enumerate(_alissaVariantColumns)
+        ]
+      }
+    },
+    'alissa': data,
+    'rows': sum(
+      data['variants'][int(analysis['analysisId'])] for analysis in analyses
+    )
+  }
+
+
+# benchmarked jobs: location of the script (relative to the repository) and a
+# function that creates the input tables from synthetic portal data
+jobs = {
+  'daily-mappings': {'script': 'cosas/cosas_daily_mappings.py', 'setup': _setupDailyMappings},
+  'consent-mappings': {'script': 'cosas/consent_mappings.py', 'setup': _setupConsentMappings},
+  'files-processing': {'script': 'cosas/files_daily_processing.py', 'setup': _setupFilesProcessing},
+  'cartagenia': {'script': 'cosas/cartagenia/cartagenia.py', 'setup': _setupCartagenia},
+  'vip-samplesheet': {'script': 'cosas/data_vip_samplesheet.py', 'setup': _setupVipSamplesheet},
+  'alissa-variants': {'script': 'cosas/alissa/alissa_get_variants.py', 'setup': _setupAlissaVariants}
+}
+
+
+class _JsonServer:
+  """Serve a JSON object on all paths (e.g., the Cartagenia endpoint)"""
+  def __init__(self, body: dict, host: str = '127.0.0.1'):
+    content = json.dumps(body).encode('utf-8')
+
+    class Handler(BaseHTTPRequestHandler):
+      def log_message(self, *args):
+        pass
+
+      def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    self._server = ThreadingHTTPServer((host, 0), Handler)
+    self._server.daemon_threads = True
+    self.url = f"http://{host}:{self._server.server_address[1]}/"
+    threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+  def stop(self):
+    self._server.shutdown()
+    self._server.server_close()
+
+
+def _peakMemory():
+  """Peak memory usage of the current process in megabytes
+  On Linux, the maximum resident set size (ru_maxrss) of a new process
+  includes the memory of the parent process at the time it was started, so
+  the peak of the current process (VmHWM) is used instead.
+  """
+  try:
+    with open('/proc/self/status', 'r') as file:
+      for line in file:
+        if line.startswith('VmHWM:'):
+          return int(line.split()[1]) / 1024
+  except OSError:
+    pass
+  return peakMemoryUsage()
+
+
+def _runScript(script: str, workDir: str, url: str, token: str, environ: dict, verbose: bool, queue):
+  """Run a script in a new process
+  All instances of cosastools.molgenis.Molgenis connect to the local server,
+  regardless of the url and token that are used in the script. The elapsed
+  time and peak memory usage (including processes started by the script)
+  are sent to the queue, as well as the memory usage before the script is
+  run (the interpreter and imported packages). If verbose is False, the
+  output is written to `output.log` in the working directory.
+  """
+  connect = Molgenis.__init__
+
+  def __init__(self, *args, **kwargs):
+    connect(self, url=f"{url}api/", token=token)
+
+  Molgenis.__init__ = __init__
+  os.environ.update(environ)
+  os.chdir(workDir)
+  if not verbose:
+    output = open('output.log', 'w')
+    os.dup2(output.fileno(), 1)
+    os.dup2(output.fileno(), 2)
+
+  result = {'status': 'Success', 'error': None, 'startMemoryMb': _peakMemory()}
+  start = time.perf_counter()
+  try:
+    runpy.run_path(script, run_name='__main__')
+  except BaseException as error:
+    traceback.print_exc()
+    result.update({'status': 'Error', 'error': f"{type(error).__name__}: {error}"})
+  result['seconds'] = time.perf_counter() - start
+  result['peakMemoryMb'] = max(
+    _peakMemory() or 0,
+    resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+  )
+  queue.put(result)
+
+
+def runJob(
+  job: str,
+  portal: dict,
+  repoDir: str = '.',
+  seed: int = 1,
+  timeout: float = None,
+  verbose: bool = False
+):
+  """Run job
+  Run a COSAS job against synthetic data. The input tables are served by a
+  local Molgenis server (and Alissa server or Cartagenia endpoint if the job
+  needs it) and the script is run in a new process in a temporary directory,
+  so that the peak memory usage only includes the job.
+
+  @param job name of the job (see `jobs`)
+  @param portal output of `cosastools.synthetic.generatePortalData`
+  @param repoDir location of the repository
+  @param seed random seed
+  @param timeout maximum number of seconds the job may run
+  @param verbose if False, the output of the job is not shown
+
+  @return dict with seconds, peakMemoryMb, jobMemoryMb, and rowsPerSecond
+  """
+  setup = jobs[job]['setup'](portal, seed)
+  script = path.abspath(path.join(repoDir, jobs[job]['script']))
+
+  molgenis = MolgenisServer()
+  for entity, table in setup['tables'].items():
+    molgenis.addTable(
+      entity,
+      table['rows'],
+      idAttribute=table.get('idAttribute'),
+      refs=table.get('refs')
+    )
+
+  servers = [molgenis.start()]
+  tokens = []
+  if setup.get('alissa'):
+    alissa = AlissaServer(data=setup['alissa'], seed=seed).start()
+    servers.append(alissa)
+    tokens.extend([
+      ('alissa-api-host', alissa.url),
+      ('alissa-api-client-id', 'cosas'),
+      ('alissa-api-client-secret', 'cosas'),
+      ('alissa-api-username', 'cosas'),
+      ('alissa-api-password', 'cosas')
+    ])
+  if setup.get('cartagenia'):
+    cartagenia = _JsonServer(setup['cartagenia'])
+    servers.append(cartagenia)
+    tokens.extend([('cartagenia-api-url', cartagenia.url), ('cartagenia-api-token', 'cosas')])
+
+  molgenis.addTable('sys_sec_Token', [
+    {'id': description, 'token': token, 'description': description}
+    for description, token in tokens
+  ], attributes=['id', 'token', 'description'])
+
+  environ = {
+    'MOLGENIS_ACC_HOST': f"{molgenis.url}api/",
+    'MOLGENIS_ACC_USR': 'admin',
+    'MOLGENIS_ACC_PWD': 'admin'
+  }
+
+  context = multiprocessing.get_context('spawn')
+  queue = context.Queue()
+  try:
+    with tempfile.TemporaryDirectory() as workDir:
+      process = context.Process(
+        target=_runScript,
+        args=(script, workDir, molgenis.url, molgenis.token, environ, verbose, queue)
+      )
+      process.start()
+      process.join(timeout)
+      timedOut = process.is_alive()
+      if timedOut:
+        process.terminate()
+        process.join()
+      result = queue.get() if not queue.empty() else {
+        'status': 'Error',
+        'error': f"Timeout after {timeout} seconds" if timedOut else f"Exit code {process.exitcode}",
+        'seconds': None,
+        'peakMemoryMb': None,
+        'startMemoryMb': None
+      }
+      logFile = path.join(workDir, 'output.log')
+      if result['status'] != 'Success' and path.exists(logFile):
+        with open(logFile, 'r') as file:
+          result['output'] = file.read()[-2000:]
+  finally:
+    for server in servers:
+      server.stop()
+
+  result.update({
+    'job': job,
+    'rows': setup['rows'],
+    'jobMemoryMb': (
+      result['peakMemoryMb'] - result['startMemoryMb']
+      if result['peakMemoryMb'] is not None and result['startMemoryMb'] is not None else None
+    ),
+    'rowsPerSecond': (
+      round(setup['rows'] / result['seconds'], 2)
+      if result['status'] == 'Success' and result['seconds'] else None
+    ),
+    'requests': len(molgenis.requests)
+  })
+  return result
+
+
+def summariseRuns(runs: list):
+  """Summarise runs
+  Combine repeated runs of a job into a single result. The median of each
+  metric is used, and the spread of the runs is recorded as the median
+  absolute deviation (e.g., `secondsMad`) so that regressions can be
+  compared with the noise of the measurements.
+
+  @param runs list of successful results of `runJob`
+  @return dict
+  """
+  result = dict(runs[0])
+  for metric in ['seconds', 'peakMemoryMb', 'jobMemoryMb']:
+    values = [run[metric] for run in runs if run.get(metric) is not None]
+    if not values:
+      result[metric] = None
+      continue
+    median = statistics.median(values)
+    result[metric] = round(median, 4)
+    result[f"{metric}Mad"] = round(statistics.median(abs(value - median) for value in values), 4)
+  result['rowsPerSecond'] = round(result['rows'] / result['seconds'], 2) if result['seconds'] else None
+  result['runs'] = len(runs)
+  return result
+
+
+def runBenchmarks(
+  names: list = None,
+  scales: list = [10000, 50000],
+  repeat: int = 5,
+  seed: int = 1,
+  repoDir: str = '.',
+  timeout: float = None,
+  verbose: bool = False
+):
+  """Run benchmarks
+  Run each job at several scales. Synthetic portal data is generated once
+  per scale and shared by all jobs. Each job is run `repeat` times and the
+  median of the runs is kept (see `summariseRuns`). The default scales are
+  large enough for most jobs to run for several seconds, so that the wall
+  time is not dominated by start up time.
+
+  @param names names of the jobs to run (see `jobs`). If None, all jobs are run.
+  @param scales number of subjects in the synthetic data
+  @param repeat number of times each job is run
+  @param seed random seed
+  @param repoDir location of the repository (used for the lookups and scripts)
+  @param timeout maximum number of seconds a job may run
+  @param verbose if True, the output of the jobs is shown
+
+  @return dict with the date and a list of results
+  """
+  names = names or list(jobs.keys())
+  results = []
+  for subjects in scales:
+    print2('Generating synthetic data for', subjects, 'subjects....')
+    portal = generatePortalData(
+      subjects=subjects,
+      seed=seed,
+      lookupsDir=path.join(repoDir, 'lookups')
+    )
+    for job in names:
+      runs = []
+      for _ in range(repeat):
+        runs.append(runJob(job, portal, repoDir=repoDir, seed=seed, timeout=timeout, verbose=verbose))
+        if runs[-1]['status'] != 'Success':
+          break
+
+      failed = [run for run in runs if run['status'] != 'Success']
+      result = failed[0] if failed else summariseRuns(runs)
+      result.update({'id': f"{job}-{subjects}", 'subjects': subjects})
+      print2(
+        f"{result['id']}: {result['status']}",
+        f"({result['seconds']}s, {result.get('jobMemoryMb')}MB, {result['rowsPerSecond']} rows/s)"
+      )
+      if failed:
+        print2(result['error'])
+      results.append(result)
+
+  return {'date': str(now(strftime=False)), 'results': results}
+
+
+def compareResults(
+  results: dict,
+  baseline: dict,
+  thresholds: dict = defaultThresholds,
+  tolerances: dict = defaultTolerances,
+  minSeconds: float = defaultMinSeconds,
+  noise: float = 3.0
+):
+  """Compare results
+  Compare benchmark results with a baseline. Wall time and memory usage
+  regress if they increase more than the threshold; rows per second regresses
+  if it decreases more than the threshold. Small changes are ignored: a
+  change must also be larger than the absolute tolerance of the metric and
+  larger than `noise` times the spread of both runs (see `summariseRuns`).
+  Wall time and rows per second are not compared for short jobs. Jobs that
+  fail always regress.
+
+  @param results output of `runBenchmarks`
+  @param baseline output of `runBenchmarks` (e.g., from the main branch)
+  @param thresholds maximum relative change of a metric (e.g., 0.2 is 20%).
+    Metrics without a threshold are not compared.
+  @param tolerances absolute change of a metric that is always accepted
+  @param minSeconds minimum wall time of the baseline to compare seconds and
+    rows per second
+  @param noise number of median absolute deviations a change must exceed
+
+  @return list of regressions (dictionaries)
+  """
+  reference = {result['id']: result for result in baseline.get('results', [])}
+  regressions = []
+  for result in results['results']:
+    if result['status'] != 'Success':
+      regressions.append({'id': result['id'], 'metric': 'status', 'baseline': None, 'value': result['error']})
+      continue
+    if result['id'] not in reference or reference[result['id']]['status'] != 'Success':
+      continue
+
+    previous = reference[result['id']]
+    for metric, threshold in thresholds.items():
+      old, new = previous.get(metric), result.get(metric)
+      if not old or new is None or threshold is None:
+        continue
+      if metric in ('seconds', 'rowsPerSecond') and (previous.get('seconds') or 0) < minSeconds:
+        continue
+
+      difference = (old - new) if metric == 'rowsPerSecond' else (new - old)
+      spread = noise * ((previous.get(f"{metric}Mad") or 0) + (result.get(f"{metric}Mad") or 0))
+      if difference > max(threshold * old, (tolerances or {}).get(metric) or 0, spread):
+        regressions.append({
+          'id': result['id'],
+          'metric': metric,
+          'baseline': old,
+          'value': new,
+          'change': round((new - old) / old, 4)
+        })
+  return regressions
+
+
+def writeResults(results: dict, file: str):
+  """Write results
+  @param results output of `runBenchmarks`
+  @param file location of the json file
+  """
+  directory = path.dirname(file)
+  if directory:
+    makedirs(directory, exist_ok=True)
+  with open(file, 'w') as stream:
+    json.dump(results, stream, indent=2)
+
+
+def readResults(file: str):
+  """Read results
+  @param file location of the json file
+  @return dict or NoneType if the file does not exist
+  """
+  if not path.exists(file):
+    return None
+  with open(file, 'r') as stream:
+    return json.load(stream)
@@ -1,6 +1,7 @@
 
-from datatable import dt
+from datatable import dt, f
 import pandas as pd
+import re
 
 def uniqueValuesById(data, groupby, column, dropDuplicates=True, keyGroupBy=True):
   """Unique Values By Id
@@ -24,4 +25,201 @@ def uniqueValuesById(data, groupby, column, dropDuplicates=True, keyGroupBy=True
   output = dt.Frame(df)
   if keyGroupBy:
     output.key = groupby
-  return output
\ No newline at end of file
+  return output
+
+def columnGroupsBySuffix(names: list, stubs: list, sep: str = '_', suffix: str = r'[0-9]+'):
+  """Column Groups By Suffix
+  Group columns that share a suffix (e.g., `md5_1` and `dateCreated_1`) for
+  use in `wideToLong`.
+
+  @param names list of column names (e.g., `data.names`)
+  @param stubs list of column names without separator and suffix
+  @param sep regular expression that separates the stub and the suffix
+  @param suffix regular expression that matches the suffix
+
+  @return dict of suffix and a dict of stub and column name
+  """
+  pattern = re.compile(
+    '^(' + '|'.join(map(re.escape, stubs)) + f')(?:{sep})({suffix})$'
+  )
+  groups = {}
+  for name in names:
+    match = pattern.search(name)
+    if match:
+      groups.setdefault(match.group(2), {})[match.group(1)] = name
+  return groups
+
+def wideToLong(data, groups: dict, idColumns=None, index: str = None):
+  """Wide To Long
+  Stack groups of columns into long format. For each group, the identifier
+  columns and the columns of the group are selected and the selections are
+  combined into one datatable object. All work is done column-wise. Columns
+  that are missing from a group are filled with None using the type of the
+  same column in the other groups.
+
+  @param data datatable object
+  @param groups dict of group name and a dict of new column name and the
+    name of the column in `data` (see `columnGroupsBySuffix`)
+  @param idColumns columns to repeat for each group. Either a list of column
+    names or a dict of new column name and column name. If None, all columns
+    that do not belong to a group are used.
+  @param index name of the column to write the group name into. If None,
+    the group name is not added.
+
+  @return datatable object
+  """
+  if idColumns is None:
+    grouped = {name for group in groups.values() for name in group.values()}
+    idColumns = [name for name in data.names if name not in grouped]
+  if not isinstance(idColumns, dict):
+    idColumns = {name: name for name in idColumns}
+
+  stubs = {}
+  for group in groups.values():
+    for stub, column in group.items():
+      if stubs.get(stub) in [None, dt.Type.void]:
+        stubs[stub] = data[column].type
+
+  frames = []
+  for name, group in groups.items():
+    frame = data[:, {newName: f[column] for newName, column in idColumns.items()}]
+    if index:
+      frame[index] = dt.Frame({index: [name] * data.nrows}, type=dt.Type.str32)
+    for stub, type in stubs.items():
+      if stub in group:
+        frame[stub] = data[:, {stub: f[group[stub]]}]
+      else:
+        if type == dt.Type.void:
+          type = dt.Type.str32
+        frame[stub] = dt.Frame({stub: [None] * data.nrows}, type=type)
+    frames.append(frame)
+
+  # `dt.rbind` drops the columns of frames without rows
+  if not frames:
+    return dt.Frame()
+  output = frames[0]
+  output.rbind(*frames[1:], force=True)
+  return output
+
+def summarizeFrame(data, tablename: str = None):
+  """Summarize Frame
+  For all columns in a datatable object, calculate the number of values,
+  missing values, and distinct values, the minimum and maximum length (string
+  columns only), and the percentage of rows that have a value. All reducers
+  are evaluated in a single query. Columns of unsupported types (e.g., lists)
+  are counted in Python.
+
+  @param data datatable object
+  @param tablename name of the table. If supplied, a column `databaseTable`
+    is added.
+
+  @return datatable object with one row per column
+  """
+  columns = []
+  for index, column in enumerate(data.names):
+    stype = data.stypes[index]
+    supported = stype not in [dt.stype.obj64, dt.stype.arr32, dt.stype.arr64]
+    isString = stype in [dt.stype.str32, dt.stype.str64]
+    columns.append((column, supported, isString))
+
+  reducers = {}
+  for index, (column, supported, isString) in enumerate(columns):
+    if supported:
+      reducers[f'count_{index}'] = dt.count(f[column])
+      reducers[f'distinct_{index}'] = dt.nunique(f[column])
+    if isString:
+      reducers[f'minLength_{index}'] = dt.min(dt.str.len(f[column]))
+      reducers[f'maxLength_{index}'] = dt.max(dt.str.len(f[column]))
+
+  results = data[:, reducers].to_dict() if reducers else {}
+
+  summary = []
+  for index, (column, supported, isString) in enumerate(columns):
+    if supported:
+      count = results.get(f'count_{index}', [None])[0]
+    else:
+      count = sum(value is not None for value in data[column].to_list()[0])
+    summary.append({
+      'databaseColumn': column,
+      'countOfValues': count,
+      'totalValues': data.nrows,
+      'distinctValues': results.get(f'distinct_{index}', [None])[0],
+      'minLength': results.get(f'minLength_{index}', [None])[0],
+      'maxLength': results.get(f'maxLength_{index}', [None])[0]
+    })
+
+  output = dt.Frame(
+    summary,
+    types={
+      'databaseColumn': dt.Type.str32,
+      'countOfValues': dt.Type.int64,
+      'totalValues': dt.Type.int64,
+      'distinctValues': dt.Type.int64,
+      'minLength': dt.Type.int64,
+      'maxLength': dt.Type.int64
+    }
+  ) if summary else dt.Frame()
+
+  if output.nrows:
+    output[:, dt.update(
+      differenceInValues = f.totalValues - f.countOfValues,
+      percentComplete = dt.ifelse(
+        f.totalValues > 0,
+        dt.math.round(f.countOfValues / f.totalValues, ndigits=2),
+        None
+      )
+    )]
+    if tablename:
+      output['databaseTable'] = tablename
+      output = output[:, [f.databaseTable, f[:].remove(f.databaseTable)]]
+  return output
+
+def diffByKey(current, data, key: str, columns: list = None):
+  """Diff By Key
+  Compare a datatable object with the current contents of a table. Rows are
+  matched by key using a join and values are compared as strings. Rows that
+  are new or that have one or more changed values are returned, as well as
+  the keys that only exist in the current table.
+
+  @param current datatable object with the current contents of the table
+  @param data datatable object with the new data
+  @param key name of the column that contains the identifier
+  @param columns names of the columns to compare. If None, all columns in
+    `data` (except the key) are compared. Columns that do not exist in
+    `current` are ignored.
+
+  @return dict with `changed` (datatable object) and `removed` (list of keys)
+  """
+  if key not in current.names or not current.nrows:
+    return {'changed': data.copy(), 'removed': []}
+
+  if columns is None:
+    columns = [column for column in data.names if column != key]
+  columns = [column for column in columns if column != key and column in current.names]
+
+  previous = current[:, {
+    key: dt.as_type(f[key], dt.Type.str32),
+    '_exists': True,
+    **{
+      f'_current_{index}': dt.as_type(f[column], dt.Type.str32)
+      for index, column in enumerate(columns)
+    }
+  }][:, dt.first(f[:]), dt.by(f[key])]
+  previous.key = key
+
+  joined = data[:, :, dt.join(previous)]
+  isChanged = f._exists == None
+  for index, column in enumerate(columns):
+    isChanged = isChanged | (
+      dt.as_type(f[column], dt.Type.str32) != f[f'_current_{index}']
+    )
+
+  incoming = data[:, {key: dt.as_type(f[key], dt.Type.str32), '_exists': True}]
+  incoming = incoming[:, dt.first(f[:]), dt.by(f[key])]
+  incoming.key = key
+  removed = previous[:, key][:, :, dt.join(incoming)][f._exists == None, key]
+
+  return {
+    'changed': joined[isChanged, data.names],
+    'removed': removed.to_list()[0]
+  }
@@ -0,0 +1,392 @@
+from cosastools.datatable import columnGroupsBySuffix, wideToLong
+from datatable import dt, f
+from datetime import datetime
+from os import path, makedirs, utime
+from time import time
+import pytz
+import csv
+import re
+
+# File types are evaluated in order of precedence (vcf, cram, bam, fastq). All
+# patterns are combined into a single expression so that each filename is
+# scanned once. The name of the matching group is the file type.
+FILE_TYPE_PATTERN = re.compile(
+  r'(?P<vcf>(vcf.gz(.tbi)?)|(.vcf)|(vcf.bgz.tbi)$)'
+  r'|(?P<cram>.bam.cram$)'
+  r'|(?P<bam>.bam$)'
+  r'|(?P<fastq>.fq.gz$)'
+)
+
+# Most filenames can be classified by their suffix without running the regular
+# expression: any filename with 'vcf' after the first character is a vcf file
+# (same as `.vcf`); all other cases fall back to FILE_TYPE_PATTERN.
+FILE_TYPE_SUFFIXES = (('.bam.cram', 'cram'), ('.bam', 'bam'), ('.fq.gz', 'fastq'))
+
+DNA_PREFIX_PATTERN = re.compile(r'^(DNA)')
+SLASHES_PATTERN = re.compile(r'\/{2,}')
+
+# patterns used to validate identifiers in new storage listings
+UMCG_ID_PATTERN = re.compile(r'^([0-9]{2,})')
+UMCG_ID_ZEROS_PATTERN = re.compile(r'^([0]{1,})$')
+DNA_ID_PATTERN = re.compile(r'^(DNA[0-9]{2,})$')
+
+# FastQ listings contain one column per read for the file name, checksum, and
+# date created (e.g., `fastQname1`, `md5_1`, `dateCreated2`)
+FASTQ_STUBS = ['fastQname', 'md5', 'dateCreated']
+
+# Creation dates are compared at the level of seconds. Fractional seconds are
+# removed before parsing as older versions of `datetime.fromisoformat` only
+# accept three or six digits.
+FRACTIONAL_SECONDS_PATTERN = re.compile(r'(?<=:[0-9]{2})[.,][0-9]+')
+
+def getFileType(value: str = None):
+  """Get File Type
+  Classify a filename as vcf, cram, bam, or fastq
+
+  @param value a filename
+  @return string or NoneType
+  """
+  if not value:
+    return None
+  if 'vcf' in value[1:]:
+    return 'vcf'
+  if not value.startswith('vcf'):
+    for suffix, fileType in FILE_TYPE_SUFFIXES:
+      if value.endswith(suffix):
+        return fileType
+  match = FILE_TYPE_PATTERN.search(value)
+  return match.lastgroup if match else None
+
+def formatDnaId(value: str = None):
+  """Format DNA number
+  @param value DNA number (e.g., 'DNA12345')
+  @return string (e.g., 'DNA-12345')
+  """
+  return DNA_PREFIX_PATTERN.sub('DNA-', value) if value else value
+
+def formatFilePath(value: str = None):
+  """Format file path
+  Remove instances of two or more slashes
+
+  @param value file path
+  @return string
+  """
+  return SLASHES_PATTERN.sub('/', value) if value else value
+
+def recodeByUniqueValues(data, column: str, recode, newColumn: str = None):
+  """Recode By Unique Values
+  Apply a function once per distinct value of a column and reuse the result
+  for all other rows with the same value. This is useful for columns where
+  the same value is repeated many times (e.g., file paths and DNA numbers).
+
+  @param data datatable object
+  @param column name of the column to recode
+  @param recode function that is applied to a single value
+  @param newColumn name of the column to write the results into. If None,
+    the column is updated in place.
+  """
+  mappings = {}
+  values = []
+  for value in data[column].to_list()[0]:
+    if value not in mappings:
+      mappings[value] = recode(value)
+    values.append(mappings[value])
+  data[newColumn or column] = dt.Frame(values, type=dt.Type.str32)
+
+def normaliseFileMetadata(data):
+  """Normalise File Metadata
+  Prepare the storage listings from `cosasportal_files` for `umdm_files`:
+  format the DNA number (belongsToSample), recode missing filenames, remove
+  duplicate slashes in file paths, classify the file format, and create the
+  file identifier (filepath + filename). Columns with repeated values are
+  recoded by distinct value, and all other transformations are applied to
+  the whole column at once.
+
+  @param data datatable object with the columns dnaID, filename, and filepath
+  @return datatable object
+  """
+  recodeByUniqueValues(data, 'dnaID', formatDnaId, newColumn='belongsToSample')
+  recodeByUniqueValues(data, 'filepath', formatFilePath)
+
+  data[:, dt.update(filename=dt.ifelse(f.filename == 'N/A', None, f.filename))]
+  data['fileFormat'] = dt.Frame(
+    [getFileType(value) for value in data['filename'].to_list()[0]],
+    type=dt.Type.str32
+  )
+  data['fileID'] = data[:, f.filepath + f.filename]
+  return data
+
+def readCachedFrame(file: str, maxAge: float = None):
+  """Read Cached Frame
+  Read a datatable object from a jay file if the file exists and it is not
+  older than the maximum age.
+
+  @param file path to a jay file
+  @param maxAge maximum age of the file in hours. If None, the age of the
+    file is not checked.
+  @return datatable object or NoneType
+  """
+  if not file or not path.exists(file):
+    return None
+  if maxAge is not None and (time() - path.getmtime(file)) > maxAge * 3600:
+    return None
+  return dt.fread(file)
+
+def writeCachedFrame(data, file: str):
+  """Write Cached Frame
+  @param data datatable object
+  @param file path to a jay file
+  """
+  if not file:
+    return None
+  directory = path.dirname(file)
+  if directory:
+    makedirs(directory, exist_ok=True)
+  data.to_jay(file)
+
+def getIdentifierIndex(session, cacheDir: str = None, maxAge: float = 24):
+  """Get Identifier Index
+  Retrieve all subject- and sample identifiers from `umdm_subjects` and
+  `umdm_samples` as sets. If a cache directory is supplied, the identifiers
+  are stored locally and are refreshed once the cache is older than the
+  maximum age.
+
+  @param session an active Molgenis session
+  @param cacheDir directory to store the identifiers in
+  @param maxAge maximum age of the cached identifiers in hours
+  @return dict with the sets `subjects` and `samples`
+  """
+  index = {}
+  for name, entity, column in [
+    ('subjects', 'umdm_subjects', 'subjectID'),
+    ('samples', 'umdm_samples', 'sampleID')
+  ]:
+    file = path.join(cacheDir, f'{entity}.jay') if cacheDir else None
+    data = readCachedFrame(file, maxAge)
+    if data is None:
+      rows = session.get(entity, attributes=column, batch_size=10000)
+      data = dt.Frame(
+        {column: [row.get(column) for row in rows]},
+        types=[dt.Type.str32]
+      )
+      writeCachedFrame(data, file)
+    index[name] = set(data[column].to_list()[0])
+  return index
+
+def normaliseFileDate(value=None, tz: str = 'Europe/Amsterdam'):
+  """Normalise File Date
+  Convert the creation date of a file into a single format so that the dates
+  of the storage listings (e.g., '2023-07-04 10:01:02') can be compared with
+  the dates returned by `umdm_files` (e.g., '2023-07-04T08:01:02Z'). Dates
+  with a timezone are converted to the local timezone. Dates without a
+  timezone are assumed to be local.
+
+  @param value date as string or datetime object
+  @param tz name of the local timezone
+  @return string (e.g., '2023-07-04T10:01:02') or NoneType. Values that
+    cannot be parsed are returned as is.
+  """
+  if value is None:
+    return None
+  if isinstance(value, datetime):
+    date = value
+  else:
+    value = str(value).strip()
+    if not value:
+      return None
+    try:
+      date = datetime.fromisoformat(
+        FRACTIONAL_SECONDS_PATTERN.sub('', value).replace('Z', '+00:00')
+      )
+    except ValueError:
+      return value
+  if date.tzinfo is not None:
+    date = date.astimezone(pytz.timezone(tz)).replace(tzinfo=None)
+  return date.strftime('%Y-%m-%dT%H:%M:%S')
+
+def getIngestedFiles(session, cacheFile: str = None, maxAge: float = None):
+  """Get Ingested Files
+  Retrieve the identifier and creation date of all files that were imported
+  into `umdm_files`. If a cache file is supplied, the identifiers are read
+  from the cache instead. The cache is rebuilt from `umdm_files` once it is
+  older than the maximum age (updates made by `updateIngestedFiles` do not
+  change the age of the cache).
+
+  @param session an active Molgenis session
+  @param cacheFile path to a jay file containing the columns fileID and
+    dateFileCreated
+  @param maxAge maximum age of the cache in hours. If None, the age of the
+    cache is not checked.
+  @return dict of fileID and dateFileCreated (see `normaliseFileDate`)
+  """
+  data = readCachedFrame(cacheFile, maxAge)
+  if data is None:
+    rows = session.get(
+      'umdm_files',
+      attributes='fileID,dateFileCreated',
+      batch_size=10000
+    )
+    data = dt.Frame(
+      {
+        column: [row.get(column) for row in rows]
+        for column in ['fileID', 'dateFileCreated']
+      },
+      types=[dt.Type.str32, dt.Type.str32]
+    )
+    writeCachedFrame(data, cacheFile)
+
+  ids, dates = data[:, ['fileID', 'dateFileCreated']].to_list()
+  return {id: normaliseFileDate(date) for id, date in zip(ids, dates)}
+
+def updateIngestedFiles(ingested: dict, data, cacheFile: str = None):
+  """Update Ingested Files
+  Add newly imported files to the ingested files and save them to the cache.
+  The modification time of an existing cache is kept so that the cache is
+  still rebuilt from `umdm_files` once it expires (see `getIngestedFiles`).
+
+  @param ingested dict of fileID and dateFileCreated (see `getIngestedFiles`)
+  @param data datatable object with the columns fileID and dateFileCreated
+  @param cacheFile path to a jay file
+  @return dict of fileID and dateFileCreated
+  """
+  ids, dates = data[:, ['fileID', 'dateFileCreated']].to_list()
+  ingested.update({id: normaliseFileDate(date) for id, date in zip(ids, dates)})
+  times = None
+  if cacheFile and path.exists(cacheFile):
+    times = (path.getatime(cacheFile), path.getmtime(cacheFile))
+  writeCachedFrame(
+    dt.Frame(
+      fileID=list(ingested.keys()),
+      dateFileCreated=list(ingested.values()),
+      types=[dt.Type.str32, dt.Type.str32]
+    ),
+    cacheFile
+  )
+  if times:
+    utime(cacheFile, times)
+  return ingested
+
+def isNewOrModified(data, ingested: dict, fileID: str = 'fileID', dateCreated: str = 'dateCreated'):
+  """Is New Or Modified
+  Determine which file records have not been imported yet, or that were
+  imported with a different creation date. Dates are compared in the format
+  of `normaliseFileDate`.
+
+  @param data datatable object
+  @param ingested dict of fileID and dateFileCreated (see `getIngestedFiles`)
+  @param fileID name of the column containing the file identifier
+  @param dateCreated name of the column containing the date the file was created
+  @return list of booleans
+  """
+  ids, dates = data[:, [fileID, dateCreated]].to_list()
+  return [
+    (id not in ingested)
+    or (ingested[id] != normaliseFileDate(date))
+    for id, date in zip(ids, dates)
+  ]
+
+def isValidUmcgId(value: str = None):
+  """Is Valid UMCG ID
+  @param value UMCG number; at least two digits and not all zeros
+  @return bool
+  """
+  if not value:
+    return False
+  return bool(UMCG_ID_PATTERN.search(value)) and not UMCG_ID_ZEROS_PATTERN.search(value)
+
+def isValidDnaId(value: str = None):
+  """Is Valid DNA ID
+  @param value DNA number in the format 'DNA' followed by two or more digits
+  @return bool
+  """
+  return bool(DNA_ID_PATTERN.search(value)) if value else False
+
+def readListing(file: str, chunkSize: int = 100000, sep: str = None, encoding: str = 'utf-8'):
+  """Read Listing
+  Read a storage listing in chunks. Lines are repaired while reading: the last
+  column of a record (e.g., `dateCreated2`) sometimes breaks onto a new line.
+  A line that contains a single value is moved into the last column of the
+  previous record. Only one chunk is kept in memory at a time. All columns
+  are read as strings and empty values are returned as None.
+
+  @param file path to a delimited text file with a header row
+  @param chunkSize number of records per chunk
+  @param sep field separator. If None, the separator is detected from the header
+  @param encoding file encoding
+
+  @return generator of datatable objects
+  """
+  with open(path.expanduser(file), 'r', encoding=encoding, newline='') as stream:
+    header = stream.readline().rstrip('\r\n')
+    if sep is None:
+      sep = csv.Sniffer().sniff(header, delimiters=',\t;|').delimiter
+    columns = next(csv.reader([header], delimiter=sep))
+    ncol = len(columns)
+
+    def toFrame(records):
+      return dt.Frame(
+        {name: [record[index] for record in records] for index, name in enumerate(columns)},
+        types=[dt.Type.str32] * ncol
+      )
+
+    records = []
+    previous = None
+    for fields in csv.reader(stream, delimiter=sep):
+      if not fields or not any(fields):
+        continue
+      if len(fields) == 1 and previous is not None:
+        previous[-1] = fields[0] or None
+        continue
+      if previous is not None:
+        records.append(previous)
+        if len(records) >= chunkSize:
+          yield toFrame(records)
+          records = []
+      fields = fields[:ncol] + [None] * (ncol - len(fields))
+      previous = [value if value != '' else None for value in fields]
+
+    if previous is not None:
+      records.append(previous)
+    if records:
+      yield toFrame(records)
+
+def stackFastqColumns(data):
+  """Stack FastQ Columns
+  Reshape the paired fastQ columns (file name, checksum, and date created of
+  read 1 and 2) into long format. All other columns are repeated for each
+  read. The records of the first read are followed by those of the second
+  read. The file name column is renamed to `filename`.
+
+  @param data datatable object
+  @return datatable object
+  """
+  groups = columnGroupsBySuffix(data.names, FASTQ_STUBS, sep='_?', suffix='[12]')
+  if not groups:
+    return data
+
+  output = wideToLong(data, {read: groups[read] for read in sorted(groups.keys())})
+  if 'fastQname' in output.names:
+    output.names = {'fastQname': 'filename'}
+  return output
+
+def prepareFastqListing(data, dropColumns: list = ['id', 'testID', 'md5']):
+  """Prepare FastQ Listing
+  Drop unnecessary columns, stack the paired fastQ columns, and keep records
+  with a valid UMCG- and DNA number only.
+
+  @param data datatable object (see `readListing`)
+  @param dropColumns names of the columns to remove if they exist
+  @return datatable object
+  """
+  for column in dropColumns:
+    if column in data.names:
+      del data[column]
+
+  data = stackFastqColumns(data)
+  data['isValid'] = dt.Frame([
+    isValidUmcgId(umcgID) and isValidDnaId(dnaID)
+    for umcgID, dnaID in zip(*data[:, ['umcgID', 'dnaID']].to_list())
+  ], type=dt.Type.bool8)
+  data = data[f.isValid, :]
+  del data['isValid']
+  return data
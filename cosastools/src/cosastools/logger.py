@@ -1,15 +1,65 @@
 
+from contextlib import contextmanager
 from datetime import datetime
+from functools import wraps
+import threading
+import tracemalloc
+import json
+import sys
+import time
 import pytz
 
+try:
+  import resource
+except ImportError:
+  resource = None
+
+def peakMemoryUsage():
+  """Peak Memory Usage
+  Maximum resident set size of the current process in megabytes. The size is
+  reported in bytes on macOS and in kilobytes on other platforms.
+
+  @return float or NoneType if it cannot be determined on this platform
+  """
+  if resource is None:
+    return None
+  maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return maxrss / 1024 ** 2 if sys.platform == 'darwin' else maxrss / 1024
+
+def countRows(data):
+  """Count Rows
+  @param data datatable object, list, or any other object
+  @return int or NoneType if the number of rows cannot be determined
+  """
+  if hasattr(data, 'nrows'):
+    return data.nrows
+  if isinstance(data, (list, tuple)):
+    return len(data)
+  return None
+
 class cosasLogger:
-  def __init__(self, logname: str = 'cosas-daily-import', silent=False, printWithTime=True):
+  def __init__(
+    self,
+    logname: str = 'cosas-daily-import',
+    silent=False,
+    printWithTime=True,
+    profile=False,
+    profileNamespace: dict = None,
+    profileTopN: int = 10
+  ):
     """Cosas Logger
     Keep records of all processing steps and summarize the daily imports
 
     @param logname : name of the log
     @param silent : If True, all messages will be disabled
     @param printWithTime: If True and silent is False, all messages will be printed with timestamps
+    @param profile : If True, memory allocations are traced for each
+      processing step (see `profileLogs`). This slows down the job and should
+      only be used to investigate memory issues.
+    @param profileNamespace : dictionary that is searched for datatable
+      objects at the end of each step (e.g., `globals()`). Steps can also
+      pass their own objects (see `closeProcessingStep`).
+    @param profileTopN : number of allocation sites to record per step
     """
     self.silent = silent
     self.logname = logname
@@ -18,14 +68,35 @@ class cosasLogger:
     self.processingStepLogs = []
     self._printWithTime = printWithTime
     self.tz = 'Europe/Amsterdam'
+    self._timezone = pytz.timezone(self.tz)
+    self._counters = {}
+    self._stepCount = 0
+    self._lock = threading.Lock()
+    self.profile = profile
+    self.profileLogs = []
+    self._profileNamespace = profileNamespace
+    self._profileTopN = profileTopN
+    self._profileSnapshots = {}
     self.hhmmss = '%H:%M:%S'
     self.hhmmss_f = '%H:%M:%S.%f'
     self.yyyymmdd_hhmmss = '%Y-%m-%dT%H:%M:%SZ'
 
   def _now(self, strftime=None):
     if strftime:
-      return datetime.now(tz=pytz.timezone(self.tz)).strftime(strftime)
-    return datetime.now(tz=pytz.timezone(self.tz))
+      return datetime.now(tz=self._timezone).strftime(strftime)
+    return datetime.now(tz=self._timezone)
+
+  def _newCounters(self):
+    """Monotonic, cpu, and memory counters"""
+    return {
+      'elapsed': time.perf_counter(),
+      'cpu': time.process_time(),
+      'memory': peakMemoryUsage()
+    }
+
+  def _startCounters(self, name):
+    """Start monotonic, cpu, and memory counters for a log"""
+    self._counters[name] = self._newCounters()
 
   def _print(self, *message):
     if not self.silent:
@@ -34,13 +105,21 @@ class cosasLogger:
         message = f"[{self._now(strftime=self.hhmmss_f)[:-3]}] {message}"
       print(message)
 
-  def __stoptime__(self, name):
-    log = self.__getattribute__(name)
+  def _stoptime(self, log, counters=None):
     log['endTime'] = self._now()
-    log['elapsedTime'] = (log['endTime'] - log['startTime']).total_seconds()
+    if counters:
+      log['elapsedTime'] = round(time.perf_counter() - counters['elapsed'], 6)
+    else:
+      log['elapsedTime'] = (log['endTime'] - log['startTime']).total_seconds()
     log['endTime'] = log['endTime'].strftime(self.yyyymmdd_hhmmss)
     log['startTime'] = log['startTime'].strftime(self.yyyymmdd_hhmmss)
+
+  def __stoptime__(self, name):
+    log = self.__getattribute__(name)
+    counters = self._counters.pop(name, None)
+    self._stoptime(log, counters)
     self.__setattr__(name, log)
+    return counters
 
   def start(self):
     """Start Log"""
@@ -55,25 +134,56 @@ class cosasLogger:
       'steps': [],
       'comments': None
     }
+    self._startCounters('log')
+    if self.profile and not tracemalloc.is_tracing():
+      tracemalloc.start()
     self._print(self.logname,': log started at',self.log['startTime'].strftime(self.hhmmss))
 
   def stop(self):
     """Stop Log"""
     self.__stoptime__(name='log')
     self.log['steps'] = ','.join(map(str, self.log['steps']))
+    if self.profile and tracemalloc.is_tracing():
+      tracemalloc.stop()
     self._print('Logging stopped (elapsed time:', self.log['elapsedTime'], 'seconds')
 
-  def startProcessingStepLog(self, type: str = None, name: str = None, tablename: str = None):
+  def startProcessingStepLog(
+    self,
+    type: str = None,
+    name: str = None,
+    tablename: str = None,
+    rowsIn: int = None
+  ):
     """Start a new log for a processing step
     Create a new logging object for an individual step such as transforming
-    data or importing data.
+    data or importing data. The elapsed time is measured with a monotonic
+    clock, and the cpu time and the increase in peak memory usage are
+    recorded when the step is stopped.
 
     @param type : data handling type (see lookups)
     @param name : name of the current step (e.g., 'import-data', 'save-data')
     @param tablename : database table the current step relates to
+    @param rowsIn : number of rows passed into the step
+    """
+    self.currentStep = self._newProcessingStep(type, name, tablename, rowsIn)
+    self._startCounters('currentStep')
+
+  def stopProcessingStepLog(self, rowsOut: int = None):
+    """Stop a log for a processing step
+    @param rowsOut : number of rows returned by the step
     """
-    stepID = len(self.processingStepLogs) + 1
-    self.currentStep = {
+    counters = self.__stoptime__(name='currentStep')
+    self._finishProcessingStep(self.currentStep, counters, rowsOut)
+
+  def _newProcessingStep(self, type, name, tablename, rowsIn):
+    """Create a new processing step record
+    Step identifiers are assigned when the step is started so that steps
+    that run at the same time (e.g., in a pipeline) get unique identifiers.
+    """
+    with self._lock:
+      self._stepCount += 1
+      stepID = self._stepCount
+    step = {
       'identifier': int(f"{self._now(strftime='%Y%m%d')}{stepID}"),
       'date': self._now(strftime='%Y-%m-%d'),
       'name': name,
@@ -83,17 +193,194 @@ class cosasLogger:
       'endTime': None,
       'elapsedTime': None,
       'status': None,
-      'comment': None
+      'comment': None,
+      'cpuTime': None,
+      'peakMemoryIncrease': None,
+      'rowsIn': rowsIn,
+      'rowsOut': None
     }
+    if self.profile and tracemalloc.is_tracing():
+      tracemalloc.reset_peak()
+      self._profileSnapshots[step['identifier']] = tracemalloc.take_snapshot()
     self._print(self.logname, ': starting step', name)
+    return step
 
-  def stopProcessingStepLog(self):
-    """Stop a log for a processing step"""
-    self.__stoptime__(name='currentStep')
-    self.log['steps'].append(self.currentStep['identifier'])
-    self.processingStepLogs.append(self.currentStep)
+  def _finishProcessingStep(self, step, counters, rowsOut=None, frames=None):
+    """Add cpu time, memory usage, and row counts to a stopped step and save it
+    If the cpu time or memory usage was already set (e.g., measured in
+    another process), it is not replaced.
+    """
+    if counters:
+      if step['cpuTime'] is None:
+        step['cpuTime'] = round(time.process_time() - counters['cpu'], 6)
+      memory = peakMemoryUsage()
+      if step['peakMemoryIncrease'] is None and memory is not None and counters['memory'] is not None:
+        step['peakMemoryIncrease'] = round(memory - counters['memory'], 3)
+    if rowsOut is not None:
+      step['rowsOut'] = rowsOut
+    if self.profile and tracemalloc.is_tracing():
+      self._profileStep(step, frames)
+    with self._lock:
+      self.log['steps'].append(step['identifier'])
+      self.processingStepLogs.append(step)
     self._print(
       self.logname, ': finished step',
-      self.currentStep['name'],'in',
-      self.currentStep['elapsedTime']
-    )
\ No newline at end of file
+      step['name'],'in',
+      step['elapsedTime']
+    )
+
+  def _profileStep(self, step, frames: dict = None):
+    """Profile a step
+    Record the current and peak traced memory, the allocation sites that grew
+    the most since the start of the step, and the size of the datatable
+    objects of the step (e.g., the inputs and outputs of a pipeline stage)
+    and in the profile namespace.
+    """
+    current, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+      tracemalloc.Filter(False, tracemalloc.__file__),
+      tracemalloc.Filter(False, '<frozen importlib._bootstrap>')
+    ])
+
+    allocations = []
+    start = self._profileSnapshots.pop(step['identifier'], None)
+    if start is not None:
+      stats = [
+        stat for stat in snapshot.compare_to(start, 'lineno')
+        if stat.size_diff > 0
+      ]
+      for stat in stats[:self._profileTopN]:
+        frame = stat.traceback[0]
+        allocations.append({
+          'location': f'{frame.filename}:{frame.lineno}',
+          'sizeDiff': round(stat.size_diff / 1024 ** 2, 3),
+          'size': round(stat.size / 1024 ** 2, 3)
+        })
+
+    objects = dict(self._profileNamespace or {})
+    objects.update(frames or {})
+    frames = []
+    for name, value in objects.items():
+      if hasattr(value, 'nrows') and hasattr(value, 'ncols') and not name.startswith('_'):
+        frames.append({
+          'name': name,
+          'nrows': value.nrows,
+          'ncols': value.ncols,
+          'size': round(sys.getsizeof(value) / 1024 ** 2, 3)
+        })
+
+    self.profileLogs.append({
+      'identifier': step['identifier'],
+      'name': step['name'],
+      'databaseTable': step['databaseTable'],
+      'tracedMemory': round(current / 1024 ** 2, 3),
+      'tracedMemoryPeak': round(peak / 1024 ** 2, 3),
+      'peakMemory': peakMemoryUsage(),
+      'allocations': allocations,
+      'frames': sorted(frames, key=lambda frame: frame['size'], reverse=True)
+    })
+
+  def writeProfileReport(self, path: str):
+    """Write profile report
+    Save the memory profile of all processing steps as a json file. Memory
+    is reported in megabytes.
+
+    @param path location to save the file
+    """
+    with open(path, 'w', encoding='utf-8') as file:
+      json.dump(
+        {'log': self.logname, 'date': self.log.get('date'), 'steps': self.profileLogs},
+        file,
+        indent=2
+      )
+    self._print(self.logname, ': saved profile report to', path)
+
+  def openProcessingStep(
+    self,
+    type: str = None,
+    name: str = None,
+    tablename: str = None,
+    rowsIn: int = None
+  ):
+    """Open a processing step
+    Like `startProcessingStepLog`, but the step is returned rather than
+    stored in `currentStep`. More than one step can be open at the same time
+    (e.g., stages that run in threads or processes). Note that cpu time and
+    memory usage are measured for the current process.
+
+    @param type : data handling type (see lookups)
+    @param name : name of the current step
+    @param tablename : database table the current step relates to
+    @param rowsIn : number of rows passed into the step
+
+    @return dictionary (pass to `closeProcessingStep`)
+    """
+    step = self._newProcessingStep(type, name, tablename, rowsIn)
+    self._counters[step['identifier']] = self._newCounters()
+    return step
+
+  def closeProcessingStep(self, step: dict, rowsOut: int = None, frames: dict = None):
+    """Close a processing step
+    @param step : a step created by `openProcessingStep`
+    @param rowsOut : number of rows returned by the step
+    @param frames : dictionary of datatable objects used or created by the
+      step. If profiling, the size of each object is recorded.
+    """
+    counters = self._counters.pop(step['identifier'], None)
+    self._stoptime(step, counters)
+    self._finishProcessingStep(step, counters, rowsOut, frames)
+
+  @contextmanager
+  def step(self, type: str = None, name: str = None, tablename: str = None, rowsIn: int = None):
+    """Processing step
+    Log a processing step using a `with` statement. The step is returned so
+    that the status, comment, and number of rows can be set in the block. If
+    an error is raised, the status is set to 'Error' and the error is added
+    to the comment before the step is stopped.
+
+    Steps logged this way do not replace `currentStep` (see
+    `openProcessingStep`).
+
+    @param type : data handling type (see lookups)
+    @param name : name of the current step
+    @param tablename : database table the current step relates to
+    @param rowsIn : number of rows passed into the step
+
+    @examples
+    with cosaslogs.step('Import', 'import-subjects', 'subjects', rowsIn=subjects.nrows) as step:
+      db.importDatatableAsCsv('umdm_subjects', subjects)
+      step['status'] = 'Success'
+    """
+    step = self.openProcessingStep(type, name, tablename, rowsIn)
+    try:
+      yield step
+    except Exception as error:
+      step['status'] = 'Error'
+      step['comment'] = str(error)
+      raise
+    finally:
+      self.closeProcessingStep(step)
+
+  def processingStep(self, type: str = None, name: str = None, tablename: str = None):
+    """Processing step decorator
+    Log every call of a function as a processing step. The number of rows of
+    the first argument and of the returned object (if available) are recorded
+    as rowsIn and rowsOut. The status is set to 'Success' if the function did
+    not raise an error and the status was not set in the function.
+
+    @param type : data handling type (see lookups)
+    @param name : name of the step. If None, the name of the function is used
+    @param tablename : database table the step relates to
+    """
+    def decorator(function):
+      @wraps(function)
+      def wrapper(*args, **kwargs):
+        rowsIn = countRows(args[0]) if args else None
+        with self.step(type, name or function.__name__, tablename, rowsIn) as step:
+          result = function(*args, **kwargs)
+          step['rowsOut'] = countRows(result)
+          if step['status'] is None:
+            step['status'] = 'Success'
+        return result
+      return wrapper
+    return decorator
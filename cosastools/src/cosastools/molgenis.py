@@ -1,4 +1,5 @@
 import molgenis.client as molgenis
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from os.path import abspath
 import numpy as np
@@ -36,6 +37,47 @@ class Molgenis(molgenis.Session):
     super(Molgenis, self).__init__(*args, **kwargs)
     self.fileImportEndpoint = f"{self._root_url}plugin/importwizard/importFile"
   
+  def count(self, entity: str, q: str = None):
+    """Count
+    Retrieve the number of rows in a table (that match a query) without
+    downloading the data. Only the first row is requested.
+
+    @param entity table identifier in emx format: package_entity
+    @param q query in rsql format
+
+    @return int
+    """
+    response = self._get_batch(entity=entity, q=q, batch_size=1, raw=True)
+    return response['total']
+
+  def countValues(self, entity: str, attributes: list, workers: int = 8):
+    """Count Values
+    For each attribute, count the number of rows that have a value using the
+    query `attribute!=''`. All count queries are run concurrently. MOLGENIS
+    stores empty strings and empty mrefs as missing values, so these are not
+    counted. Use the same definition when counting locally (e.g., flatten
+    empty mrefs to None before using `cosastools.datatable.summarizeFrame`).
+
+    @param entity table identifier in emx format: package_entity
+    @param attributes list of attribute names
+    @param workers maximum number of concurrent requests
+
+    @return list of dictionaries (attribute, countOfValues, totalValues)
+    """
+    queries = [None] + [f"{attribute}!=''" for attribute in attributes]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+      counts = list(executor.map(lambda q: self.count(entity, q=q), queries))
+
+    total = counts[0]
+    return [
+      {
+        'attribute': attribute,
+        'countOfValues': count,
+        'totalValues': total
+      }
+      for attribute, count in zip(attributes, counts[1:])
+    ]
+
   def _datatableToCsv(self, path, datatable):
     """To CSV
     Write datatable object as CSV file
@@ -0,0 +1,613 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qsl, unquote_plus
+from email.parser import BytesParser
+from email import policy
+from cosastools.molgenis import now
+from cosastools.snapshot import parseRsql
+from zipfile import ZipFile
+from io import BytesIO, StringIO
+import threading
+import json
+import time
+import csv
+import re
+
+
+def _matchValue(value, op: str, query):
+  """Match value
+  Evaluate a single rsql comparison for a row value. Values in the query are
+  cast to the type of the row value; references are compared using the
+  identifier(s) stored in the row.
+
+  @param value row value (scalar, list of identifiers, or None)
+  @param op rsql operator
+  @param query value or list of values in the query
+  @return bool
+  """
+  values = value if isinstance(value, list) else ([] if value is None else [value])
+
+  def cast(query, value):
+    if isinstance(value, bool):
+      return query.lower() == 'true'
+    if isinstance(value, (int, float)):
+      try:
+        return float(query)
+      except ValueError:
+        return query
+    return query
+
+  def compare(value, query, op):
+    query = cast(query, value)
+    if type(query) != type(value) and not isinstance(query, float):
+      value = str(value)
+    return {
+      '==': lambda: value == query,
+      '!=': lambda: value != query,
+      '=ge=': lambda: value >= query,
+      '=gt=': lambda: value > query,
+      '=le=': lambda: value <= query,
+      '=lt=': lambda: value < query,
+      '=like=': lambda: str(query).lower() in str(value).lower()
+    }[op]()
+
+  if op in ('=in=', '=out='):
+    found = any(compare(value, item, '==') for value in values for item in query)
+    return found if op == '=in=' else not found
+  if query == '' and op in ('==', '!='):
+    return (not values) if op == '==' else bool(values)
+  if op == '!=':
+    return not any(compare(value, query, '==') for value in values)
+  return any(compare(value, query, op) for value in values)
+
+
+def _matchRow(row: dict, node):
+  """Match row
+  @param row dictionary
+  @param node parsed query (see `parseRsql`)
+  @return bool
+  """
+  if node[0] == 'and':
+    return all(_matchRow(row, child) for child in node[1])
+  if node[0] == 'or':
+    return any(_matchRow(row, child) for child in node[1])
+  return _matchValue(row.get(node[0]), node[1], node[2])
+
+
+class MolgenisServer:
+  """Molgenis Server
+  A local stand-in for the Molgenis REST API (v1 and v2), the metadata API,
+  and the import wizard, backed by in-memory tables. The server runs in a
+  background thread so that the Molgenis class can be used as is (e.g.,
+  `Molgenis(url=server.url, token=server.token)`). Latency can be added per
+  request, per row, and per import job to benchmark fetch concurrency,
+  chunked imports, and complete job runs without a Molgenis instance.
+
+  Tables are stored in upload format: references are identifiers (or lists of
+  identifiers) and are returned as objects with an `_href` and identifier.
+  Values imported from CSV files are stored as strings.
+  """
+  def __init__(
+    self,
+    tables: dict = None,
+    token: str = 'cosas-local-token',
+    latency: float = 0.0,
+    rowLatency: float = 0.0,
+    importLatency: float = 0.0,
+    host: str = '127.0.0.1',
+    port: int = 0
+  ):
+    """Molgenis Server
+    @param tables dictionary of table identifiers and a list of rows (see
+      `addTable` for tables with references or another id attribute)
+    @param token token that is accepted by the server (and returned by login).
+      If None, requests are not authenticated.
+    @param latency seconds added to each request
+    @param rowLatency seconds added per row that is returned or written
+    @param importLatency seconds an import job is RUNNING before it is processed
+    @param host host to bind the server to
+    @param port port to bind the server to (0 selects a free port)
+    """
+    self.token = token
+    self.latency = latency
+    self.rowLatency = rowLatency
+    self.importLatency = importLatency
+    self.host = host
+    self.port = port
+    self.tables = {}
+    self.meta = {}
+    self.requests = []
+    self._lock = threading.RLock()
+    self._server = None
+    self._thread = None
+    self._jobs = []
+
+    self.addTable(
+      'sys_ImportRun',
+      idAttribute='id',
+      attributes=['id', 'status', 'message', 'startDate', 'endDate', 'progress', 'importedEntities']
+    )
+    for entity, rows in (tables or {}).items():
+      self.addTable(entity, rows)
+
+  @classmethod
+  def fromSnapshot(cls, snapshot, **kwargs):
+    """From Snapshot
+    Create a server from a snapshot (see `cosastools.snapshot`). Referenced
+    tables that are not in the snapshot are added without rows.
+
+    @param snapshot an instance of MolgenisSnapshot
+    @param **kwargs arguments passed to MolgenisServer
+    @return MolgenisServer
+    """
+    server = cls(**kwargs)
+    for entity, table in snapshot.manifest['entities'].items():
+      refs = {}
+      for row in snapshot.get(entity):
+        for name in table['refs']:
+          ref = row.get(name)
+          ref = ref[0] if isinstance(ref, list) and ref else ref
+          if name not in refs and isinstance(ref, dict) and ref.get('_href', '').count('/') > 1:
+            refs[name] = ref['_href'].rstrip('/').split('/')[-2]
+        if len(refs) == len(table['refs']):
+          break
+
+      for name, refEntity in refs.items():
+        if refEntity not in server.meta and refEntity not in snapshot.manifest['entities']:
+          server.addTable(refEntity, [], idAttribute=table['refs'][name])
+
+      server.addTable(entity, snapshot.get(entity, uploadable=True), refs=refs)
+    return server
+
+  def addTable(
+    self,
+    entity: str,
+    rows: list = None,
+    idAttribute: str = None,
+    attributes: list = None,
+    refs: dict = None
+  ):
+    """Add table
+    @param entity table identifier in emx format: package_entity
+    @param rows list of dictionaries in upload format
+    @param idAttribute name of the id attribute. If None, the first attribute
+      is used.
+    @param attributes list of attribute names. If None, all row attributes
+      are used.
+    @param refs dictionary of attribute names and referenced table identifiers
+    """
+    rows = [dict(row) for row in (rows or [])]
+    names = list(dict.fromkeys(
+      (attributes or []) + [name for row in rows for name in row.keys() if name not in ('_href', '_meta')]
+    ))
+    with self._lock:
+      self.meta[entity] = {
+        'idAttribute': idAttribute or (names[0] if names else 'id'),
+        'attributes': names or [idAttribute or 'id'],
+        'refs': refs or {}
+      }
+      idAttribute = self.meta[entity]['idAttribute']
+      self.tables[entity] = {}
+      for row in rows:
+        row.pop('_href', None)
+        row.pop('_meta', None)
+        self.tables[entity][str(row.get(idAttribute))] = row
+
+  def rows(self, entity: str):
+    """Rows
+    @param entity table identifier in emx format: package_entity
+    @return list of dictionaries
+    """
+    with self._lock:
+      return [dict(row) for row in self.tables[entity].values()]
+
+  @property
+  def url(self):
+    return f"http://{self.host}:{self.port}/"
+
+  def start(self):
+    """Start the server in a background thread
+    @return MolgenisServer
+    """
+    server = self
+    class Handler(_MolgenisRequestHandler):
+      molgenis = server
+
+    self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+    self._server.daemon_threads = True
+    self.port = self._server.server_address[1]
+    self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+    self._thread.start()
+    return self
+
+  def stop(self):
+    """Stop the server and wait for running import jobs"""
+    for job in list(self._jobs):
+      job.join()
+    if self._server:
+      self._server.shutdown()
+      self._server.server_close()
+      self._thread.join()
+      self._server = None
+
+  def __enter__(self):
+    return self.start()
+
+  def __exit__(self, *args):
+    self.stop()
+
+  def _idAttribute(self, entity: str):
+    if entity in self.meta:
+      return self.meta[entity]['idAttribute']
+    return 'id'
+
+  def _render(self, entity: str, row: dict, attributes: list = None, expand: list = []):
+    """Render row
+    Format a row as a v2 api response: references are returned as objects
+    (or the referenced row if the attribute is expanded).
+
+    @return dict
+    """
+    id = row.get(self._idAttribute(entity))
+    item = {'_href': f"/api/v2/{entity}/{id}"}
+    refs = self.meta[entity]['refs']
+    for name, value in row.items():
+      if attributes and name not in attributes and name not in expand:
+        continue
+      if name in refs and value is not None:
+        refEntity = refs[name]
+        refID = self._idAttribute(refEntity)
+
+        def render(value):
+          ref = self.tables.get(refEntity, {}).get(str(value))
+          if name in expand and ref:
+            return self._render(refEntity, ref)
+          return {'_href': f"/api/v2/{refEntity}/{value}", refID: value}
+
+        value = [render(value) for value in value] if isinstance(value, list) else render(value)
+      item[name] = value
+    return item
+
+  def _metadata(self, entity: str):
+    """Metadata (metadata api)
+    @param entity table identifier in emx format: package_entity
+    @return dict
+    """
+    meta = self.meta.get(entity, {'idAttribute': 'id', 'attributes': ['id'], 'refs': {}})
+    items = []
+    for name in meta['attributes']:
+      data = {'name': name, 'idAttribute': name == meta['idAttribute']}
+      if name in meta['refs']:
+        data['refEntityType'] = {'self': f"{self.url}api/metadata/{meta['refs'][name]}"}
+      items.append({'data': data})
+    return {'data': {'id': entity, 'attributes': {'items': items}}}
+
+  def _import(self, run: dict, files: list, action: str):
+    """Import
+    Process the files of an import job after `importLatency` seconds. CSV
+    files must be named after an existing table (metadata is ignored).
+
+    @param run import run (row in sys_ImportRun)
+    @param files list of tuples (filename, bytes)
+    @param action import action: add, add_update_existing, update, or
+      add_ignore_existing
+    """
+    time.sleep(self.importLatency)
+    try:
+      contents = []
+      for filename, content in files:
+        if filename.endswith('.zip'):
+          with ZipFile(BytesIO(content)) as archive:
+            contents.extend((name, archive.read(name)) for name in archive.namelist())
+        else:
+          contents.append((filename, content))
+
+      imported = []
+      for filename, content in contents:
+        entity = re.sub(r'\.(csv|tsv|txt)$', '', filename.split('/')[-1])
+        if entity not in self.meta:
+          raise ValueError(f"Unknown entity type [{entity}]")
+
+        reader = csv.DictReader(StringIO(content.decode('utf-8')))
+        rows = [{name: value for name, value in row.items() if value != ''} for row in reader]
+        time.sleep(self.rowLatency * len(rows))
+        self._write(entity, rows, action)
+        imported.append(f"{entity}: {len(rows)}")
+
+      status, message = 'FINISHED', f"Imported {', '.join(imported)}"
+    except Exception as error:
+      status, message = 'FAILED', str(error)
+
+    with self._lock:
+      run.update({
+        'status': status,
+        'message': message,
+        'endDate': str(now(strftime=False)),
+        'progress': 100
+      })
+
+  def _write(self, entity: str, rows: list, action: str):
+    """Write rows
+    @param entity table identifier in emx format: package_entity
+    @param rows list of dictionaries in upload format
+    @param action add, add_update_existing, update, add_ignore_existing
+    @return list of identifiers
+    """
+    idAttribute = self._idAttribute(entity)
+    with self._lock:
+      table = self.tables[entity]
+      for row in rows:
+        if idAttribute not in row:
+          raise ValueError(f"The attribute '{idAttribute}' of entity '{entity}' can not be null.")
+        id = str(row[idAttribute])
+        if action == 'add' and id in table:
+          raise ValueError(f"Duplicate value '{id}' for unique attribute '{idAttribute}' from entity '{entity}'")
+        if action == 'update' and id not in table:
+          raise ValueError(f"Unknown entity with '{idAttribute}' '{id}' of type '{entity}'")
+
+      ids = []
+      for row in rows:
+        id = str(row[idAttribute])
+        ids.append(id)
+        if action == 'add_ignore_existing' and id in table:
+          continue
+        if action in ('add_update_existing', 'update') and id in table:
+          table[id] = {**table[id], **row} if action == 'update' else dict(row)
+        else:
+          table[id] = dict(row)
+        for name in row.keys():
+          if name not in self.meta[entity]['attributes']:
+            self.meta[entity]['attributes'].append(name)
+      return ids
+
+
+class _MolgenisRequestHandler(BaseHTTPRequestHandler):
+  """Request handler for MolgenisServer"""
+  molgenis = None
+  protocol_version = 'HTTP/1.1'
+  disable_nagle_algorithm = True
+
+  def log_message(self, *args):
+    pass
+
+  def _send(self, status: int, body=None, headers: dict = {}):
+    if isinstance(body, (dict, list)):
+      content = json.dumps(body).encode('utf-8')
+      contentType = 'application/json'
+    else:
+      content = (body or '').encode('utf-8')
+      contentType = 'text/plain'
+
+    self.send_response(status)
+    self.send_header('Content-Type', contentType)
+    self.send_header('Content-Length', str(len(content)))
+    for name, value in headers.items():
+      self.send_header(name, value)
+    self.end_headers()
+    self.wfile.write(content)
+    self.status = status
+
+  def _error(self, status: int, message: str):
+    self._send(status, {'errors': [{'message': message}]})
+
+  def _body(self):
+    return self.content
+
+  def _handle(self, method: str):
+    server = self.molgenis
+    started = time.perf_counter()
+    self.status = None
+    length = int(self.headers.get('Content-Length') or 0)
+    self.content = self.rfile.read(length) if length else b''
+    url = urlparse(self.path)
+    params = dict(parse_qsl(url.query, keep_blank_values=True))
+    parts = [unquote_plus(part) for part in url.path.strip('/').split('/')]
+    time.sleep(server.latency)
+
+    try:
+      if parts[:3] in (['api', 'v1', 'login'], ['api', 'v1', 'logout']):
+        if parts[2] == 'login':
+          self._send(200, {'token': server.token, 'username': json.loads(self._body()).get('username')})
+        else:
+          self._send(200)
+        return
+
+      if server.token and self.headers.get('x-molgenis-token') != server.token:
+        self._error(401, 'No authentication found')
+        return
+
+      if parts[:3] == ['plugin', 'importwizard', 'importFile'] and method == 'POST':
+        self._importFile(params)
+      elif parts[:2] == ['api', 'metadata'] and len(parts) == 3:
+        self._entity(parts[2])
+        self._send(200, server._metadata(parts[2]))
+      elif parts[:2] == ['api', 'v1'] and len(parts) >= 3:
+        self._v1(method, parts[2:])
+      elif parts[:2] == ['api', 'v2'] and len(parts) >= 3:
+        self._v2(method, parts[2:], params)
+      else:
+        self._error(404, f"No endpoint {method} {url.path}")
+    except KeyError as error:
+      self._error(404, f"Unknown entity type [{error.args[0]}]")
+    except ValueError as error:
+      self._error(400, str(error))
+    except Exception as error:
+      self._error(500, f"{type(error).__name__}: {error}")
+    finally:
+      with server._lock:
+        server.requests.append({
+          'method': method,
+          'path': url.path,
+          'status': self.status,
+          'elapsed': round(time.perf_counter() - started, 6)
+        })
+
+  def _entity(self, entity: str):
+    if entity not in self.molgenis.meta:
+      raise KeyError(entity)
+    return entity
+
+  def _v1(self, method: str, parts: list):
+    server = self.molgenis
+    entity = self._entity(parts[0])
+    if method == 'GET' and parts[1:] == ['meta']:
+      self._send(200, {
+        'name': entity,
+        'idAttribute': server._idAttribute(entity),
+        'attributes': {name: {'name': name} for name in server.meta[entity]['attributes']}
+      })
+    elif method == 'PUT' and len(parts) == 3:
+      value = json.loads(self._body())
+      time.sleep(server.rowLatency)
+      server._write(entity, [{server._idAttribute(entity): parts[1], parts[2]: value}], 'update')
+      self._send(200)
+    elif method == 'DELETE' and len(parts) <= 2:
+      with server._lock:
+        if len(parts) == 2:
+          if parts[1] not in server.tables[entity]:
+            raise ValueError(f"Unknown entity with id '{parts[1]}' of type '{entity}'")
+          del server.tables[entity][parts[1]]
+        else:
+          server.tables[entity].clear()
+      self._send(204)
+    else:
+      self._error(404, f"No endpoint {method} /api/v1/{'/'.join(parts)}")
+
+  def _v2(self, method: str, parts: list, params: dict):
+    server = self.molgenis
+    entity = self._entity(parts[0])
+    if method == 'GET' and len(parts) == 2:
+      with server._lock:
+        row = server.tables[entity].get(parts[1])
+      if row is None:
+        raise ValueError(f"Unknown entity with id '{parts[1]}' of type '{entity}'")
+      attributes, expand = self._attributes(params)
+      self._send(200, server._render(entity, row, attributes, expand))
+    elif method == 'GET':
+      self._get(entity, params)
+    elif method in ('POST', 'PUT'):
+      rows = json.loads(self._body())['entities']
+      time.sleep(server.rowLatency * len(rows))
+      ids = server._write(entity, rows, 'add' if method == 'POST' else 'update')
+      if method == 'POST':
+        self._send(201, {
+          'location': f"/api/v2/{entity}?q=id=in=({','.join(ids)})",
+          'resources': [{'href': f"/api/v2/{entity}/{id}"} for id in ids]
+        })
+      else:
+        self._send(200)
+    elif method == 'DELETE':
+      ids = json.loads(self._body())['entityIds']
+      with server._lock:
+        for id in ids:
+          server.tables[entity].pop(str(id), None)
+      self._send(204)
+    else:
+      self._error(404, f"No endpoint {method} /api/v2/{'/'.join(parts)}")
+
+  def _attributes(self, params: dict):
+    """Parse the attrs parameter
+    @return tuple of attributes (or None) and expanded attributes
+    """
+    if not params.get('attrs') or params.get('attrs') == '*':
+      return None, []
+    attrs = params['attrs'].split(',')
+    expand = [attr.replace('(*)', '') for attr in attrs if attr.endswith('(*)')]
+    attributes = [attr.replace('(*)', '') for attr in attrs if attr != '*']
+    return (None if '*' in attrs else attributes), expand
+
+  def _get(self, entity: str, params: dict):
+    """Get rows (v2 api)
+    Rows are filtered (q), sorted (sort=attribute:order) and returned in
+    batches of `num` rows (max 10000) starting at `start`.
+    """
+    server = self.molgenis
+    num = min(int(params.get('num', 100)), 10000)
+    start = int(params.get('start', 0))
+    rows = server.rows(entity)
+
+    if params.get('q'):
+      tree = parseRsql(params['q'])
+      for name in re.findall(r"([\w.]+)(?:==|!=|=in=|=out=|=ge=|=gt=|=le=|=lt=|=like=)", params['q']):
+        if name not in server.meta[entity]['attributes']:
+          raise ValueError(f"Unknown attribute '{name}' of entity type '{entity}'")
+      rows = [row for row in rows if _matchRow(row, tree)]
+
+    if params.get('sort'):
+      column, _, order = params['sort'].partition(':')
+      try:
+        rows.sort(
+          key=lambda row: (row.get(column) is None, row.get(column) if row.get(column) is not None else ''),
+          reverse=(order.lower() == 'desc')
+        )
+      except TypeError:
+        rows.sort(key=lambda row: str(row.get(column)), reverse=(order.lower() == 'desc'))
+
+    attributes, expand = self._attributes(params)
+    batch = rows[start:start + num]
+    time.sleep(server.rowLatency * len(batch))
+    with server._lock:
+      items = [server._render(entity, row, attributes, expand) for row in batch]
+
+    response = {
+      'href': f"/api/v2/{entity}",
+      'meta': {'name': entity, 'idAttribute': server._idAttribute(entity)},
+      'start': start,
+      'num': num,
+      'total': len(rows),
+      'items': items
+    }
+    if start + num < len(rows):
+      query = {**params, 'start': start + num, 'num': num}
+      response['nextHref'] = f"/api/v2/{entity}?" + '&'.join(f"{key}={value}" for key, value in query.items())
+    self._send(200, response)
+
+  def _importFile(self, params: dict):
+    """Import file (import wizard)
+    Start an import job for a CSV (named after the table) or zip file and
+    return the location of the import run. The status of the run can be
+    retrieved from `sys_ImportRun`.
+    """
+    server = self.molgenis
+    message = BytesParser(policy=policy.default).parsebytes(
+      f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode('utf-8') + self._body()
+    )
+    files = [
+      (part.get_filename(), part.get_payload(decode=True))
+      for part in message.iter_parts()
+      if part.get_filename()
+    ] if message.is_multipart() else []
+    if not files:
+      raise ValueError('No file was uploaded')
+
+    with server._lock:
+      id = f"import{len(server.tables['sys_ImportRun']) + 1}"
+      run = {
+        'id': id,
+        'status': 'RUNNING',
+        'message': None,
+        'startDate': str(now(strftime=False)),
+        'progress': 0,
+        'importedEntities': ','.join(filename for filename, _ in files)
+      }
+      server.tables['sys_ImportRun'][id] = run
+
+    job = threading.Thread(
+      target=server._import,
+      args=(run, files, params.get('action', 'add').lower()),
+      daemon=True
+    )
+    server._jobs.append(job)
+    job.start()
+    self._send(201, f"/api/v2/sys_ImportRun/{id}")
+
+  def do_GET(self):
+    self._handle('GET')
+
+  def do_POST(self):
+    self._handle('POST')
+
+  def do_PUT(self):
+    self._handle('PUT')
+
+  def do_DELETE(self):
+    self._handle('DELETE')
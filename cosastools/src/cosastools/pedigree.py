@@ -0,0 +1,255 @@
+from datatable import dt
+
+class Pedigree:
+  """Pedigree
+  Build family graphs from a subject-level datatable object. All lookups
+  (members by family, children by parent, subject attributes) are indexed
+  once so that proband status, missing parents, and families to remove can
+  be inferred without filtering the Frame for each subject or family.
+  """
+  def __init__(
+    self,
+    data,
+    subjectID: str = 'subjectID',
+    familyID: str = 'belongsToFamily',
+    motherID: str = 'belongsToMother',
+    fatherID: str = 'belongsToFather',
+    sex: str = 'genderAtBirth',
+    age: str = 'age',
+    affected: str = 'affected'
+  ):
+    """Pedigree
+    @param data datatable object with one row per subject
+    @param subjectID name of the column containing the subject identifier
+    @param familyID name of the column containing the family identifier
+    @param motherID name of the column containing the maternal identifier
+    @param fatherID name of the column containing the paternal identifier
+    @param sex name of the column containing the sex of the subject
+    @param age name of the column containing the age of the subject
+    @param affected name of the column containing the affected status. If
+      the column does not exist, affected status is unknown for all subjects
+    """
+    self.columns = {
+      'subjectID': subjectID,
+      'familyID': familyID,
+      'motherID': motherID,
+      'fatherID': fatherID,
+      'sex': sex,
+      'age': age,
+      'affected': affected
+    }
+    self.subjects = {}
+    self.families = {}
+    self.children = {}
+    self._build(data)
+
+  def _build(self, data):
+    """Build family graphs
+    Index subjects, family members, and parent-child edges in one pass over
+    the data. Duplicate subject identifiers are ignored after the first
+    occurrence.
+
+    @param data datatable object
+    """
+    keys = [key for key in self.columns.keys() if self.columns[key] in data.names]
+    columns = [self.columns[key] for key in keys]
+    for row in data[:, columns].to_tuples():
+      record = {key: None for key in self.columns.keys()}
+      record.update(zip(keys, row))
+      record['index'] = None
+      id = record['subjectID']
+      if id is None or id in self.subjects:
+        continue
+
+      self.subjects[id] = record
+      self.families.setdefault(record['familyID'], []).append(id)
+      for parent in ['motherID', 'fatherID']:
+        if record[parent] is not None:
+          self.children.setdefault(record[parent], []).append(id)
+
+  def _meanAge(self, familyID):
+    """Mean age of a family
+    @param familyID identifier of the family
+    @return float or NoneType if the age of all members is unknown
+    """
+    ages = [
+      self.subjects[id]['age']
+      for id in self.families[familyID]
+      if self.subjects[id]['age'] is not None
+    ]
+    return sum(ages) / len(ages) if ages else None
+
+  def inferProbands(self, verbose: bool = True):
+    """Infer proband status
+    The index is identified using affected status, the presence of parental
+    identifiers, and whether the subject is referenced as a parent. For
+    families where the status of one or more members is still unknown, the
+    age of the member is compared to the mean age of the family (if the family
+    already has an index).
+
+    @param verbose If True, families without an index will be printed
+    @return dict of subjectID and proband status (True, False, or None)
+    """
+    for id, subject in self.subjects.items():
+      index = subject['affected']
+      if subject['motherID'] or subject['fatherID']:
+        index = True
+      if id in self.children:
+        index = False
+      subject['index'] = index
+
+    for familyID, members in self.families.items():
+      unknown = [id for id in members if self.subjects[id]['index'] is None]
+      if not unknown:
+        continue
+
+      if any(self.subjects[id]['index'] is True for id in members):
+        meanAge = self._meanAge(familyID)
+        for id in unknown:
+          age = self.subjects[id]['age']
+          if (age is not None) and (meanAge is not None):
+            self.subjects[id]['index'] = age < meanAge
+      elif verbose:
+        print('Family', familyID, 'does not have an index')
+
+    return {id: subject['index'] for id, subject in self.subjects.items()}
+
+  def familiesToRemove(self):
+    """Families to remove
+    Families where the proband status of one or more members could not be
+    determined. It is difficult to determine the remaining relationships and
+    it is highly likely that data is missing.
+
+    @return set of family identifiers
+    """
+    return {
+      familyID
+      for familyID, members in self.families.items()
+      if any(self.subjects[id]['index'] is None for id in members)
+    }
+
+  def inferParents(self, female: str = 'female', male: str = 'male'):
+    """Infer missing parents
+    For all probands in families with more than one member, add the maternal
+    and paternal identifier if it is missing. The first family member of the
+    expected sex that is older than the mean age of the family is selected.
+    Run `inferProbands` first.
+
+    @param female value that indicates a subject is female
+    @param male value that indicates a subject is male
+    @return dict of subjectID and a tuple (maternalID, paternalID)
+    """
+    for familyID, members in self.families.items():
+      if len(members) < 2:
+        continue
+
+      meanAge = self._meanAge(familyID)
+      if meanAge is None:
+        continue
+
+      candidates = {female: [], male: []}
+      for id in members:
+        member = self.subjects[id]
+        if (
+          member['sex'] in candidates
+          and member['age'] is not None
+          and member['age'] > meanAge
+        ):
+          candidates[member['sex']].append(id)
+
+      for id in members:
+        subject = self.subjects[id]
+        if subject['index'] is not True:
+          continue
+        for parent, sex in [('motherID', female), ('fatherID', male)]:
+          if subject[parent] is None:
+            match = [candidate for candidate in candidates[sex] if candidate != id]
+            subject[parent] = match[0] if match else None
+
+    return {
+      id: (subject['motherID'], subject['fatherID'])
+      for id, subject in self.subjects.items()
+    }
+
+  def update(self, data, index: str = 'index', removeFamily: str = 'removeFamily'):
+    """Update Frame
+    Write the inferred proband status, parental identifiers, and family
+    removal status into a datatable object. Rows are matched by subject
+    identifier.
+
+    @param data datatable object used to build the pedigree
+    @param index name of the column to write proband status into
+    @param removeFamily name of the column to write family removal status into
+    """
+    familiesToRemove = self.familiesToRemove()
+    ids = data[:, self.columns['subjectID']].to_list()[0]
+    subjects = [self.subjects.get(id, {}) for id in ids]
+    data[index] = dt.Frame(
+      [subject.get('index') for subject in subjects],
+      type=dt.Type.bool8
+    )
+    data[self.columns['motherID']] = dt.Frame(
+      [subject.get('motherID') for subject in subjects],
+      type=dt.Type.str32
+    )
+    data[self.columns['fatherID']] = dt.Frame(
+      [subject.get('fatherID') for subject in subjects],
+      type=dt.Type.str32
+    )
+    data[removeFamily] = dt.Frame(
+      [subject.get('familyID') in familiesToRemove for subject in subjects],
+      type=dt.Type.bool8
+    )
+
+  def validateParents(self, female: str = 'female', male: str = 'male'):
+    """Validate parental links
+    Check all maternal and paternal identifiers (e.g., `umdm_subjects`) for
+    links that reference unknown subjects, the subject itself (i.e., fetus),
+    subjects from another family, a parent of an unexpected sex, or a parent
+    that is younger than the subject.
+
+    @param female value that indicates a subject is female
+    @param male value that indicates a subject is male
+    @return datatable object with one row per issue
+    """
+    issues = []
+    for id, subject in self.subjects.items():
+      for parent, relation, sex in [('motherID', 'mother', female), ('fatherID', 'father', male)]:
+        parentID = subject[parent]
+        if parentID is None:
+          continue
+
+        found = []
+        if parentID == id:
+          found.append('subject is own parent')
+        elif parentID not in self.subjects:
+          found.append('parent not registered')
+        else:
+          record = self.subjects[parentID]
+          if (
+            subject['familyID'] is not None and record['familyID'] is not None
+            and subject['familyID'] != record['familyID']
+          ):
+            found.append('parent belongs to another family')
+          if record['sex'] is not None and record['sex'] != sex:
+            found.append('unexpected sex')
+          if (
+            subject['age'] is not None and record['age'] is not None
+            and record['age'] <= subject['age']
+          ):
+            found.append('parent is not older than subject')
+
+        for issue in found:
+          issues.append({
+            'subjectID': id,
+            'belongsToFamily': subject['familyID'],
+            'relation': relation,
+            'parentID': parentID,
+            'issue': issue
+          })
+
+    columns = ['subjectID', 'belongsToFamily', 'relation', 'parentID', 'issue']
+    return dt.Frame(
+      {column: [issue[column] for issue in issues] for column in columns},
+      types=[dt.Type.str32] * len(columns)
+    )
@@ -0,0 +1,687 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from cosastools.logger import peakMemoryUsage, countRows
+from datatable import dt
+from os import path, makedirs, remove
+import multiprocessing
+import tempfile
+import threading
+import hashlib
+import inspect
+import shutil
+import pickle
+import json
+import time
+
+# pipelines that are running in process mode (see `_runStageInProcess`)
+_PIPELINES = {}
+
+def isFrame(value):
+  """Is Frame
+  @param value any object
+  @return True if the object is a datatable object
+  """
+  return isinstance(value, dt.Frame)
+
+def fingerprintValue(value):
+  """Fingerprint Value
+  Create a hash of an input of a stage. Frames are hashed using the key and
+  the JAY representation. The JAY representation of a view differs from the
+  same data in memory and includes the NA counts and min/max values of a
+  column if these were computed. A materialized copy with all statistics is
+  used instead, so that equal Frames have the same hash. Frames with object
+  columns (which cannot be saved as JAY) are written as csv. All other
+  objects are pickled.
+
+  @param value datatable object or any object that can be pickled
+  @return string
+  """
+  if not isFrame(value):
+    return hashlib.sha1(pickle.dumps(value)).hexdigest()
+  digest = hashlib.sha1(repr((value.stypes, value.key)).encode('utf-8'))
+  if dt.Type.obj64 in value.types:
+    digest.update(value.to_csv().encode('utf-8'))
+  else:
+    copy = value.copy()
+    copy.materialize()
+    copy.countna()
+    copy.min()
+    digest.update(copy.to_jay())
+  return digest.hexdigest()
+
+def sourceOf(function):
+  """Source Of
+  Get the source code of the module the function is defined in, so that
+  changes to helper functions used by a stage are detected. If the module
+  is not available (e.g., interactive sessions), the source of the function
+  is used instead.
+
+  @param function a function
+  @return string or NoneType if the source cannot be found
+  """
+  for obj in [inspect.getmodule(function), function]:
+    try:
+      return inspect.getsource(obj)
+    except (OSError, TypeError):
+      continue
+  return None
+
+class Stage:
+  """Stage
+  A step of a pipeline that transforms one or more inputs into one or more
+  outputs. The inputs are the parameters of the function (except `step`) and
+  are passed in by name. If the function has a parameter `step`, the log of
+  the current step is passed in so that the status and comments can be set.
+  """
+  def __init__(
+    self,
+    function,
+    outputs: list,
+    name: str = None,
+    type: str = 'Data Processing',
+    tablename: str = None,
+    local: bool = False,
+    version: str = None,
+    cache: bool = True
+  ):
+    """Stage
+    @param function function to run
+    @param outputs names of the objects returned by the function. If there
+      is more than one output, the function must return a tuple in the same
+      order.
+    @param name name of the stage (default: name of the function)
+    @param type data handling type (see `cosasreports_refs_datahandling`)
+    @param tablename database table the stage relates to
+    @param local If True, the stage is always run in the main process (e.g.,
+      stages that use a database connection)
+    @param version version of the stage. Changes to the module that defines
+      the function are detected automatically; change the version to
+      invalidate the cache when code in other modules changes.
+    @param cache If False, the outputs are never loaded from the cache (e.g.,
+      stages that read data from a database or an API). Stages without
+      inputs are never cached, as their fingerprint would never change.
+    """
+    self.function = function
+    self.name = name or function.__name__
+    self.type = type
+    self.tablename = tablename
+    self.local = local
+    self.outputs = [outputs] if isinstance(outputs, str) else list(outputs)
+    parameters = inspect.signature(function).parameters
+    self.inputs = [param for param in parameters if param != 'step']
+    self.usesStep = 'step' in parameters
+    self.version = version
+    self.cache = cache and bool(self.inputs)
+    self.source = '\n'.join([
+      self.name,
+      str(version),
+      sourceOf(function) or ''
+    ])
+
+  def fingerprint(self, data: dict):
+    """Fingerprint
+    Create a hash of the source code of the module the stage is defined in,
+    the version of the stage, and all inputs. If the fingerprint has not
+    changed since the last run, the outputs can be loaded from the cache.
+
+    @param data dictionary containing all inputs of the stage
+    @return string
+    """
+    digest = hashlib.sha1(self.source.encode('utf-8'))
+    for input in self.inputs:
+      digest.update(input.encode('utf-8'))
+      digest.update(fingerprintValue(data[input]).encode('utf-8'))
+    return digest.hexdigest()
+
+  def run(self, data: dict, step: dict = None):
+    """Run stage
+    @param data dictionary containing all inputs of the stage
+    @param step log of the current processing step
+    @return dictionary with the outputs of the stage
+    """
+    kwargs = {input: data[input] for input in self.inputs}
+    if self.usesStep:
+      kwargs['step'] = step if step is not None else {}
+    result = self.function(**kwargs)
+    if len(self.outputs) == 1:
+      result = (result,)
+    if len(result) != len(self.outputs):
+      raise ValueError(
+        f'Stage {self.name} returned {len(result)} objects, but expected {len(self.outputs)}'
+      )
+    return dict(zip(self.outputs, result))
+
+class Pipeline:
+  """Pipeline
+  Run a set of stages in order of their inputs and outputs. Stages whose
+  inputs are available are run at the same time (see `workers`), and if a
+  cache directory is set, stages whose inputs have not changed since the
+  last run are loaded from the cache rather than run again. Each stage is
+  logged as a processing step if a `cosasLogger` is provided.
+
+  @examples
+  pipeline = Pipeline(logger=cosaslogs, workers=4, executor='process')
+
+  @pipeline.stage(outputs='subjects', tablename='subjects')
+  def buildSubjects(raw_subjects, step):
+    ...
+    return subjects
+
+  results = pipeline.run({'raw_subjects': raw_subjects})
+  """
+  def __init__(
+    self,
+    logger=None,
+    cacheDir: str = None,
+    workers: int = 1,
+    executor: str = 'thread',
+    checkpointDir: str = None
+  ):
+    """Pipeline
+    @param logger a `cosasLogger` object
+    @param cacheDir directory to save the outputs of each stage. If None,
+      all stages are always run.
+    @param workers maximum number of stages to run at the same time
+    @param executor run stages in a pool of 'thread' or 'process' (see `run`)
+    @param checkpointDir run directory to save the outputs of each stage, so
+      that a failed run can be resumed (see `run`)
+    """
+    self.logger = logger
+    self.cacheDir = cacheDir
+    self.checkpointDir = checkpointDir
+    self.workers = max(1, workers)
+    self.executor = executor
+    self.stages = {}
+    self._paths = {}
+    self._mapped = set()
+    self._lock = threading.Lock()
+    for directory in [cacheDir, checkpointDir]:
+      if directory and not path.exists(directory):
+        makedirs(directory)
+
+  def add(self, stage: Stage):
+    """Add a stage
+    @param stage a `Stage` object
+    """
+    for name, existing in self.stages.items():
+      overlap = set(existing.outputs).intersection(stage.outputs)
+      if overlap and name != stage.name:
+        raise ValueError(
+          f"Stage {stage.name} cannot create {', '.join(overlap)} (defined in {name})"
+        )
+    self.stages[stage.name] = stage
+
+  def stage(
+    self,
+    outputs,
+    name: str = None,
+    type: str = 'Data Processing',
+    tablename: str = None,
+    local: bool = False,
+    version: str = None,
+    cache: bool = True
+  ):
+    """Stage decorator
+    Register a function as a stage (see `Stage`)
+
+    @param outputs names of the objects returned by the function
+    @param name name of the stage (default: name of the function)
+    @param type data handling type
+    @param tablename database table the stage relates to
+    @param local If True, the stage is always run in the main process
+    @param version version of the stage (see `Stage`)
+    @param cache If False, the outputs are never loaded from the cache
+    """
+    def decorator(function):
+      self.add(Stage(
+        function,
+        outputs=outputs,
+        name=name,
+        type=type,
+        tablename=tablename,
+        local=local,
+        version=version,
+        cache=cache
+      ))
+      return function
+    return decorator
+
+  def order(self, data: dict = None, targets: list = None, skip: list = None):
+    """Order stages
+    Sort stages by their dependencies. If targets are defined, only the
+    stages that are needed to create the targets are returned.
+
+    @param data dictionary of all inputs that are already available
+    @param targets names of the outputs to create
+    @param skip names of stages to leave out (e.g., restored stages)
+    @return list of `Stage` objects
+    """
+    available = set((data or {}).keys())
+    producers = {
+      output: stage for stage in self.stages.values() for output in stage.outputs
+    }
+
+    skip = skip or []
+    required = [stage for stage in self.stages.values() if stage.name not in skip]
+    if targets:
+      required, queue = {}, list(targets)
+      while queue:
+        output = queue.pop()
+        if output in available:
+          continue
+        if output in producers and producers[output].name in skip:
+          continue
+        if output not in producers:
+          raise KeyError(f'Cannot find a stage that creates {output}')
+        stage = producers[output]
+        if stage.name not in required:
+          required[stage.name] = stage
+          queue.extend(stage.inputs)
+      required = [stage for stage in self.stages.values() if stage.name in required]
+
+    ordered = []
+    while required:
+      ready = [
+        stage for stage in required
+        if all(input in available for input in stage.inputs)
+      ]
+      if not ready:
+        missing = {
+          stage.name: [input for input in stage.inputs if input not in available]
+          for stage in required
+        }
+        raise ValueError(f'Unable to resolve inputs of stages: {missing}')
+      for stage in ready:
+        ordered.append(stage)
+        available.update(stage.outputs)
+        required.remove(stage)
+    return ordered
+
+  def _cachePath(self, stage: Stage, name: str):
+    return path.join(self.cacheDir, f'{stage.name}_{name}')
+
+  def _loadCache(self, stage: Stage, fingerprint: str):
+    """Load outputs of a stage from the cache
+    Reading and writing the cache is not done at the same time by more than
+    one stage, as `dt.fread` is not thread-safe.
+
+    @return dictionary or NoneType if the cache is missing or out of date
+    """
+    manifest = self._cachePath(stage, 'manifest.json')
+    if not path.exists(manifest):
+      return None
+    with open(manifest, 'r', encoding='utf-8') as file:
+      cache = json.load(file)
+    if cache.get('fingerprint') != fingerprint or cache.get('outputs') != stage.outputs:
+      return None
+
+    outputs = {}
+    for output in stage.outputs:
+      if path.exists(self._cachePath(stage, f'{output}.jay')):
+        outputs[output] = dt.fread(self._cachePath(stage, f'{output}.jay'))
+      elif path.exists(self._cachePath(stage, f'{output}.pickle')):
+        with open(self._cachePath(stage, f'{output}.pickle'), 'rb') as file:
+          outputs[output] = pickle.load(file)
+      else:
+        return None
+    return outputs
+
+  def _saveCache(self, stage: Stage, fingerprint: str, outputs: dict):
+    """Save the outputs of a stage and the fingerprint of its inputs"""
+    for output, value in outputs.items():
+      if isFrame(value):
+        value.to_jay(self._cachePath(stage, f'{output}.jay'))
+      else:
+        with open(self._cachePath(stage, f'{output}.pickle'), 'wb') as file:
+          pickle.dump(value, file)
+    with open(self._cachePath(stage, 'manifest.json'), 'w', encoding='utf-8') as file:
+      json.dump({'fingerprint': fingerprint, 'outputs': stage.outputs}, file)
+
+  def _runStage(self, stage: Stage, data: dict, step: dict):
+    """Run a stage or load its outputs from the cache
+    @param stage a `Stage` object
+    @param data dictionary containing the inputs of the stage
+    @param step log of the current processing step
+    @return dictionary with the outputs of the stage
+    """
+    fingerprint = stage.fingerprint(data) if self.cacheDir and stage.cache else None
+    outputs = None
+    if fingerprint:
+      with self._lock:
+        outputs = self._loadCache(stage, fingerprint)
+    if outputs is not None:
+      step['status'] = 'Pass'
+      step['comment'] = 'inputs unchanged; outputs loaded from cache'
+    else:
+      outputs = stage.run(data, step)
+      if fingerprint:
+        with self._lock:
+          self._saveCache(stage, fingerprint, outputs)
+    return outputs
+
+  def _writeInputs(self, stage: Stage, data: dict, tempDir: str):
+    """Prepare the inputs of a stage for a worker process
+    Frames are written to JAY files (once per object) so that the worker
+    can memory-map the data rather than receive a copy through a pipe. All
+    other objects are pickled.
+
+    @return dictionary of input name and a tuple (kind, value)
+    """
+    inputs = {}
+    for input in stage.inputs:
+      value = data[input]
+      if isFrame(value):
+        if input not in self._paths:
+          self._paths[input] = path.join(tempDir, f'{input}.jay')
+          value.to_jay(self._paths[input])
+        inputs[input] = ('jay', self._paths[input])
+      else:
+        inputs[input] = ('value', value)
+    return inputs
+
+  def _readOutputs(self, outputs: dict, tempDir: str = None):
+    """Read the outputs created by a worker process
+    @param outputs dictionary of output name and a tuple (kind, value)
+    @param tempDir temporary directory of the current run
+    @return dictionary
+    """
+    data = {}
+    for output, (kind, value) in outputs.items():
+      if kind == 'jay':
+        self._paths[output] = value
+        if tempDir and value.startswith(tempDir):
+          self._mapped.add(output)
+        data[output] = dt.fread(value)
+      else:
+        data[output] = value
+    return data
+
+  def _checkpointPath(self, name: str):
+    return path.join(self.checkpointDir, name)
+
+  def _readManifest(self):
+    """Read the list of checkpoints of the current run directory
+    @return dictionary of stage name and a dictionary of output files
+    """
+    manifest = self._checkpointPath('checkpoints.json')
+    if not path.exists(manifest):
+      return {}
+    with open(manifest, 'r', encoding='utf-8') as file:
+      return json.load(file)
+
+  def _saveCheckpoint(self, stage: Stage, outputs: dict):
+    """Save the outputs of a stage in the run directory
+    Frames that were written to the run directory by a worker process are
+    not written again.
+    """
+    files = {}
+    for output, value in outputs.items():
+      if isFrame(value):
+        file = self._checkpointPath(f'{output}.jay')
+        if self._paths.get(output) != file:
+          value.to_jay(file)
+          self._paths[output] = file
+      else:
+        file = self._checkpointPath(f'{output}.pickle')
+        with open(file, 'wb') as handle:
+          pickle.dump(value, handle)
+      files[output] = path.basename(file)
+
+    manifest = self._readManifest()
+    manifest[stage.name] = files
+    with open(self._checkpointPath('checkpoints.json'), 'w', encoding='utf-8') as file:
+      json.dump(manifest, file, indent=2)
+
+  def restore(self, stages: list = None):
+    """Restore checkpoints
+    Load the outputs of one or more stages from the run directory. Frames
+    are memory-mapped, so only the data that is used is read from disk.
+
+    @param stages names of the stages to restore. If None, all stages are
+      restored.
+    @return dictionary of output name and object
+    """
+    if not self.checkpointDir:
+      raise ValueError('Checkpoints cannot be restored if checkpointDir is not set')
+
+    manifest = self._readManifest()
+    data = {}
+    for name in (stages if stages is not None else list(self.stages.keys())):
+      if name not in manifest:
+        raise ValueError(f'No checkpoint found for stage {name} in {self.checkpointDir}')
+      for output, file in manifest[name].items():
+        file = self._checkpointPath(file)
+        if file.endswith('.jay'):
+          data[output] = dt.fread(file)
+          self._paths[output] = file
+        else:
+          with open(file, 'rb') as handle:
+            data[output] = pickle.load(handle)
+    return data
+
+  def downstream(self, name: str):
+    """Downstream stages
+    Find a stage and all stages that use its outputs (directly or indirectly)
+
+    @param name name of a stage
+    @return list of stage names
+    """
+    if name not in self.stages:
+      raise KeyError(f'Stage {name} does not exist')
+    found, outputs = [name], set(self.stages[name].outputs)
+    changed = True
+    while changed:
+      changed = False
+      for stage in self.stages.values():
+        if stage.name not in found and outputs.intersection(stage.inputs):
+          found.append(stage.name)
+          outputs.update(stage.outputs)
+          changed = True
+    return found
+
+  def run(
+    self,
+    data: dict = None,
+    targets: list = None,
+    executor: str = None,
+    resumeFrom: str = None
+  ):
+    """Run pipeline
+    Stages are run by a pool of threads or processes. Processes are useful
+    for stages that spend most of the time in Python code (e.g., list
+    comprehensions), which do not run at the same time in threads. In
+    process mode, Frames are passed between stages as JAY files in a
+    temporary directory (or the run directory if `checkpointDir` is set),
+    and the worker processes are forked so that stages can be defined in
+    scripts. Process mode is only available on platforms that support `fork`.
+    Stages marked as `local` are always run in the main process.
+
+    If the logger is profiling memory usage (`cosasLogger(profile=True)`),
+    stages are run one at a time in a thread instead. Tracemalloc only traces
+    the main process, and the allocations of stages that run at the same time
+    would be attributed to the step that is closed first.
+
+    If `checkpointDir` is set, the outputs of all stages are saved in the
+    run directory. A failed run can be resumed from a stage: the stage and
+    all stages that depend on it are run again, and the outputs of all other
+    stages are restored from the checkpoints of the previous run.
+
+    @param data dictionary containing all inputs (e.g., source data and
+      mapping tables)
+    @param targets names of the outputs to create. If None, all stages are run.
+    @param executor 'thread' or 'process' (default: the executor of the
+      pipeline)
+    @param resumeFrom name of the stage to resume from (requires `checkpointDir`)
+
+    @return dictionary of all inputs and outputs
+    """
+    executor = executor or self.executor
+    if executor not in ['thread', 'process']:
+      raise ValueError(f"Executor must be 'thread' or 'process', not {executor}")
+
+    workers = self.workers
+    if getattr(self.logger, 'profile', False):
+      executor, workers = 'thread', 1
+
+    data = dict(data or {})
+    self._paths = {}
+    self._mapped = set()
+
+    restored = []
+    if resumeFrom:
+      rerun = self.downstream(resumeFrom)
+      restored = [name for name in self.stages if name not in rerun]
+      data.update(self.restore(restored))
+    elif self.checkpointDir:
+      manifest = self._checkpointPath('checkpoints.json')
+      if path.exists(manifest):
+        remove(manifest)
+
+    pending = self.order(data, targets, skip=restored)
+    for name in restored:
+      step = self._openStep(self.stages[name], data)
+      step['status'] = 'Pass'
+      step['comment'] = f'restored from checkpoint in {self.checkpointDir}'
+      self._closeStep(self.stages[name], step, data)
+
+    running = {}
+    tempDir = None
+    if executor == 'process':
+      tempDir = tempfile.mkdtemp(prefix='cosas-pipeline-')
+      _PIPELINES[id(self)] = self
+      pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('fork')
+      )
+    else:
+      pool = ThreadPoolExecutor(max_workers=workers)
+
+    try:
+      with pool:
+        while pending or running:
+          # only submit stages when a worker is available so that the time
+          # spent waiting in the queue is not logged as elapsed time
+          ready = [stage for stage in pending if all(input in data for input in stage.inputs)]
+          for stage in ready[:workers - len(running)]:
+            pending.remove(stage)
+            step = self._openStep(stage, data)
+            inputs = {input: data[input] for input in stage.inputs}
+            if stage.local:
+              try:
+                outputs = self._runStage(stage, inputs, step)
+              except Exception as error:
+                self._failStep(stage, step, error)
+                raise
+              self._completeStage(stage, step, outputs, data)
+            elif executor == 'process':
+              inputs = self._writeInputs(stage, data, tempDir)
+              outputDir = self.checkpointDir or tempDir
+              future = pool.submit(_runStageInProcess, id(self), stage.name, inputs, outputDir)
+              running[future] = (stage, step)
+            else:
+              future = pool.submit(self._runStage, stage, inputs, step)
+              running[future] = (stage, step)
+
+          if not running:
+            continue
+
+          finished, _ = wait(running, return_when=FIRST_COMPLETED)
+          for future in finished:
+            stage, step = running.pop(future)
+            try:
+              outputs = future.result()
+              if executor == 'process':
+                step.update(outputs['step'])
+                outputs = self._readOutputs(outputs['outputs'], tempDir)
+            except Exception as error:
+              self._failStep(stage, step, error)
+              raise
+            self._completeStage(stage, step, outputs, data)
+    finally:
+      _PIPELINES.pop(id(self), None)
+      if tempDir:
+        # Frames read from JAY files in the temporary directory are memory-mapped
+        for output in self._mapped:
+          if output in data:
+            data[output].materialize(to_memory=True)
+        shutil.rmtree(tempDir, ignore_errors=True)
+    return data
+
+  def _completeStage(self, stage: Stage, step: dict, outputs: dict, data: dict):
+    """Save the outputs of a finished stage"""
+    if self.checkpointDir:
+      self._saveCheckpoint(stage, outputs)
+    self._closeStep(stage, step, outputs, data)
+    data.update(outputs)
+
+  def _failStep(self, stage: Stage, step: dict, error: Exception):
+    """Log a stage that raised an error
+    The status and comment are only set if they were not set in the stage.
+    """
+    if step.get('status') in [None, 'Success']:
+      step['status'] = 'Error'
+    if not step.get('comment'):
+      step['comment'] = str(error)
+    self._closeStep(stage, step, None)
+
+  def _openStep(self, stage: Stage, data: dict):
+    """Start the log of a stage
+    @return dictionary
+    """
+    rowsIn = countRows(data[stage.inputs[0]]) if stage.inputs else None
+    if self.logger:
+      return self.logger.openProcessingStep(stage.type, stage.name, stage.tablename, rowsIn)
+    return {'status': None, 'comment': None}
+
+  def _closeStep(self, stage: Stage, step: dict, outputs: dict = None, data: dict = None):
+    """Stop the log of a stage
+    The input and output Frames of the stage are passed to the logger so
+    that their size is recorded when profiling.
+    """
+    rowsOut = countRows(outputs[stage.outputs[0]]) if outputs else None
+    if step.get('status') is None:
+      step['status'] = 'Success'
+    if self.logger:
+      frames = {
+        name: value
+        for name, value in list((data or {}).items()) + list((outputs or {}).items())
+        if name in stage.inputs + stage.outputs and isFrame(value)
+      }
+      self.logger.closeProcessingStep(step, rowsOut, frames=frames)
+
+def _runStageInProcess(pipelineID: int, stageName: str, inputs: dict, outputDir: str):
+  """Run a stage in a worker process
+  The pipeline is found in the memory of the forked worker process, so that
+  only the name of the stage and the location of the inputs are sent to the
+  worker.
+
+  @param pipelineID identifier of the pipeline
+  @param stageName name of the stage to run
+  @param inputs dictionary of input name and a tuple (kind, value)
+  @param outputDir directory to write Frames into
+
+  @return dictionary with the outputs and the log of the step
+  """
+  pipeline = _PIPELINES[pipelineID]
+  stage = pipeline.stages[stageName]
+  data = {
+    input: dt.fread(value) if kind == 'jay' else value
+    for input, (kind, value) in inputs.items()
+  }
+
+  step = {'status': None, 'comment': None}
+  cpu = time.process_time()
+  memory = peakMemoryUsage()
+  outputs = pipeline._runStage(stage, data, step)
+  step['cpuTime'] = round(time.process_time() - cpu, 6)
+  if memory is not None:
+    step['peakMemoryIncrease'] = round(peakMemoryUsage() - memory, 3)
+
+  results = {}
+  for output, value in outputs.items():
+    if isFrame(value):
+      file = path.join(outputDir, f'{output}.jay')
+      value.to_jay(file)
+      results[output] = ('jay', file)
+    else:
+      results[output] = ('value', value)
+  return {'outputs': results, 'step': step}
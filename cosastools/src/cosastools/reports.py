@@ -0,0 +1,400 @@
+from datatable import dt, f
+from datetime import datetime, timedelta, timezone
+from statistics import median
+from collections import deque
+
+# Upper bounds (in seconds) of the bins used to summarise job durations. The
+# percentiles of a job are estimated from the counts per bin, which allows the
+# statistics to be updated without retrieving the full execution history.
+JOB_DURATION_BINS = [
+  1, 2, 5, 10, 20, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 14400,
+  28800, 86400
+]
+
+# executions with any other status (e.g., PENDING, RUNNING) are not finished
+JOB_FINISHED_STATUSES = ['SUCCESS', 'FAILED', 'CANCELED']
+
+def buildCompletenessSnapshot(summary, date: str):
+  """Build Completeness Snapshot
+  Create the rows for `cosasreports_attributesummaryhistory` from the
+  attribute summary. Each row is identified by attribute and date, so
+  importing a snapshot more than once on the same day updates the
+  existing rows.
+
+  @param summary datatable object with the columns identifier, databaseTable,
+    databaseColumn, countOfValues, totalValues, and percentComplete
+  @param date date of the snapshot (yyyy-mm-dd)
+
+  @return datatable object
+  """
+  snapshot = summary[:, {
+    'attribute': f.identifier,
+    'databaseTable': f.databaseTable,
+    'databaseColumn': f.databaseColumn,
+    'countOfValues': f.countOfValues,
+    'totalValues': f.totalValues,
+    'percentComplete': f.percentComplete
+  }]
+  snapshot['date'] = date
+  snapshot['identifier'] = snapshot[:, f.attribute + '_' + f.date]
+  return snapshot[:, [f.identifier, f.date, f[:].remove([f.identifier, f.date])]]
+
+def getCompletenessHistory(session, attribute: str = None, days: int = 30, today: str = None):
+  """Get Completeness History
+  Retrieve the completeness of one or more attributes over a number of days.
+  The date range is filtered on the server.
+
+  @param session an active Molgenis session
+  @param attribute identifier of an attribute (databaseTable_databaseColumn).
+    If None, all attributes are returned.
+  @param days number of days to retrieve (including today)
+  @param today end of the range (yyyy-mm-dd). If None, the current date is used.
+
+  @return datatable object sorted by attribute and date
+  """
+  end = datetime.strptime(today, '%Y-%m-%d') if today else datetime.now()
+  start = (end - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+  query = f"date=ge={start};date=le={end.strftime('%Y-%m-%d')}"
+  if attribute:
+    query = f"{query};attribute=={attribute}"
+
+  data = dt.Frame(
+    session.get(
+      entity='cosasreports_attributesummaryhistory',
+      q=query,
+      batch_size=10000
+    )
+  )
+  if '_href' in data.names:
+    del data['_href']
+  if not data.nrows:
+    return data
+  return data[:, :, dt.sort(f.attribute, f.date)]
+
+def parseTimestamp(value: str = None):
+  """Parse Timestamp
+  Timestamps without an offset are assumed to be in UTC so that all
+  timestamps can be compared.
+
+  @param value ISO 8601 timestamp (e.g., '2023-07-01T00:00:00Z' or
+    '2023-07-01T02:00:00.000+02:00')
+  @return datetime or NoneType
+  """
+  if not value:
+    return None
+  timestamp = datetime.fromisoformat(value.replace('Z', '+00:00'))
+  if timestamp.tzinfo is None:
+    timestamp = timestamp.replace(tzinfo=timezone.utc)
+  return timestamp
+
+def _submissionOrder(execution: dict):
+  """Sort key of an execution: executions without a submission date first"""
+  submissionDate = parseTimestamp(execution.get('submissionDate'))
+  return submissionDate or datetime.min.replace(tzinfo=timezone.utc)
+
+def durationPercentile(histogram: list, percentile: float):
+  """Duration Percentile
+  Estimate a percentile from the number of executions per duration bin (see
+  `JOB_DURATION_BINS`). The upper bound of the bin that contains the
+  percentile is returned.
+
+  @param histogram list of counts per bin; the last bin is for executions
+    longer than the largest bound
+  @param percentile a number between 0 and 1
+
+  @return int (seconds) or NoneType
+  """
+  total = sum(histogram)
+  if not total:
+    return None
+  cumulative = 0
+  for index, count in enumerate(histogram):
+    cumulative += count
+    if cumulative >= percentile * total:
+      return JOB_DURATION_BINS[min(index, len(JOB_DURATION_BINS) - 1)]
+
+def getJobStatistics(session):
+  """Get Job Statistics
+  Retrieve the statistics of all jobs from `cosasreports_jobstatistics`
+
+  @param session an active Molgenis session
+  @return dict of job name and statistics
+  """
+  statistics = {}
+  for row in session.get('cosasreports_jobstatistics', batch_size=10000):
+    row.pop('_href', None)
+    histogram = row.get('durationHistogram')
+    row['durationHistogram'] = (
+      [int(count) for count in histogram.split(',')]
+      if histogram else [0] * (len(JOB_DURATION_BINS) + 1)
+    )
+    pending = row.get('pendingExecutions')
+    row['pendingExecutions'] = pending.split(',') if pending else []
+    statistics[row['name']] = row
+  return statistics
+
+def getJobWatermark(statistics: dict, default: str = None):
+  """Get Job Watermark
+  The submission date of the most recent execution that was processed.
+  Timestamps are compared as dates, not as strings, as the offset of the
+  timestamps may differ.
+
+  @param statistics dict of job name and statistics (see `getJobStatistics`)
+  @param default date to use if no executions were processed. If None, the
+    complete history of executions is retrieved on the first run.
+
+  @return string or NoneType
+  """
+  dates = [
+    job['lastSubmissionDate'] for job in statistics.values()
+    if job.get('lastSubmissionDate')
+  ]
+  return max(dates, key=parseTimestamp) if dates else default
+
+def getPendingExecutions(statistics: dict):
+  """Get Pending Executions
+  Identifiers of the executions that had not finished within the maximum
+  pending time (see `updateJobStatistics`)
+
+  @param statistics dict of job name and statistics (see `getJobStatistics`)
+  @return list of identifiers
+  """
+  return sorted({
+    identifier
+    for job in statistics.values()
+    for identifier in job.get('pendingExecutions') or []
+  })
+
+def getJobExecutions(session, watermark: str = None, exclude: list = None, pending: list = None):
+  """Get Job Executions
+  Retrieve all script executions that were submitted after the watermark and
+  the executions that were still pending on a previous run.
+
+  @param session an active Molgenis session
+  @param watermark ISO 8601 timestamp (see `getJobWatermark`). If None, all
+    executions are retrieved.
+  @param exclude names of jobs to ignore (e.g., ['TEST'])
+  @param pending identifiers of executions to retrieve again (see
+    `getPendingExecutions`)
+
+  @return list of dictionaries
+  """
+  filters = [f'name!={name}' for name in exclude or []]
+  queries = [';'.join(([f'submissionDate=gt={watermark}'] if watermark else []) + filters)]
+  if pending:
+    queries.append(';'.join([f"identifier=in=({','.join(pending)})"] + filters))
+
+  executions = {}
+  for query in queries:
+    for row in session.get(
+      'sys_job_ScriptJobExecution',
+      attributes='identifier,name,status,submissionDate,startDate,endDate',
+      q=query or None,
+      sort_column='submissionDate',
+      batch_size=10000
+    ):
+      executions[row.get('identifier')] = row
+  return list(executions.values())
+
+def newJobStatistics(name: str):
+  """New Job Statistics
+  @param name name of the job
+  @return dict
+  """
+  return {
+    'name': name,
+    'numberOfRuns': 0,
+    'numberOfSuccessfulRuns': 0,
+    'durationHistogram': [0] * (len(JOB_DURATION_BINS) + 1),
+    'pendingExecutions': []
+  }
+
+def updateJobStatistics(statistics: dict, executions: list, maxPendingTime: float = 48):
+  """Update Job Statistics
+  Add new executions to the statistics of each job. Executions are processed
+  in order of submission up to the first execution that has not finished.
+  That execution (and all executions submitted after it) are retrieved again
+  on the next run. Executions that have not finished within the maximum
+  pending time are skipped so that they do not hold back the watermark. The
+  identifiers of these executions are kept in `pendingExecutions` and are
+  retrieved again until they have finished (see `getJobExecutions`).
+
+  @param statistics dict of job name and statistics (see `getJobStatistics`)
+  @param executions list of executions (see `getJobExecutions`)
+  @param maxPendingTime number of hours after which an execution that has not
+    finished is skipped
+
+  @return dict of job name and statistics
+  """
+  cutoff = datetime.now(timezone.utc) - timedelta(hours=maxPendingTime)
+  for execution in sorted(executions, key=_submissionOrder):
+    name = execution['name']
+    identifier = execution.get('identifier')
+    submissionDate = parseTimestamp(execution.get('submissionDate'))
+    if execution.get('status') not in JOB_FINISHED_STATUSES:
+      if submissionDate and submissionDate < cutoff:
+        job = statistics.setdefault(name, newJobStatistics(name))
+        job.setdefault('pendingExecutions', [])
+        if identifier is not None and str(identifier) not in job['pendingExecutions']:
+          job['pendingExecutions'].append(str(identifier))
+        continue
+      break
+
+    job = statistics.setdefault(name, newJobStatistics(name))
+    pending = job.get('pendingExecutions') or []
+    if identifier is not None and str(identifier) in pending:
+      pending.remove(str(identifier))
+
+    job['numberOfRuns'] = (job.get('numberOfRuns') or 0) + 1
+    if execution['status'] == 'SUCCESS':
+      job['numberOfSuccessfulRuns'] = (job.get('numberOfSuccessfulRuns') or 0) + 1
+
+    startDate = parseTimestamp(execution.get('startDate'))
+    endDate = parseTimestamp(execution.get('endDate'))
+    if startDate and endDate:
+      duration = (endDate - startDate).total_seconds()
+      durationBin = next(
+        (index for index, bound in enumerate(JOB_DURATION_BINS) if duration <= bound),
+        len(JOB_DURATION_BINS)
+      )
+      job['durationHistogram'][durationBin] += 1
+
+    # executions that were pending are older than the last processed execution
+    lastSubmissionDate = parseTimestamp(job.get('lastSubmissionDate'))
+    if not lastSubmissionDate or (submissionDate and submissionDate >= lastSubmissionDate):
+      job['lastRun'] = execution['submissionDate'].split('T')[0]
+      job['lastStatus'] = execution['status']
+      job['lastSubmissionDate'] = execution['submissionDate']
+
+  for job in statistics.values():
+    job['successRate'] = (
+      round(job['numberOfSuccessfulRuns'] / job['numberOfRuns'], 4)
+      if job.get('numberOfRuns') else None
+    )
+    job['durationMedian'] = durationPercentile(job['durationHistogram'], 0.5)
+    job['durationP95'] = durationPercentile(job['durationHistogram'], 0.95)
+  return statistics
+
+def jobStatisticsToFrame(statistics: dict):
+  """Job Statistics To Frame
+  Prepare job statistics for import into `cosasreports_jobstatistics`
+
+  @param statistics dict of job name and statistics
+  @return datatable object
+  """
+  columns = [
+    'name', 'lastRun', 'lastStatus', 'lastSubmissionDate', 'numberOfRuns',
+    'numberOfSuccessfulRuns', 'successRate', 'durationMedian', 'durationP95',
+    'durationHistogram', 'pendingExecutions'
+  ]
+  return dt.Frame([
+    {
+      **{column: job.get(column) for column in columns},
+      'durationHistogram': ','.join(map(str, job['durationHistogram'])),
+      'pendingExecutions': ','.join(job.get('pendingExecutions') or []) or None
+    }
+    for job in statistics.values()
+  ], names=columns) if statistics else dt.Frame(
+    {column: [] for column in columns},
+    types=[dt.Type.str32] * len(columns)
+  )
+
+def analyseProcessingSteps(
+  steps: list,
+  imports: list = None,
+  window: int = 14,
+  threshold: float = 1.5,
+  minElapsedTime: float = 1
+):
+  """Analyse Processing Steps
+  Compare the duration of each processing step (see `cosasLogger`) with the
+  median duration of the previous runs of the same step (name and table),
+  and calculate the throughput (rows per second). The number of rows is
+  taken from `rowsOut` (see `cosasLogger`). For import steps, `rowsIn` or the
+  number of rows imported into the table on the same day
+  (`cosasreports_imports`) is used if `rowsOut` was not recorded.
+
+  A step is flagged as a regression if it took longer than `threshold` times
+  the trailing median and at least `minElapsedTime` seconds.
+
+  @param steps list of dictionaries from `cosasreports_processingsteps`
+  @param imports list of dictionaries from `cosasreports_imports`
+  @param window number of previous runs to use for the trailing median
+  @param threshold relative increase in duration that is considered a regression
+  @param minElapsedTime minimum duration (seconds) of a regression
+
+  @return datatable object with one row per processing step
+  """
+  importCounts = {}
+  for row in imports or []:
+    for key, value in row.items():
+      if isinstance(value, int) and not isinstance(value, bool):
+        importCounts[(row.get('date'), key.lower())] = value
+
+  steps = sorted(
+    steps,
+    key=lambda row: (row.get('startTime') or '', row.get('identifier') or 0)
+  )
+
+  history = {}
+  results = []
+  for row in steps:
+    stepType = row.get('step')
+    stepType = stepType.get('value') if isinstance(stepType, dict) else stepType
+    tablename = row.get('databaseTable')
+    elapsedTime = row.get('elapsedTime')
+    previous = history.setdefault((row.get('name'), tablename), deque(maxlen=window))
+
+    trailingMedian = median(previous) if previous else None
+    relativeChange = (
+      round(elapsedTime / trailingMedian, 4)
+      if elapsedTime is not None and trailingMedian else None
+    )
+
+    rowCount = row.get('rowsOut')
+    if rowCount is None and stepType == 'Import':
+      rowCount = row.get('rowsIn')
+      if rowCount is None and tablename:
+        rowCount = importCounts.get((row.get('date'), tablename.lower()))
+
+    results.append({
+      'identifier': row.get('identifier'),
+      'date': row.get('date'),
+      'name': row.get('name'),
+      'step': stepType,
+      'databaseTable': tablename,
+      'elapsedTime': elapsedTime,
+      'trailingMedian': trailingMedian,
+      'relativeChange': relativeChange,
+      'rowCount': rowCount,
+      'rowsPerSecond': (
+        round(rowCount / elapsedTime, 2)
+        if rowCount is not None and elapsedTime else None
+      ),
+      'isRegression': bool(
+        relativeChange is not None
+        and relativeChange > threshold
+        and elapsedTime >= minElapsedTime
+      )
+    })
+
+    if elapsedTime is not None:
+      previous.append(elapsedTime)
+
+  columns = {
+    'identifier': dt.Type.int64,
+    'date': dt.Type.str32,
+    'name': dt.Type.str32,
+    'step': dt.Type.str32,
+    'databaseTable': dt.Type.str32,
+    'elapsedTime': dt.Type.float64,
+    'trailingMedian': dt.Type.float64,
+    'relativeChange': dt.Type.float64,
+    'rowCount': dt.Type.int64,
+    'rowsPerSecond': dt.Type.float64,
+    'isRegression': dt.Type.bool8
+  }
+  return dt.Frame(
+    {column: [row[column] for row in results] for column in columns},
+    types=list(columns.values())
+  )
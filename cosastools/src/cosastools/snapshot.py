@@ -0,0 +1,453 @@
+from cosastools.molgenis import now, print2
+from datatable import dt, f
+from requests.models import Response
+from os import path, makedirs
+import threading
+import json
+import re
+
+
+def _refAttributes(session, entity: str):
+  """Reference attributes
+  Find the attributes of a table that reference another table and the name
+  of the identifier of the referenced table (the same approach that is used
+  in `Session.to_upload_format`).
+
+  @param session an instance of the Molgenis class
+  @param entity table identifier in emx format: package_entity
+  @return dict of attribute and the id attribute of the referenced table
+  """
+  refs = {}
+  meta = session.get_meta(entity, expand=True, abstract=True)
+  for attr in meta['attributes']['items']:
+    if 'refEntityType' in attr['data']:
+      for refAttr in attr['data']['refEntityType']['attributes']['items']:
+        if refAttr['data']['idAttribute'] is True:
+          refs[attr['data']['name']] = refAttr['data']['name']
+  return refs
+
+
+def rowsToFrame(rows: list = None):
+  """Rows to Frame
+  Convert the output of `get` into a datatable object that can be written to
+  a JAY file. Molgenis omits attributes without a value, so the columns are
+  the union of all row attributes (in the order they first appear). Columns
+  that contain references (i.e., dicts or lists) are stored as JSON strings,
+  and columns with mixed types are stored as strings.
+
+  @param rows list of dictionaries
+  @return tuple of datatable object and a list of JSON encoded columns
+  """
+  names = list(dict.fromkeys(name for row in rows for name in row.keys()))
+  columns = []
+  encoded = []
+  for name in names:
+    values = [row.get(name) for row in rows]
+    if any(isinstance(value, (dict, list)) for value in values):
+      values = [json.dumps(value) if value is not None else None for value in values]
+      encoded.append(name)
+    try:
+      columns.append(dt.Frame({name: values}))
+    except (TypeError, ValueError):
+      columns.append(dt.Frame({
+        name: [str(value) if value is not None else None for value in values]
+      }))
+  return dt.cbind(columns) if columns else dt.Frame(), encoded
+
+
+def createSnapshot(
+  session,
+  outputDir: str,
+  entities: list = None,
+  prefixes: list = ['cosasportal_', 'cosasmappings_', 'umdm_'],
+  batch_size: int = 10000
+):
+  """Create Snapshot
+  Download tables from a Molgenis instance and save each table as a JAY file
+  so that the data can be served locally using `MolgenisSnapshot`. A manifest
+  (`manifest.json`) describes the tables in the snapshot: the number of rows,
+  reference attributes, and columns that are stored as JSON.
+
+  @param session an instance of the Molgenis class
+  @param outputDir directory to write the snapshot into
+  @param entities list of tables to download. If None, all (non-abstract)
+    tables that start with one of the prefixes are downloaded
+  @param prefixes list of table prefixes to use when entities is None
+  @param batch_size number of rows to download per request
+
+  @return dict (manifest)
+  """
+  if entities is None:
+    entityTypes = session.get(
+      'sys_md_EntityType',
+      attributes='id,isAbstract',
+      batch_size=batch_size
+    )
+    entities = [
+      row['id'] for row in entityTypes
+      if row['id'].startswith(tuple(prefixes)) and not row.get('isAbstract')
+    ]
+
+  makedirs(outputDir, exist_ok=True)
+  manifest = {'created': str(now(strftime=False)), 'entities': {}}
+  for entity in sorted(entities):
+    print2('Creating snapshot of', entity)
+    rows = session.get(entity, batch_size=batch_size)
+    data, encoded = rowsToFrame(rows)
+    data.to_jay(path.join(outputDir, f"{entity}.jay"))
+    manifest['entities'][entity] = {
+      'rows': data.nrows,
+      'refs': _refAttributes(session, entity),
+      'json': encoded
+    }
+
+  with open(path.join(outputDir, 'manifest.json'), 'w') as file:
+    json.dump(manifest, file, indent=2)
+
+  return manifest
+
+
+# rsql tokens: grouping, logical operators, and comparisons
+_rsqlPattern = re.compile(
+  r"\s*(?:(?P<attr>[\w.]+)(?P<op>==|!=|=in=|=out=|=ge=|=gt=|=le=|=lt=|=like=)"
+  r"(?P<value>\([^)]*\)|'[^']*'|\"[^\"]*\"|[^;,()]*)|(?P<token>[();,]))"
+)
+
+
+def _unquote(value: str):
+  value = value.strip()
+  if len(value) > 1 and value[0] == value[-1] and value[0] in ('"', "'"):
+    return value[1:-1]
+  return value
+
+
+def parseRsql(q: str):
+  """Parse RSQL
+  Parse a query into a tree of `and` and `or` nodes. Comparisons are stored
+  as (attribute, operator, value); the values of `=in=` and `=out=` are lists.
+  AND (`;`) takes precedence over OR (`,`), and parentheses can be used to
+  group comparisons.
+
+  @param q query in rsql format
+  @return tuple
+  """
+  tokens = []
+  position = 0
+  while position < len(q.rstrip()):
+    match = _rsqlPattern.match(q, position)
+    if not match:
+      raise ValueError(f"Unable to parse query '{q}' at position {position}")
+    if match.group('token'):
+      tokens.append(match.group('token'))
+    else:
+      value = match.group('value')
+      if match.group('op') in ('=in=', '=out='):
+        value = [_unquote(value) for value in value.strip('()').split(',')]
+      else:
+        value = _unquote(value)
+      tokens.append((match.group('attr'), match.group('op'), value))
+    position = match.end()
+
+  def parseTerm(index):
+    if index < len(tokens) and tokens[index] == '(':
+      node, index = parseOr(index + 1)
+      if index >= len(tokens) or tokens[index] != ')':
+        raise ValueError(f"Unbalanced parentheses in query '{q}'")
+      return node, index + 1
+    if index < len(tokens) and isinstance(tokens[index], tuple):
+      return tokens[index], index + 1
+    raise ValueError(f"Unexpected end or operator in query '{q}'")
+
+  def parseGroup(index, operator, separator, parseChild):
+    node, index = parseChild(index)
+    nodes = [node]
+    while index < len(tokens) and tokens[index] == separator:
+      node, index = parseChild(index + 1)
+      nodes.append(node)
+    return ((operator, nodes) if len(nodes) > 1 else nodes[0]), index
+
+  def parseAnd(index):
+    return parseGroup(index, 'and', ';', parseTerm)
+
+  def parseOr(index):
+    return parseGroup(index, 'or', ',', parseAnd)
+
+  if not tokens:
+    return None
+  tree, index = parseOr(0)
+  if index != len(tokens):
+    raise ValueError(f"Unexpected '{tokens[index]}' in query '{q}'")
+  return tree
+
+
+class MolgenisSnapshot:
+  """Molgenis Snapshot
+  Serve `get` requests from a snapshot created with `createSnapshot`. The JAY
+  files are memory-mapped when a table is requested for the first time, so
+  scripts can be run (and benchmarked) repeatedly without a Molgenis instance
+  or network I/O. The methods mirror the Molgenis class: queries in rsql
+  format (comparisons, `;`, `,`, and parentheses) are supported, and imports
+  are kept in memory (or written to `outputDir`) instead of being sent to
+  the server.
+  """
+  def __init__(self, snapshotDir: str, outputDir: str = None):
+    """Molgenis Snapshot
+    @param snapshotDir directory containing the snapshot
+    @param outputDir if defined, imported data is written to JAY files in this
+      directory
+    """
+    self.snapshotDir = snapshotDir
+    self.outputDir = outputDir
+    self.imports = {}
+    self._frames = {}
+    self._lock = threading.Lock()
+    with open(path.join(snapshotDir, 'manifest.json'), 'r') as file:
+      self.manifest = json.load(file)
+
+  def login(self, *args, **kwargs):
+    pass
+
+  def logout(self, *args, **kwargs):
+    pass
+
+  def _frame(self, entity: str):
+    """Frame
+    Memory-map the JAY file of a table. Files are read once and `fread` is
+    not thread-safe, so reading is done while holding the lock.
+
+    @param entity table identifier in emx format: package_entity
+    @return datatable object
+    """
+    if entity not in self.manifest['entities']:
+      raise ValueError(f"Table '{entity}' is not available in {self.snapshotDir}")
+
+    with self._lock:
+      if entity not in self._frames:
+        self._frames[entity] = dt.fread(path.join(self.snapshotDir, f"{entity}.jay"))
+      return self._frames[entity]
+
+  def _refIds(self, entity: str, attribute: str, value):
+    """Reference identifiers
+    @param entity table identifier in emx format: package_entity
+    @param attribute name of a JSON encoded attribute
+    @param value JSON string
+    @return list of identifiers
+    """
+    if value is None:
+      return []
+    value = json.loads(value)
+    idAttribute = self.manifest['entities'][entity]['refs'].get(attribute)
+    refs = value if isinstance(value, list) else [value]
+    return [str(ref.get(idAttribute) if isinstance(ref, dict) else ref) for ref in refs]
+
+  def _compare(self, entity: str, data, attribute: str, op: str, value):
+    """Compare
+    Evaluate a single comparison. Attributes that contain references are
+    compared using the identifiers of the referenced rows.
+
+    @return datatable object with one boolean column
+    """
+    if attribute not in data.names:
+      raise ValueError(f"Unknown attribute '{attribute}' in table '{entity}'")
+
+    if attribute in self.manifest['entities'][entity]['json'] or op == '=like=':
+      if attribute in self.manifest['entities'][entity]['json']:
+        rows = [self._refIds(entity, attribute, value) for value in data[attribute].to_list()[0]]
+      else:
+        rows = [[str(value)] if value is not None else [] for value in data[attribute].to_list()[0]]
+
+      values = value if isinstance(value, list) else [value]
+      if op == '==':
+        result = [(not ids) if value == '' else (value in ids) for ids in rows]
+      elif op == '!=':
+        result = [bool(ids) if value == '' else (value not in ids) for ids in rows]
+      elif op == '=in=':
+        result = [any(id in values for id in ids) for ids in rows]
+      elif op == '=out=':
+        result = [not any(id in values for id in ids) for ids in rows]
+      elif op == '=like=':
+        result = [any(value.lower() in id.lower() for id in ids) for ids in rows]
+      else:
+        raise ValueError(f"Operator '{op}' is not supported for '{attribute}'")
+      return dt.Frame([result], type=dt.Type.bool8)
+
+    column = f[attribute]
+    stype = data[attribute].type
+    def cast(value):
+      if value == '':
+        return None
+      if stype == dt.Type.bool8:
+        return value.lower() == 'true'
+      if stype.is_integer:
+        return int(value)
+      if stype.is_float:
+        return float(value)
+      return value
+
+    if op in ('=in=', '=out='):
+      values = [cast(value) for value in value]
+      expr = dt.rowany([column == value for value in values]) if values else False
+      if op == '=out=':
+        expr = ~expr
+    else:
+      value = cast(value)
+      if value is None and op in ('==', '!='):
+        expr = dt.isna(column) if op == '==' else ~dt.isna(column)
+      else:
+        expr = {
+          '==': column == value,
+          '!=': column != value,
+          '=ge=': column >= value,
+          '=gt=': column > value,
+          '=le=': column <= value,
+          '=lt=': column < value,
+        }[op]
+    return data[:, {'match': expr == True}]
+
+  def _filter(self, entity: str, data, node):
+    """Filter
+    @param entity table identifier in emx format: package_entity
+    @param data datatable object
+    @param node parsed query (see `parseRsql`)
+    @return datatable object with one boolean column
+    """
+    if node[0] in ('and', 'or'):
+      masks = [self._filter(entity, data, child) for child in node[1]]
+      masks = dt.cbind([mask[:, {f"m{index}": f[0]}] for index, mask in enumerate(masks)])
+      return masks[:, dt.rowall(f[:]) if node[0] == 'and' else dt.rowany(f[:])]
+    return self._compare(entity, data, *node)
+
+  def _select(self, entity: str, q: str = None, sort_column: str = None, sort_order: str = None):
+    """Select rows
+    @return datatable object
+    """
+    data = self._frame(entity)
+    tree = parseRsql(q) if q else None
+    if tree:
+      mask = self._filter(entity, data, tree)
+      data = data[mask.to_list()[0], :] if data.nrows else data
+    if sort_column:
+      data = data[:, :, dt.sort(f[sort_column], reverse=(sort_order == 'desc'))]
+    return data
+
+  def get(
+    self,
+    entity: str,
+    q: str = None,
+    attributes: str = None,
+    num: int = None,
+    batch_size: int = 100,
+    start: int = 0,
+    sort_column: str = None,
+    sort_order: str = None,
+    raw: bool = False,
+    expand: str = None,
+    uploadable: bool = False
+  ):
+    """Get
+    Retrieve rows from a snapshot. The arguments are identical to
+    `Session.get`; batch_size and expand are ignored since all data is local.
+
+    @param entity table identifier in emx format: package_entity
+    @param q query in rsql format
+    @param attributes comma separated string of attributes to return
+    @param num maximum number of rows to return
+
+    @return list of dictionaries
+    """
+    data = self._select(entity, q, sort_column, sort_order)
+    total = data.nrows
+    start = int(start)
+    end = min(start + num, total) if num else total
+    names = data.names
+    if attributes:
+      selected = attributes.split(',') if isinstance(attributes, str) else attributes
+      names = [name for name in data.names if name in ['_href'] + selected]
+
+    encoded = self.manifest['entities'][entity]['json']
+    refs = self.manifest['entities'][entity]['refs']
+    items = []
+    for values in data[start:end, names].to_tuples():
+      row = {}
+      for name, value in zip(names, values):
+        if value is None:
+          continue
+        if name in encoded:
+          value = json.loads(value)
+          if uploadable and name in refs:
+            value = (
+              [ref[refs[name]] for ref in value] if isinstance(value, list)
+              else value[refs[name]]
+            )
+        row[name] = value
+      if uploadable:
+        row.pop('_href', None)
+        row.pop('_meta', None)
+      items.append(row)
+
+    if raw:
+      return {'items': items, 'start': start, 'num': len(items), 'total': total}
+    return items
+
+  def count(self, entity: str, q: str = None):
+    """Count
+    @param entity table identifier in emx format: package_entity
+    @param q query in rsql format
+    @return int
+    """
+    return self._select(entity, q).nrows
+
+  def countValues(self, entity: str, attributes: list, workers: int = 8):
+    """Count Values
+    @param entity table identifier in emx format: package_entity
+    @param attributes list of attribute names
+    @param workers not used; kept for compatibility with the Molgenis class
+    @return list of dictionaries (attribute, countOfValues, totalValues)
+    """
+    total = self.count(entity)
+    return [
+      {
+        'attribute': attribute,
+        'countOfValues': self.count(entity, q=f"{attribute}!=''"),
+        'totalValues': total
+      }
+      for attribute in attributes
+    ]
+
+  def _import(self, pkg_entity: str, data):
+    """Import
+    Keep imported data in memory and write all data imported into a table
+    to `outputDir` (if defined).
+
+    @param pkg_entity table identifier in emx format: package_entity
+    @param data datatable object
+    @return response with status code 201
+    """
+    with self._lock:
+      self.imports.setdefault(pkg_entity, []).append(data.copy())
+      if self.outputDir:
+        makedirs(self.outputDir, exist_ok=True)
+        dt.rbind(self.imports[pkg_entity], force=True).to_jay(
+          path.join(self.outputDir, f"{pkg_entity}.jay")
+        )
+
+    print2('Imported data into', pkg_entity, '(snapshot)')
+    response = Response()
+    response.status_code = 201
+    return response
+
+  def importDatatableAsCsv(self, pkg_entity: str, data):
+    """Import Datatable As CSV
+    @param pkg_entity table identifier in emx format: package_entity
+    @param data a datatable object
+    @return response with status code 201
+    """
+    return self._import(pkg_entity, data)
+
+  def importData(self, entity: str, data: list = None):
+    """Import Data
+    @param entity table identifier in emx format: package_entity
+    @param data list of dictionaries
+    @return response with status code 201
+    """
+    return self._import(entity, rowsToFrame(data)[0])
@@ -0,0 +1,575 @@
+from cosastools.molgenis import now, print2
+from cosastools.snapshot import rowsToFrame
+from datetime import datetime, timedelta
+from datatable import dt
+from os import path, makedirs
+import random
+import json
+import csv
+
+# approximate number of rows per subject in each portal table
+portalRatios = {
+  'cosasportal_diagnoses': 0.6,
+  'cosasportal_samples': 1.5,
+  'cosasportal_labs_array_adlas': 0.15,
+  'cosasportal_labs_array_darwin': 0.15,
+  'cosasportal_labs_ngs_adlas': 0.5,
+  'cosasportal_labs_ngs_darwin': 0.5,
+  'cosasportal_cartagenia': 0.1
+}
+
+# values used when the lookups are not available
+_defaultLookups = {
+  'cosasmappings_genderatbirth': [
+    {'from': 'Man', 'to': 'assigned male at birth', 'toAlternate': 'male'},
+    {'from': 'Onbekend'},
+    {'from': 'Vrouw', 'to': 'assigned female at birth', 'toAlternate': 'female'}
+  ],
+  'cosasmappings_biospecimentype': [
+    {'from': 'bloed', 'to': 'Whole Blood'},
+    {'from': 'dna', 'to': 'Blood DNA'},
+    {'from': 'foetus', 'to': 'Human Fetal Tissue'},
+    {'from': 'gekweekte chorion villi', 'to': 'Chorionic Villus'}
+  ],
+  'cosasmappings_samplereason': [
+    {'from': 'diagnostisch', 'to': 'Diagnostic'},
+    {'from': 'dragerschap', 'to': 'Carrier Status'},
+    {'from': 'presymptomatisch', 'to': 'Presymptomatic Testing'},
+    {'from': 'research', 'to': 'Research'}
+  ],
+  'cosasmappings_sequencerinfo': [
+    {'from': 'HiSeq', 'to': 'Illumina platform', 'toAlternate': 'Illumina HiSeq Sequencer'},
+    {'from': 'MiSeq sequencer 1', 'to': 'Illumina platform', 'toAlternate': 'MiSeq'},
+    {'from': 'NextSeq sequencer 1', 'to': 'Illumina platform'}
+  ],
+  'cosasmappings_genomebuild': [
+    {'from': 'Feb. 2009 (GRCh37/hg19)', 'to': 'GRCh37'}
+  ],
+  'cosasmappings_cineasmappings': [
+    {'value': '1', 'description': 'duchenne muscular dystrophy xl', 'codesystem': 'cineas', 'code': '1', 'hpo': 'HP:0003560'},
+    {'value': '4', 'description': 'cleft lip palate unspecified', 'codesystem': 'cineas', 'code': '4'},
+    {'value': '11', 'description': 'acute lymphatic leukemia', 'codesystem': 'cineas', 'code': '11', 'hpo': 'HP:0006721'}
+  ],
+  'umdm_labProcedures': [
+    {'code': 'ARR', 'description': 'Array LOH'},
+    {'code': 'B14', 'description': 'Mutatie analyse BRCA1 gen'},
+    {'code': 'B15', 'description': 'Mutatie analyse BRCA2 gen'},
+    {'code': 'B16', 'description': 'MLPA analyse BRCA1'}
+  ]
+}
+
+_hpoCodes = [
+  'HP:0001250', 'HP:0001263', 'HP:0000252', 'HP:0001249', 'HP:0004322',
+  'HP:0000729', 'HP:0001631', 'HP:0002650', 'HP:0000486', 'HP:0001508'
+]
+
+
+def readLookups(lookupsDir: str = None):
+  """Read lookups
+  Read the mapping tables and lab procedures from the `lookups` folder of
+  this repository. Empty values are omitted (as in Molgenis responses).
+
+  @param lookupsDir location of the lookups folder. If None or if a file is
+    missing, a small set of default values is used.
+  @return dict of table identifiers and a list of rows
+  """
+  lookups = {}
+  for entity, default in _defaultLookups.items():
+    file = path.join(lookupsDir, f"{entity}.csv") if lookupsDir else None
+    if file and path.exists(file):
+      with open(file, 'r', encoding='utf-8') as stream:
+        lookups[entity] = [
+          {key: value for key, value in row.items() if value not in ('', None)}
+          for row in csv.DictReader(stream)
+        ]
+    else:
+      lookups[entity] = [dict(row) for row in default]
+  return lookups
+
+
+def _dirty(rng, value, rate: float, choices: list = ['-', '', None]):
+  """Dirty value
+  Replace a value with a missing or invalid value, pad it with whitespace, or
+  change the case at a given rate.
+  """
+  if value is None or rng.random() >= rate:
+    return value
+  option = rng.randrange(4)
+  if option == 0:
+    return rng.choice(choices)
+  if option == 1:
+    return f" {value} "
+  if option == 2:
+    return value.upper() if isinstance(value, str) else value
+  return value.lower() if isinstance(value, str) else value
+
+
+def _date(rng, start: datetime, days: int):
+  return start + timedelta(days=rng.randrange(max(days, 1)), seconds=rng.randrange(86400))
+
+
+def _count(rng, ratio: float):
+  """Number of rows for a subject with a mean of `ratio`"""
+  return int(ratio) + (1 if rng.random() < ratio - int(ratio) else 0)
+
+
+def generatePortalChunk(
+  start: int,
+  count: int,
+  seed: int = 1,
+  lookups: dict = None,
+  ratios: dict = portalRatios,
+  dirty: float = 0.02
+):
+  """Generate portal chunk
+  Create synthetic data for a range of subjects in the structure of the
+  ADLAS, Darwin, and Cartagenia exports (`cosasportal_*`). Subjects are
+  generated by family (1 to 5 members with parents, probands, siblings, and
+  fetuses). Samples, lab results, and diagnoses reference these subjects
+  and a small fraction of the values is dirty (missing values, `-`,
+  whitespace, unknown codes, and unregistered parents). The output of a
+  chunk only depends on the seed and start position, so chunks can be
+  generated independently.
+
+  @param start position of the first subject
+  @param count number of subjects
+  @param seed random seed
+  @param lookups output of `readLookups`
+  @param ratios approximate number of rows per subject for each table
+  @param dirty fraction of values that are dirty
+
+  @return dict of table identifiers and a list of rows
+  """
+  rng = random.Random(f"{seed}-{start}")
+  lookups = lookups or readLookups()
+  values = {
+    'gender': [row['from'] for row in lookups['cosasmappings_genderatbirth']],
+    'material': [row['from'] for row in lookups['cosasmappings_biospecimentype']],
+    'reason': [row['from'] for row in lookups['cosasmappings_samplereason']],
+    'sequencer': [row['from'] for row in lookups['cosasmappings_sequencerinfo']],
+    'build': [row['from'] for row in lookups['cosasmappings_genomebuild']],
+    'cineas': [row['value'] for row in lookups['cosasmappings_cineasmappings'] if row.get('value')],
+    'testCodes': [row['code'] for row in lookups['umdm_labProcedures']]
+  }
+
+  data = {entity: [] for entity in ['cosasportal_patients'] + list(ratios.keys())}
+  created = str(now(strftime=False))
+
+  def record(entity, **attributes):
+    row = {'id': f"{entity.split('_', 1)[1]}{start}-{len(data[entity])}"}
+    row.update({key: value for key, value in attributes.items() if value is not None})
+    if entity != 'cosasportal_cartagenia':
+      row.update({'processed': False, 'dateRecordCreated': created})
+    data[entity].append(row)
+
+  index = start
+  while index < start + count:
+    size = min(rng.choices([1, 2, 3, 4, 5], [40, 15, 30, 10, 5])[0], start + count - index)
+    familyID = str(500000 + index)
+    born = _date(rng, datetime(1950, 1, 1), 40 * 365)
+    members = []
+    for position in range(size):
+      subjectID = str(1000000 + index + position)
+      isParent = size >= 3 and position < 2
+      isFetus = size >= 2 and not isParent and position == size - 1 and rng.random() < 0.05
+      if isFetus:
+        subjectID = f"{members[0]['subjectID']}F{rng.choice(['', '1', '2', '1.2'])}"
+      members.append({
+        'number': index + position,
+        'subjectID': subjectID,
+        'gender': 'Vrouw' if isParent and position == 0 else (
+          'Man' if isParent else rng.choice(values['gender'])
+        ),
+        'born': None if isFetus else (
+          _date(rng, born, 3 * 365) if isParent else _date(rng, born + timedelta(days=20 * 365), 20 * 365)
+        ),
+        'isParent': isParent,
+        'isFetus': isFetus
+      })
+
+    familyMembers = ','.join(member['subjectID'] for member in members)
+    for member in members:
+      mother = father = None
+      if size >= 3 and not member['isParent']:
+        mother, father = members[0]['subjectID'], members[1]['subjectID']
+        if rng.random() < dirty:
+          mother = str(9000000 + rng.randrange(10**6))
+      elif member['isFetus']:
+        mother = members[0]['subjectID']
+
+      born = member['born']
+      died = None
+      if born and rng.random() < 0.03:
+        died = _date(rng, born + timedelta(days=365), (datetime(2024, 1, 1) - born).days - 365)
+
+      record(
+        'cosasportal_patients',
+        UMCG_NUMBER=member['subjectID'],
+        FAMILIENUMMER=_dirty(rng, familyID, dirty, [None]),
+        GEBOORTEDATUM=born.strftime('%d-%m-%Y') if born else None,
+        OVERLIJDENSDATUM=died.strftime('%d-%m-%Y') if died else None,
+        GESLACHT=member['gender'],
+        FAMILIELEDEN=familyMembers.replace(',', ', ') if rng.random() < dirty else familyMembers,
+        UMCG_MOEDER=mother,
+        UMCG_VADER=father,
+        FOETUS_ID=member['subjectID'] if member['isFetus'] else None
+      )
+
+      for _ in range(_count(rng, ratios.get('cosasportal_diagnoses', 0))):
+        codes = [
+          f"{rng.choice(values['cineas'])}:{rng.choice(['unspecified', 'suspected', 'familial'])}"
+          if rng.random() > dirty else rng.choice(['-', None])
+          for _ in range(2)
+        ]
+        record(
+          'cosasportal_diagnoses',
+          UMCG_NUMBER=member['subjectID'],
+          HOOFDDIAGNOSE=codes[0],
+          HOOFDDIAGNOSE_ZEKERHEID=rng.choice(['Zeker', 'Zeker', 'Onzeker', 'Niet zeker', 'Zeker niet', '-']),
+          EXTRA_DIAGNOSE=codes[1] if rng.random() < 0.4 else None,
+          EXTRA_DIAGNOSE_ZEKERHEID=rng.choice(['Zeker', 'Onzeker', 'Zeker niet']),
+          DATUM_EERSTE_CONSULT=_date(rng, datetime(2010, 1, 1), 14 * 365).strftime('%d-%m-%Y')
+        )
+
+      if rng.random() < ratios.get('cosasportal_cartagenia', 0):
+        primid = member['subjectID']
+        linkedID = None
+        if member['isFetus'] and '.' not in primid and rng.random() < 0.2:
+          linkedID = str(1000000 + rng.randrange(10**6))
+          primid = f"{primid}-{linkedID}"
+        data['cosasportal_cartagenia'].append({
+          key: value for key, value in {
+            'id': primid,
+            'subjectID': member['subjectID'],
+            'belongsToMother': members[0]['subjectID'] if member['isFetus'] else None,
+            'belongsToFamily': familyID,
+            'isFetus': member['isFetus'],
+            'alternativeIdentifiers': linkedID,
+            'observedPhenotype': ','.join(rng.sample(_hpoCodes, rng.randint(1, 4)))
+          }.items() if value is not None
+        })
+
+      samples = []
+      for _ in range(_count(rng, ratios.get('cosasportal_samples', 0))):
+        requestID = str(rng.randrange(10**6, 10**7))
+        testCode = rng.choice(values['testCodes']) if rng.random() > dirty else f"X{rng.randrange(100)}"
+        sample = {
+          'DNA_NUMMER': f"DNA{100000 + member['number']}{len(samples):02d}",
+          'UMCG_NUMMER': member['subjectID'],
+          'ADVVRG_ID': requestID,
+          'TEST_CODE': testCode,
+          'TEST_OMS': f"Test {testCode}"
+        }
+        samples.append(sample)
+        requested = _date(rng, datetime(2012, 1, 1), 12 * 365)
+        record(
+          'cosasportal_samples',
+          ADVIESVRAAG_DATUM=requested.strftime('%d-%m-%Y'),
+          MONSTER_ID=str(rng.randrange(10**7, 10**8)),
+          MATERIAAL=_dirty(rng, rng.choice(values['material']), dirty, ['-']),
+          AUTHORISED=rng.choice(['J', 'N']),
+          FOETUS_ID=member['subjectID'] if member['isFetus'] else None,
+          **sample
+        )
+
+      for entity, isNgs in [
+        ('cosasportal_labs_array_adlas', False),
+        ('cosasportal_labs_ngs_adlas', True)
+      ]:
+        for _ in range(_count(rng, ratios.get(entity, 0)) if samples else 0):
+          sample = rng.choice(samples)
+          attributes = {
+            'UMCG_NUMBER': sample['UMCG_NUMMER'],
+            'ADVVRG_ID': sample['ADVVRG_ID'],
+            'DNA_NUMMER': sample['DNA_NUMMER'] if rng.random() > dirty else f"DNA-{rng.randrange(10**5)}",
+            'TEST_ID': str(rng.randrange(10**6, 10**7)),
+            'TEST_CODE': sample['TEST_CODE'],
+            'TEST_OMS': sample['TEST_OMS'],
+            'FOETUS_ID': member['subjectID'] if member['isFetus'] else None
+          }
+          if isNgs:
+            attributes.update({
+              'GEN': rng.choice(['BRCA1', 'BRCA2', 'MYH7', 'TTN', 'SCN5A']),
+              'KLASSE': rng.choice(['1', '2', '3', '4', '5', None]),
+              'OVERERVING': rng.choice(['AD', 'AR', 'XL', None])
+            })
+          else:
+            attributes.update({
+              'SGA_EVENT': rng.choice(['CN Gain', 'CN Loss', 'LOH']),
+              'SGA_CLASSIFICATION': rng.choice(['Benign', 'VOUS', 'Pathogenic', None]),
+              'SGA_LENGTH': str(rng.randrange(10**4, 10**7))
+            })
+          record(entity, **attributes)
+
+      for entity, isNgs in [
+        ('cosasportal_labs_array_darwin', False),
+        ('cosasportal_labs_ngs_darwin', True)
+      ]:
+        for _ in range(_count(rng, ratios.get(entity, 0)) if samples else 0):
+          sample = rng.choice(samples)
+          tested = _date(rng, datetime(2012, 1, 1), 12 * 365)
+          testDate = tested.strftime('%d-%m-%Y %H:%M:%S')
+          if rng.random() < dirty:
+            testDate = tested.strftime('%d-%m-%YT00:00')
+          attributes = {
+            'UmcgNr': sample['UMCG_NUMMER'],
+            'TestId': sample['TEST_CODE'],
+            'TestDatum': testDate,
+            'Indicatie': _dirty(rng, rng.choice(values['reason']), dirty),
+            'BatchNaam': f"{tested.strftime('%y%m%d')}_{rng.randrange(100):02d}",
+            'Foetus_Id': member['subjectID'] if member['isFetus'] else None
+          }
+          if isNgs:
+            attributes.update({
+              'Sequencer': _dirty(rng, rng.choice(values['sequencer']), dirty, [None]),
+              'PrepKit': rng.choice(['Agilent SureSelect XT', 'Twist Exome', None]),
+              'SequencingType': rng.choice(['Paired End', 'Single Read']),
+              'CapturingKit': rng.choice(['Exoom_v1', 'Exoom_v3', 'Cardio_v2']),
+              'GenomeBuild': rng.choice(values['build']) if rng.random() > dirty else None
+            })
+          record(entity, **attributes)
+
+    index += size
+
+  return data
+
+
+def generatePortalData(
+  subjects: int = 1000,
+  seed: int = 1,
+  lookupsDir: str = None,
+  ratios: dict = portalRatios,
+  dirty: float = 0.02,
+  chunkSize: int = 10000
+):
+  """Generate portal data
+  Create synthetic `cosasportal_*` tables and the mapping tables that the
+  daily mapping needs. The result can be used as tables in MolgenisServer. For
+  large volumes (e.g., 10M rows), use `writePortalSnapshot` instead.
+
+  @param subjects number of subjects (all tables together have roughly 4.5
+    rows per subject with the default ratios)
+  @param seed random seed
+  @param lookupsDir location of the lookups folder (see `readLookups`)
+  @param ratios approximate number of rows per subject for each table
+  @param dirty fraction of values that are dirty
+  @param chunkSize number of subjects per chunk
+
+  @return dict of table identifiers and a list of rows
+  """
+  lookups = readLookups(lookupsDir)
+  data = {}
+  for start in range(0, subjects, chunkSize):
+    chunk = generatePortalChunk(
+      start=start,
+      count=min(chunkSize, subjects - start),
+      seed=seed,
+      lookups=lookups,
+      ratios=ratios,
+      dirty=dirty
+    )
+    for entity, rows in chunk.items():
+      data.setdefault(entity, []).extend(rows)
+  data.update(lookups)
+  return data
+
+
+def generateCartageniaPayload(rows: list, seed: int = 1, dirty: float = 0.02):
+  """Generate Cartagenia payload
+  Format rows of `cosasportal_cartagenia` as the response of the Cartagenia
+  endpoint: an object with the attribute "Output" that contains a string of
+  tuples (primid, secid, externalid, gender, comment, phenotype, created).
+  A fraction of the identifiers is padded or lowercased, and records that do
+  not meet the inclusion criteria (non-numeric identifiers or phenotypes
+  that aren't HPO codes) are added.
+
+  @param rows list of dictionaries (`cosasportal_cartagenia`)
+  @param seed random seed
+  @param dirty fraction of records that are dirty
+
+  @return dict
+  """
+  rng = random.Random(seed)
+  records = []
+  for row in rows:
+    primid = row['id']
+    if rng.random() < dirty:
+      primid = rng.choice([f" {primid}", f"{primid} ", primid.lower()])
+    phenotypes = row.get('observedPhenotype', '').split(',')
+    if rng.random() < dirty:
+      phenotypes.append(phenotypes[0])
+    created = _date(rng, datetime(2015, 1, 1), 9 * 365)
+    records.append((
+      primid,
+      row.get('belongsToFamily'),
+      row.get('alternativeIdentifiers'),
+      rng.choice(['M', 'F', 'U']),
+      'Fetus' if row.get('isFetus') else None,
+      ' '.join(phenotypes),
+      created.strftime('%Y-%m-%d %H:%M:%S')
+    ))
+    if rng.random() < dirty:
+      records.append((
+        rng.choice([f"TEST{rng.randrange(10**5)}", f"Ctrl-{rng.randrange(100)}"]),
+        None, None, 'U', rng.choice([None, 'test record']),
+        rng.choice(['HP:0001250', 'geen', '-']),
+        created.strftime('%Y-%m-%d %H:%M:%S')
+      ))
+  return {'Output': repr(records)}
+
+
+def generateConsentData(patients: list, ratio: float = 0.3, seed: int = 1, dirty: float = 0.02):
+  """Generate consent data
+  Create rows of `cosasportal_consent` (open exome and 5GPM consent forms)
+  for a fraction of the patients. Identifiers are sometimes formatted with
+  a separator (e.g., `1000.123`) and dates signed are in mixed formats.
+
+  @param patients list of dictionaries (`cosasportal_patients`)
+  @param ratio fraction of patients that have a consent record
+  @param seed random seed
+  @param dirty fraction of values that are dirty
+
+  @return list of dictionaries
+  """
+  rng = random.Random(seed)
+
+  def signed():
+    value = _date(rng, datetime(2015, 1, 1), 9 * 365)
+    return rng.choice([
+      value.strftime('%d-%m-%Y'),
+      value.strftime('%d-%m-%Y 00:00:00'),
+      value.strftime('%Y-%m-%d')
+    ]) if rng.random() > dirty else rng.choice(['-', '?', 'onbekend'])
+
+  rows = []
+  for patient in patients:
+    if rng.random() >= ratio or 'F' in patient['UMCG_NUMBER']:
+      continue
+    umcgNr = patient['UMCG_NUMBER']
+    for _ in range(1 if rng.random() > 0.05 else 2):
+      filled = _date(rng, datetime(2015, 1, 1), 9 * 365)
+      rows.append({
+        'id': f"consent{len(rows)}",
+        'analysis': rng.choice(['open exoom', '5GPM']),
+        'datefilled': filled.strftime('%d-%m-%Y'),
+        'MDN_umcgnr': f"{umcgNr[:-3]}.{umcgNr[-3:]}" if rng.random() < 0.5 else umcgNr,
+        'familienummer': patient.get('FAMILIENUMMER', '-'),
+        'request_consent_material': rng.choice(['geen bezwaar', 'geen bezwaar ', 'wel bezwaar', 'bezwaar', '-']),
+        'request_form': rng.choice(['aanvraagformulier v2', 'aanvraagformulier v3', '-', '/']),
+        'request_date_signed': signed(),
+        'consent_diagnostics': rng.choice(['wel', 'Wel toestemming', 'niet', None]),
+        'consent_recontact': rng.choice(['wel', 'niet', ' wel ', None]),
+        'consent_research': rng.choice(['wel', 'wel, gecodeerd', 'niet', None]),
+        'consent_system': rng.choice(['Epic', 'Papier', '?', None]),
+        'consent_form': rng.choice(['toestemmingsformulier v1', 'toestemmingsformulier v4', '-', '?']),
+        'consent_doctor': rng.choice(['arts 1', 'arts 2', 'arts 3', None]),
+        'consent_date_signed': signed(),
+        'consent_folder': rng.choice(['map 1', 'map 2', None]),
+        'incidental_consent_recontact': rng.choice(['Wel', 'wel', 'niet', 'niet van toepassing', None]),
+        'incidental_form': rng.choice(['formulier incidental findings', '-', None]),
+        'incidental_date_signed': signed() if rng.random() < 0.6 else None
+      })
+  return rows
+
+
+def generateFileListings(samples: list, ratio: float = 2.0, seed: int = 1, dirty: float = 0.02):
+  """Generate file listings
+  Create rows of `cosasportal_files` (storage listings of vcf, cram, bam,
+  and fastq files) for portal samples. File paths occasionally contain
+  duplicate slashes and a fraction of the file names is `N/A`.
+
+  @param samples list of dictionaries (`cosasportal_samples`)
+  @param ratio approximate number of files per sample
+  @param seed random seed
+  @param dirty fraction of values that are dirty
+
+  @return list of dictionaries
+  """
+  rng = random.Random(seed)
+  extensions = {
+    '.vcf.gz': 'vcf',
+    '.vcf.gz.tbi': 'tbi',
+    '.bam.cram': 'cram',
+    '.bam': 'bam',
+    '_R1.fq.gz': 'fastq',
+    '_R2.fq.gz': 'fastq'
+  }
+  rows = []
+  for sample in samples:
+    if not sample.get('DNA_NUMMER') or not sample.get('UMCG_NUMMER'):
+      continue
+    project = f"{rng.choice(['Exoom', 'Cardio', 'Genoom'])}_{rng.randrange(1000):03d}"
+    filepath = f"/groups/umcg-gd/prm0{rng.randint(5, 6)}/projects/{project}/run01/results/"
+    if rng.random() < dirty:
+      filepath = filepath.replace('/results/', '//results/')
+    for extension in rng.sample(list(extensions), min(_count(rng, ratio), len(extensions))):
+      created = _date(rng, datetime(2015, 1, 1), 9 * 365)
+      filename = f"{sample['DNA_NUMMER']}_{project}{extension}"
+      rows.append({
+        'id': f"files{len(rows)}",
+        'umcgID': sample['UMCG_NUMMER'],
+        'familyID': sample.get('FAMILIENUMMER'),
+        'dnaID': sample['DNA_NUMMER'],
+        'testID': sample.get('TEST_CODE'),
+        'filename': filename if rng.random() > dirty else 'N/A',
+        'filepath': filepath,
+        'filetype': extensions[extension],
+        'md5': f"{rng.getrandbits(128):032x}",
+        'dateCreated': created.strftime('%Y-%m-%d %H:%M:%S')
+      })
+  return rows
+
+
+def writePortalSnapshot(
+  outputDir: str,
+  subjects: int = 1000,
+  seed: int = 1,
+  lookupsDir: str = None,
+  ratios: dict = portalRatios,
+  dirty: float = 0.02,
+  chunkSize: int = 50000
+):
+  """Write portal snapshot
+  Generate synthetic portal data in chunks and write the tables to a snapshot
+  (see `cosastools.snapshot`) so that the data can be served using
+  MolgenisSnapshot or MolgenisServer.fromSnapshot. Only the Frames of each
+  chunk are kept in memory.
+
+  @param outputDir directory to write the snapshot into
+  @param subjects number of subjects
+  @param seed random seed
+  @param lookupsDir location of the lookups folder (see `readLookups`)
+  @param ratios approximate number of rows per subject for each table
+  @param dirty fraction of values that are dirty
+  @param chunkSize number of subjects per chunk
+
+  @return dict (manifest)
+  """
+  lookups = readLookups(lookupsDir)
+  frames = {}
+  for start in range(0, subjects, chunkSize):
+    chunk = generatePortalChunk(
+      start=start,
+      count=min(chunkSize, subjects - start),
+      seed=seed,
+      lookups=lookups,
+      ratios=ratios,
+      dirty=dirty
+    )
+    for entity, rows in chunk.items():
+      frames.setdefault(entity, []).append(rowsToFrame(rows)[0])
+    print2('Generated', min(start + chunkSize, subjects), 'of', subjects, 'subjects')
+
+  for entity, rows in lookups.items():
+    frames[entity] = [rowsToFrame(rows)[0]]
+
+  makedirs(outputDir, exist_ok=True)
+  manifest = {'created': str(now(strftime=False)), 'entities': {}}
+  for entity, chunks in frames.items():
+    data = dt.rbind(chunks, force=True)
+    data.to_jay(path.join(outputDir, f"{entity}.jay"))
+    manifest['entities'][entity] = {'rows': data.nrows, 'refs': {}, 'json': []}
+
+  with open(path.join(outputDir, 'manifest.json'), 'w') as file:
+    json.dump(manifest, file, indent=2)
+  return manifest
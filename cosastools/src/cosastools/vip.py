@@ -0,0 +1,396 @@
+from cosastools.pedigree import Pedigree
+from concurrent.futures import ThreadPoolExecutor
+from datatable import dt, f
+from datetime import datetime
+from os import path, makedirs
+import re
+
+def flattenXref(data, column: str, attribute: str):
+  """Flatten Xref
+  Collapse the reference objects (i.e., dictionaries) of a column into the
+  value of a single attribute. If the column was not returned by the API
+  (i.e., all values are empty), an empty column is created.
+
+  @param data datatable object
+  @param column name of the column that contains reference objects
+  @param attribute name of the attribute to keep (e.g., 'subjectID')
+  """
+  if column not in data.names:
+    data[column] = dt.Frame([None] * data.nrows, type=dt.Type.str32)
+    return
+  data[column] = dt.Frame([
+    obj.get(attribute) if bool(obj) else None
+    for obj in data[column].to_list()[0]
+  ], type=dt.Type.str32)
+
+def getSequencingMethod(description: str = None):
+  """Get Sequencing Method
+  Derive the VIP sequencing method from the description of a lab procedure
+
+  @param description description of the lab procedure (`umdm_labProcedures`)
+  @return 'WES', 'WGS', or NoneType
+  """
+  if not description:
+    return None
+  if re.search(r'(exoom|exome)', description, re.IGNORECASE):
+    return 'WES'
+  if re.search(r'(genoom|genome)', description, re.IGNORECASE):
+    return 'WGS'
+  return None
+
+def getReferenceData(session, labProcedures: list = None) -> dict:
+  """Get Reference Data
+  Retrieve all tables required for building VIP samplesheets. Tables are
+  fetched once and shared by all lab procedures.
+
+  @param session an instance of cosastools.molgenis.Molgenis
+  @param labProcedures optional list of lab procedure codes to limit the
+    sample preparation records to. If None, all records are returned.
+
+  @return dictionary of datatable objects
+  """
+  query = None
+  if labProcedures:
+    query = f"belongsToLabProcedure=in=({','.join(labProcedures)})"
+
+  # umdm_samplePreparation: find all samples associated with a test code
+  samplePrepDT = dt.Frame(
+    session.get(
+      'umdm_samplePreparation',
+      q=query,
+      attributes='belongsToSample,belongsToLabProcedure',
+      batch_size=10000
+    ),
+    types={
+      '_href': dt.Type.str32,
+      'belongsToSample': dt.Type.obj64,
+      'belongsToLabProcedure': dt.Type.obj64
+    }
+  )
+  del samplePrepDT['_href']
+  flattenXref(samplePrepDT, 'belongsToSample', 'sampleID')
+  flattenXref(samplePrepDT, 'belongsToLabProcedure', 'code')
+
+  # umdm_samples: retrieve sample metadata to find subject ID
+  samplesDT = dt.Frame(
+    session.get(
+      'umdm_samples',
+      attributes='sampleID,belongsToSubject',
+      batch_size=10000
+    ),
+    types={
+      '_href': dt.Type.str32,
+      'sampleID': dt.Type.str32,
+      'belongsToSubject': dt.Type.obj64
+    }
+  )
+  del samplesDT['_href']
+  flattenXref(samplesDT, 'belongsToSubject', 'subjectID')
+  samplesDT.key = 'sampleID'
+
+  # umdm_subjects: retrieve patient metadata
+  patientsDT = dt.Frame(
+    session.get(
+      'umdm_subjects',
+      attributes='subjectID,belongsToFamily,belongsToMother,belongsToFather,genderAtBirth,yearOfBirth',
+      batch_size=10000
+    ),
+    types = {
+      '_href': dt.Type.str32,
+      'subjectID': dt.Type.str32,
+      'belongsToFamily': dt.Type.str32,
+      'belongsToMother': dt.Type.obj64,
+      'belongsToFather': dt.Type.obj64,
+      'genderAtBirth': dt.Type.obj64,
+      'yearOfBirth': dt.Type.int16
+    }
+  )
+  del patientsDT['_href']
+  flattenXref(patientsDT, 'belongsToMother', 'subjectID')
+  flattenXref(patientsDT, 'belongsToFather', 'subjectID')
+  flattenXref(patientsDT, 'genderAtBirth', 'value')
+
+  patientsDT['genderAtBirth'] = dt.Frame([
+    re.sub(r'(assigned|at birth)', '', value).strip() if bool(value) else None
+    for value in patientsDT['genderAtBirth'].to_list()[0]
+  ], type=dt.Type.str32)
+
+  # calcualte age
+  currentYear = int(datetime.now().strftime('%Y'))
+  patientsDT['age'] = patientsDT[:, currentYear - f.yearOfBirth]
+  patientsDT.key = 'subjectID'
+
+  # umdm_clinical: merge phenotypic data (only observedPhenotypes). If an
+  # individual has an observedPhenotype, then affected status is true
+  hpoDT = dt.Frame(
+    session.get(
+      'umdm_clinical',
+      attributes='belongsToSubject,observedPhenotype',
+      batch_size=10000
+    ),
+    types = {
+      '_href': dt.Type.str32,
+      'belongsToSubject': dt.Type.obj64,
+      'observedPhenotype': dt.Type.obj64
+    }
+  )
+  del hpoDT['_href']
+  flattenXref(hpoDT, 'belongsToSubject', 'subjectID')
+  hpoDT['observedPhenotype'] = dt.Frame([
+    ','.join([row['code'] for row in obj]) if bool(obj) else None
+    for obj in hpoDT['observedPhenotype'].to_list()[0]
+  ], type=dt.Type.str32)
+
+  hpoDT = hpoDT[f.observedPhenotype != None, :]
+  hpoDT['affected'] = True
+  hpoDT.names = {'belongsToSubject': 'subjectID'}
+  hpoDT.key = 'subjectID'
+
+  # umdm_files: find the first vcf and cram file of each subject
+  filesDT = dt.Frame(
+    session.get(
+      'umdm_files',
+      attributes='belongsToSubject,fileName,filePath,fileFormat',
+      q='fileFormat=in=(vcf,cram)',
+      batch_size=10000
+    ),
+    types = {
+      '_href': dt.Type.str32,
+      'belongsToSubject': dt.Type.obj64,
+      'fileName': dt.Type.str32,
+      'filePath': dt.Type.str32,
+      'fileFormat': dt.Type.str32
+    }
+  )
+  del filesDT['_href']
+  flattenXref(filesDT, 'belongsToSubject', 'subjectID')
+  filesDT['file'] = filesDT[:, f.filePath + '/' + f.fileName]
+  filesDT.names = {'belongsToSubject': 'subjectID'}
+
+  cramDT = filesDT[f.fileFormat == 'cram', :][
+    :, {'cram': dt.first(f.file)}, dt.by(f.subjectID)
+  ]
+  vcfDT = filesDT[dt.re.match(f.fileName, '.*vcf.gz|.*vcf'), :][
+    :, {'vcf': dt.first(f.file)}, dt.by(f.subjectID)
+  ]
+  cramDT.key = 'subjectID'
+  vcfDT.key = 'subjectID'
+
+  # umdm_sequencing and umdm_labProcedures: metadata of each test code
+  sequencingDT = dt.Frame(
+    session.get(
+      'umdm_sequencing',
+      attributes='belongsToLabProcedure,referenceGenomeUsed',
+      batch_size=10000
+    ),
+    types = {
+      '_href': dt.Type.str32,
+      'belongsToLabProcedure': dt.Type.obj64,
+      'referenceGenomeUsed': dt.Type.obj64
+    }
+  )
+  del sequencingDT['_href']
+  flattenXref(sequencingDT, 'belongsToLabProcedure', 'code')
+  flattenXref(sequencingDT, 'referenceGenomeUsed', 'value')
+
+  labProceduresDT = dt.Frame(
+    session.get('umdm_labProcedures', attributes='code,description'),
+    types={
+      '_href': dt.Type.str32,
+      'code': dt.Type.str32,
+      'description': dt.Type.str32
+    }
+  )
+  del labProceduresDT['_href']
+
+  return {
+    'samplePreparation': samplePrepDT,
+    'samples': samplesDT,
+    'subjects': patientsDT,
+    'clinical': hpoDT,
+    'cram': cramDT,
+    'vcf': vcfDT,
+    'sequencing': sequencingDT,
+    'labProcedures': labProceduresDT
+  }
+
+def getLabProcedureMetadata(reference: dict):
+  """Get Lab Procedure Metadata
+  For all lab procedures that have sample preparation records, derive the
+  assembly (most common `referenceGenomeUsed` in umdm_sequencing) and the
+  sequencing method (from the description of the lab procedure).
+
+  @param reference output of `getReferenceData`
+  @return datatable object (code, assembly, sequencingMethod)
+  """
+  codesDT = dt.unique(
+    reference['samplePreparation'][
+      f.belongsToLabProcedure != None,
+      {'code': f.belongsToLabProcedure}
+    ]
+  )
+
+  assemblyDT = reference['sequencing'][
+    f.referenceGenomeUsed != None,
+    {'code': f.belongsToLabProcedure, 'assembly': f.referenceGenomeUsed}
+  ][:, {'count': dt.count()}, dt.by(f.code, f.assembly)][
+    :, :, dt.sort(f.code, -f.count)
+  ][:, {'assembly': dt.first(f.assembly)}, dt.by(f.code)]
+  assemblyDT.key = 'code'
+
+  labProceduresDT = reference['labProcedures'][:, ['code', 'description']]
+  labProceduresDT = labProceduresDT[:, dt.first(f.description), dt.by(f.code)]
+  labProceduresDT.key = 'code'
+
+  codesDT = codesDT[:, :, dt.join(assemblyDT)][:, :, dt.join(labProceduresDT)]
+  codesDT['sequencingMethod'] = dt.Frame([
+    getSequencingMethod(value)
+    for value in codesDT['description'].to_list()[0]
+  ], type=dt.Type.str32)
+  del codesDT['description']
+  return codesDT
+
+def buildSamplesheet(
+  reference: dict,
+  labProcedure: str,
+  assembly: str = 'GRCh37',
+  sequencingMethod: str = 'WES',
+  verbose: bool = False
+):
+  """Build Samplesheet
+  Create a VIP samplesheet for a single lab procedure
+
+  @param reference output of `getReferenceData`
+  @param labProcedure code of the lab procedure (e.g., 'NX154')
+  @param assembly reference genome
+  @param sequencingMethod sequencing method ('WES' or 'WGS')
+  @param verbose If True, families without an index will be printed
+
+  @return datatable object in the format of `cosasexports_vip`
+  """
+
+  # ~ 1 ~
+  # Merge datasets to create all patient metadata. Some individuals had
+  # multiple preparations from the same sample and some subjects have
+  # multiple samples. Only the link between subjects and samples is needed
+  samplePrepDT = reference['samplePreparation'][
+    f.belongsToLabProcedure == labProcedure, :
+  ]
+  if not samplePrepDT.nrows:
+    return dt.Frame()
+
+  vipDT = samplePrepDT[:, dt.first(f[:]), dt.by(f.belongsToSample)]
+  vipDT.names = {'belongsToSample': 'sampleID'}
+  vipDT = vipDT[:, :, dt.join(reference['samples'])]
+
+  vipDT = vipDT[:, dt.first(f[:]), dt.by(f.belongsToSubject)]
+  vipDT.names = {'belongsToSubject': 'subjectID'}
+  for table in ['subjects', 'clinical', 'cram', 'vcf']:
+    vipDT = vipDT[:, :, dt.join(reference[table])]
+
+  vipDT = vipDT[:, :, dt.sort(f.belongsToFamily)]
+
+  # ~ 2 ~
+  # Remove families where one or more family members where:
+  #   1. vcf or cram is unknown
+  #   2. the individual and maternal IDs are identical (i.e., fetus)
+  vipDT[:, dt.update(
+    isMissingFiles = (f.vcf == None) | (f.cram == None),
+    isFetus = f.subjectID == f.belongsToMother
+  )]
+  vipDT[
+    :, dt.update(removeFamily = dt.max(f.isMissingFiles | f.isFetus)),
+    dt.by(f.belongsToFamily)
+  ]
+  vipDT = vipDT[f.removeFamily != True, :]
+  if not vipDT.nrows:
+    return dt.Frame()
+
+  # ~ 3 ~
+  # Calculate index and add missing parents (see cosastools.pedigree).
+  # Remove familes where index is still none as it is difficult to determine
+  # the remaining relationships.
+  pedigree = Pedigree(vipDT)
+  pedigree.inferProbands(verbose=verbose)
+  pedigree.inferParents(female='female', male='male')
+  pedigree.update(vipDT, index='index', removeFamily='removeFamily')
+  vipDT = vipDT[f.removeFamily != True, :]
+  if not vipDT.nrows:
+    return dt.Frame()
+
+  # ~ 4 ~
+  # Prepare dataset
+  vipDT.names = {
+    'subjectID': 'individual_id',
+    'belongsToFamily': 'family_id',
+    'genderAtBirth': 'sex',
+    'index': 'proband',
+    'observedPhenotype': 'hpo_ids',
+    'belongsToFather': 'paternal_id',
+    'belongsToMother': 'maternal_id',
+  }
+  del vipDT[:, [
+    'yearOfBirth', 'removeFamily', 'isMissingFiles',
+    'isFetus', 'age', 'belongsToLabProcedure'
+  ]]
+
+  # update identifiers to match filename: individual, paternal, and maternal ID
+  vipDT['_id'] = dt.Frame([
+    path.basename(value).split('.')[0] if value else None
+    for value in vipDT['vcf'].to_list()[0]
+  ], type=dt.Type.str32)
+
+  filenamesDT = vipDT[:, {'parentID': f.individual_id, 'filename': f._id}]
+  filenamesDT.key = 'parentID'
+  for column in ['maternal_id', 'paternal_id']:
+    parentsDT = vipDT[:, {'parentID': f[column]}][:, :, dt.join(filenamesDT)]
+    vipDT[column] = parentsDT[:, dt.ifelse(f.filename != None, f.filename, f.parentID)]
+
+  # drop cases where there isn't a file - this information is likely missing
+  vipDT[:, dt.update(
+    maternal_id = dt.ifelse(dt.re.match(f.maternal_id, '.*_.*'), f.maternal_id, None),
+    paternal_id = dt.ifelse(dt.re.match(f.paternal_id, '.*_.*'), f.paternal_id, None)
+  )]
+
+  vipDT['project_id'] = vipDT[:, f'{labProcedure}_' + f.family_id]
+  vipDT['assembly'] = assembly
+  vipDT['sequencing_method'] = sequencingMethod
+
+  # change classes: boolean -> lowercase string (missing affected status is false)
+  vipDT[:, dt.update(
+    affected = dt.ifelse(f.affected == True, 'true', 'false'),
+    proband = dt.ifelse(f.proband == True, 'true', 'false')
+  )]
+
+  # replace individual_id with filename+individual_id
+  del vipDT['individual_id']
+  vipDT.names = {'_id': 'individual_id'}
+
+  # drop families with one individual
+  vipDT[:, dt.update(familySize = dt.count()), dt.by(f.family_id)]
+  vipDT = vipDT[f.familySize > 1, :]
+  del vipDT['familySize']
+  return vipDT
+
+def writeSamplesheets(samplesheets: dict, outputDir: str, workers: int = 4):
+  """Write Samplesheets
+  Write one samplesheet per lab procedure (`<outputDir>/<code>.tsv`) using
+  a pool of threads.
+
+  @param samplesheets dictionary of lab procedure code and datatable object
+  @param outputDir directory to write the samplesheets into
+  @param workers number of samplesheets to write at the same time
+
+  @return list of file paths
+  """
+  makedirs(outputDir, exist_ok=True)
+  paths = {
+    code: path.join(outputDir, f'{code}.tsv')
+    for code in samplesheets.keys()
+  }
+  with ThreadPoolExecutor(max_workers=workers) as executor:
+    list(executor.map(
+      lambda code: samplesheets[code].to_csv(paths[code], sep='\t'),
+      samplesheets.keys()
+    ))
+  return list(paths.values())
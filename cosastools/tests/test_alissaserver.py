@@ -0,0 +1,50 @@
+from cosastools.alissa import Alissa
+from cosastools.alissaserver import AlissaServer, generateAlissaData, generateVariants
+import pytest
+
+def test_generateAlissaData():
+  data = generateAlissaData(subjects=[('1', 'F1'), ('2', 'F1')], variants=(1, 5), inheritance=1)
+  assert data == generateAlissaData(subjects=[('1', 'F1'), ('2', 'F1')], variants=(1, 5), inheritance=1)
+  assert [patient['accessionNumber'] for patient in data['patients']] == ['F1_1', 'F1_2']
+  for analysisId, analysis in data['inheritance'].items():
+    assert analysis['analysisType'] == 'INHERITANCE'
+    assert {analysis['maternalPatientId'], analysis['paternalPatientId']} <= {1000, 1001}
+    assert analysis in data['analyses'][analysis['patientId']]
+  assert all(1 <= count <= 5 for count in data['variants'].values())
+
+def test_generateVariants():
+  variants = generateVariants(10001, 3)
+  assert len(variants) == 3
+  assert variants == generateVariants(10001, 3)
+  assert variants != generateVariants(10001, 3, seed=2)
+
+def test_getPatients():
+  server = AlissaServer(subjects=[('1', 'F1'), ('2', 'F2'), ('12', 'F2')])
+  assert [patient['id'] for patient in server.getPatients({'accessionNumber': '_1'})] == [1000, 1002]
+  assert [patient['id'] for patient in server.getPatients({'familyIdentifier': 'F2'})] == [1001, 1002]
+  assert server.getPatients({'createdAfter': '2100-01-01T00:00:00.000+0000'}) == []
+
+@pytest.fixture
+def client():
+  data = generateAlissaData(patients=3, analyses=(1, 1), variants=(2, 2), inheritance=0)
+  with AlissaServer(data=data) as server:
+    yield server, Alissa(
+      host=server.url,
+      clientId='cosas',
+      clientSecret='cosas',
+      username='cosas',
+      password='cosas'
+    )
+
+def test_variantExport(client):
+  server, alissa = client
+  patient = alissa.getPatients(accessionNumber=server.data['patients'][0]['accessionNumber'])[0]
+  analysis = alissa.getPatientAnalyses(patient['id'])[0]
+  exportId = alissa.getPatientVariantExportId(analysis['id'])['exportId']
+  variants = alissa.getPatientVariantExportData(analysis['id'], exportId)
+  assert variants == generateVariants(analysis['id'], 2, seed=server.seed)
+
+  with pytest.raises(Exception):
+    alissa.getInheritanceVariantExportId(analysis['id'])
+  assert [request['status'] for request in server.requests] == [200] * 5 + [404]
+  assert server.requests[0]['path'] == '/auth/oauth/token'
@@ -0,0 +1,53 @@
+from cosastools.benchmark import summariseRuns, compareResults
+
+def run(seconds, jobMemoryMb=100.0, rows=10000):
+  return {
+    'status': 'Success',
+    'job': 'daily-mappings',
+    'rows': rows,
+    'seconds': seconds,
+    'peakMemoryMb': jobMemoryMb + 85,
+    'jobMemoryMb': jobMemoryMb
+  }
+
+def results(**metrics):
+  result = {'id': 'daily-mappings-10000', 'status': 'Success', 'rows': 10000}
+  result.update(metrics)
+  return {'results': [result]}
+
+def test_summariseRuns():
+  result = summariseRuns([run(10.0), run(14.0), run(11.0, jobMemoryMb=120.0)])
+  assert result['seconds'] == 11.0
+  assert result['secondsMad'] == 1.0
+  assert result['jobMemoryMb'] == 100.0
+  assert result['rowsPerSecond'] == round(10000 / 11.0, 2)
+  assert result['runs'] == 3
+
+def test_compareResults():
+  baseline = results(seconds=10.0, jobMemoryMb=100.0)
+  assert compareResults(results(seconds=11.9, jobMemoryMb=119.0), baseline) == []
+  regressions = compareResults(results(seconds=12.5, jobMemoryMb=150.0), baseline)
+  assert [(regression['metric'], regression['change']) for regression in regressions] == [
+    ('seconds', 0.25),
+    ('jobMemoryMb', 0.5)
+  ]
+
+def test_compareResultsIgnoresNoise():
+  # short jobs, small absolute changes, and noisy runs do not regress
+  assert compareResults(results(seconds=0.1), results(seconds=0.05)) == []
+  assert compareResults(results(jobMemoryMb=15.0), results(jobMemoryMb=5.0)) == []
+  assert compareResults(
+    results(seconds=14.0, secondsMad=1.0),
+    results(seconds=10.0, secondsMad=0.5)
+  ) == []
+  assert compareResults(
+    results(seconds=10.0, rowsPerSecond=700.0),
+    results(seconds=10.0, rowsPerSecond=1000.0),
+    thresholds={'rowsPerSecond': 0.2}
+  )[0]['metric'] == 'rowsPerSecond'
+
+def test_compareResultsReportsFailedJobs():
+  failed = {'results': [{'id': 'daily-mappings-10000', 'status': 'Error', 'error': 'Exit code 1'}]}
+  assert compareResults(failed, results(seconds=10.0)) == [
+    {'id': 'daily-mappings-10000', 'metric': 'status', 'baseline': None, 'value': 'Exit code 1'}
+  ]
@@ -0,0 +1,120 @@
+from cosastools.datatable import (
+  columnGroupsBySuffix,
+  wideToLong,
+  summarizeFrame,
+  diffByKey
+)
+from cosastools.molgenis import Molgenis
+from cosastools.molgenisserver import MolgenisServer
+from datatable import dt
+
+def test_columnGroupsBySuffix():
+  names = ['id', 'md5_1', 'dateCreated_1', 'md5_2', 'md5_x']
+  assert columnGroupsBySuffix(names, ['md5', 'dateCreated']) == {
+    '1': {'md5': 'md5_1', 'dateCreated': 'dateCreated_1'},
+    '2': {'md5': 'md5_2'}
+  }
+
+def test_wideToLong():
+  data = dt.Frame(id=['a', 'b'], md5_1=['x', 'y'], size_1=[1, 2], md5_2=['z', None])
+  groups = columnGroupsBySuffix(data.names, ['md5', 'size'])
+  output = wideToLong(data, groups, index='read')
+  assert output.names == ('id', 'read', 'md5', 'size')
+  assert output[:, 'size'].type == dt.Type.int32
+  assert output.to_tuples() == [
+    ('a', '1', 'x', 1),
+    ('b', '1', 'y', 2),
+    ('a', '2', 'z', None),
+    ('b', '2', None, None)
+  ]
+
+def test_wideToLongWithIdColumns():
+  data = dt.Frame(id=['a'], other=['b'], md5_1=['x'], md5_2=['y'])
+  groups = columnGroupsBySuffix(data.names, ['md5'])
+  output = wideToLong(data, groups, idColumns={'identifier': 'id'})
+  assert output.to_tuples() == [('a', 'x'), ('a', 'y')]
+  assert output.names == ('identifier', 'md5')
+
+def test_wideToLongWithoutRows():
+  data = dt.Frame(
+    id=[], md5_1=[], size_1=[], md5_2=[],
+    types=[dt.Type.str32, dt.Type.str32, dt.Type.int32, dt.Type.str32]
+  )
+  groups = columnGroupsBySuffix(data.names, ['md5', 'size'])
+  output = wideToLong(data, groups, index='read')
+  assert output.shape == (0, 4)
+  assert output.names == ('id', 'read', 'md5', 'size')
+  assert output[:, 'size'].type == dt.Type.int32
+
+def test_summarizeFrame():
+  data = dt.Frame(
+    id=['a', 'bb', 'ccc', None],
+    count=[1, 1, None, None],
+    phenotypes=[['HP:1'], None, ['HP:2'], None],
+    types={'phenotypes': dt.Type.obj64}
+  )
+  summary = summarizeFrame(data, 'subjects')
+  assert summary.names[:2] == ('databaseTable', 'databaseColumn')
+  assert summary[:, [
+    'databaseColumn', 'countOfValues', 'totalValues', 'distinctValues',
+    'minLength', 'maxLength', 'differenceInValues', 'percentComplete'
+  ]].to_tuples() == [
+    ('id', 3, 4, 3, 1, 3, 1, 0.75),
+    ('count', 2, 4, 1, None, None, 2, 0.5),
+    ('phenotypes', 2, 4, None, None, None, 2, 0.5)
+  ]
+
+def test_summarizeFrameWithoutRows():
+  summary = summarizeFrame(dt.Frame(id=[], types=[dt.Type.str32]))
+  assert summary[:, ['countOfValues', 'totalValues', 'percentComplete']].to_tuples() == [
+    (0, 0, None)
+  ]
+
+def test_diffByKey():
+  current = dt.Frame(
+    identifier=['a', 'b', 'c'],
+    countOfValues=[1, 2, 3],
+    dateLastUpdated=['2023-07-01'] * 3
+  )
+  data = dt.Frame(
+    identifier=['a', 'b', 'd'],
+    countOfValues=[1, 5, 4],
+    dateLastUpdated=['2023-07-02'] * 3
+  )
+  changes = diffByKey(current, data, key='identifier', columns=['countOfValues'])
+  assert changes['changed'].to_tuples() == [
+    ('b', 5, '2023-07-02'),
+    ('d', 4, '2023-07-02')
+  ]
+  assert changes['removed'] == ['c']
+
+def test_diffByKeyWithoutCurrentData():
+  data = dt.Frame(identifier=['a'], countOfValues=[1])
+  changes = diffByKey(dt.Frame(), data, key='identifier')
+  assert changes['changed'].to_tuples() == [('a', 1)]
+  assert changes['removed'] == []
+
+def test_diffByKeyWithReferences():
+  summary = dt.Frame(
+    identifier=['subjects_subjectID', 'subjects_belongsToFamily'],
+    databaseKey=['primary database key', 'foreign database key'],
+    countOfValues=[10, 8]
+  )
+  with MolgenisServer() as server:
+    server.addTable('cosasreports_refs_keytypes', [
+      {'value': 'primary database key'},
+      {'value': 'foreign database key'}
+    ])
+    server.addTable(
+      'cosasreports_attributesummary',
+      [dict(zip(summary.names, row)) for row in summary.to_tuples()],
+      refs={'databaseKey': 'cosasreports_refs_keytypes'}
+    )
+    session = Molgenis(url=f"{server.url}api/", token=server.token)
+    rows = session.get('cosasreports_attributesummary')
+    assert isinstance(rows[0]['databaseKey'], dict)
+    current = dt.Frame(session.get('cosasreports_attributesummary', uploadable=True))
+
+  changes = diffByKey(current, summary, key='identifier')
+  assert changes['changed'].nrows == 0
+  assert changes['removed'] == []
@@ -0,0 +1,144 @@
+from cosastools.files import (
+  getFileType,
+  formatDnaId,
+  formatFilePath,
+  normaliseFileMetadata,
+  normaliseFileDate,
+  getIngestedFiles,
+  updateIngestedFiles,
+  isNewOrModified,
+  readListing,
+  prepareFastqListing
+)
+from datatable import dt
+from os import path, utime
+from time import time
+
+def test_getFileType():
+  assert getFileType('sample.vcf.gz') == 'vcf'
+  assert getFileType('sample.vcf.gz.tbi') == 'vcf'
+  assert getFileType('sample.vcf') == 'vcf'
+  assert getFileType('sample.bam.cram') == 'cram'
+  assert getFileType('sample.bam') == 'bam'
+  assert getFileType('sample_R1.fq.gz') == 'fastq'
+  assert getFileType('sample.txt') is None
+  assert getFileType(None) is None
+
+def test_formatIdentifiers():
+  assert formatDnaId('DNA12345') == 'DNA-12345'
+  assert formatDnaId(None) is None
+  assert formatFilePath('/groups//umcg///data/') == '/groups/umcg/data/'
+
+def test_normaliseFileMetadata():
+  data = normaliseFileMetadata(dt.Frame(
+    dnaID=['DNA123', 'DNA123', None],
+    filename=['a.vcf.gz', 'N/A', 'b.bam'],
+    filepath=['/data//a/', '/data//a/', '/data/b/']
+  ))
+  assert data[:, ['belongsToSample', 'fileFormat', 'fileID']].to_tuples() == [
+    ('DNA-123', 'vcf', '/data/a/a.vcf.gz'),
+    ('DNA-123', None, None),
+    (None, 'bam', '/data/b/b.bam')
+  ]
+
+class Session:
+  """Returns the rows of umdm_files"""
+  def __init__(self, rows):
+    self.rows = rows
+    self.calls = 0
+
+  def get(self, entity, **kwargs):
+    self.calls += 1
+    return self.rows
+
+def test_normaliseFileDate():
+  local = '2023-07-04T10:01:02'
+  assert normaliseFileDate('2023-07-04 10:01:02') == local
+  assert normaliseFileDate('2023-07-04T10:01:02.123456') == local
+  assert normaliseFileDate('2023-07-04T08:01:02Z') == local
+  assert normaliseFileDate('2023-07-04T08:01:02.5Z') == local
+  assert normaliseFileDate('2023-07-04T09:01:02+01:00') == local
+  assert normaliseFileDate('2023-01-04T09:01:02Z') == '2023-01-04T10:01:02'
+  assert normaliseFileDate('2023-07-04') == '2023-07-04T00:00:00'
+  assert normaliseFileDate(normaliseFileDate('2023-07-04T08:01:02Z')) == local
+  assert normaliseFileDate('04-07-2023') == '04-07-2023'
+  assert normaliseFileDate('') is None
+  assert normaliseFileDate(None) is None
+
+def test_isNewOrModified():
+  session = Session([
+    {'fileID': '/a.vcf.gz', 'dateFileCreated': '2023-07-04T08:01:02Z'},
+    {'fileID': '/b.vcf.gz', 'dateFileCreated': '2023-07-04T08:01:02Z'},
+    {'fileID': '/c.vcf.gz'}
+  ])
+  ingested = getIngestedFiles(session)
+  data = dt.Frame(
+    fileID=['/a.vcf.gz', '/b.vcf.gz', '/c.vcf.gz', '/d.vcf.gz'],
+    dateCreated=['2023-07-04 10:01:02', '2023-07-05 10:01:02', None, '2023-07-04 10:01:02']
+  )
+  assert isNewOrModified(data, ingested) == [False, True, False, True]
+
+def test_ingestedFilesCache(tmp_path):
+  cacheFile = str(tmp_path / 'umdm_files.jay')
+  session = Session([{'fileID': '/a.vcf.gz', 'dateFileCreated': '2023-07-04T08:01:02Z'}])
+  ingested = getIngestedFiles(session, cacheFile=cacheFile, maxAge=24)
+  assert session.calls == 1
+
+  # the cache is updated after an import without changing its age
+  created = time() - 3600
+  utime(cacheFile, (created, created))
+  updateIngestedFiles(
+    ingested,
+    dt.Frame(fileID=['/b.vcf.gz'], dateFileCreated=['2023-07-05 10:01:02']),
+    cacheFile=cacheFile
+  )
+  assert path.getmtime(cacheFile) == created
+  assert getIngestedFiles(session, cacheFile=cacheFile, maxAge=24) == {
+    '/a.vcf.gz': '2023-07-04T10:01:02',
+    '/b.vcf.gz': '2023-07-05T10:01:02'
+  }
+  assert session.calls == 1
+
+  # expired caches are rebuilt from umdm_files
+  expired = time() - 48 * 3600
+  utime(cacheFile, (expired, expired))
+  assert getIngestedFiles(session, cacheFile=cacheFile, maxAge=24) == {
+    '/a.vcf.gz': '2023-07-04T10:01:02'
+  }
+  assert session.calls == 2
+
+def test_readListing(tmp_path):
+  file = tmp_path / 'listing.tsv'
+  file.write_text(
+    'umcgID\tdnaID\tdateCreated\n'
+    '123\tDNA1\t2023-07-04\n'
+    '456\tDNA2\t\n'
+    '2023-07-05\n'
+    '789\t\t2023-07-06\n'
+  )
+  chunks = list(readListing(str(file), chunkSize=2))
+  assert [chunk.nrows for chunk in chunks] == [2, 1]
+  assert dt.rbind(chunks).to_tuples() == [
+    ('123', 'DNA1', '2023-07-04'),
+    ('456', 'DNA2', '2023-07-05'),
+    ('789', None, '2023-07-06')
+  ]
+
+def test_prepareFastqListing():
+  data = prepareFastqListing(dt.Frame(
+    id=['1', '2', '3'],
+    umcgID=['123', '00', '456'],
+    dnaID=['DNA12', 'DNA34', 'DNA56'],
+    fastQname1=['a_1.fq.gz', 'b_1.fq.gz', 'c_1.fq.gz'],
+    md5_1=['x', 'x', 'x'],
+    dateCreated1=['2023-07-04', '2023-07-04', '2023-07-04'],
+    fastQname2=['a_2.fq.gz', 'b_2.fq.gz', 'c_2.fq.gz'],
+    md5_2=['x', 'x', 'x'],
+    dateCreated2=['2023-07-05', '2023-07-05', '2023-07-05']
+  ))
+  assert data[:, ['umcgID', 'filename', 'dateCreated']].to_tuples() == [
+    ('123', 'a_1.fq.gz', '2023-07-04'),
+    ('456', 'c_1.fq.gz', '2023-07-04'),
+    ('123', 'a_2.fq.gz', '2023-07-05'),
+    ('456', 'c_2.fq.gz', '2023-07-05')
+  ]
@@ -0,0 +1,49 @@
+from cosastools import logger
+from cosastools.logger import cosasLogger, countRows, peakMemoryUsage
+from datatable import dt
+import pytest
+
+class Usage:
+  ru_maxrss = 2 * 1024 ** 2
+
+class Resource:
+  RUSAGE_SELF = 0
+
+  def getrusage(self, who):
+    return Usage()
+
+@pytest.mark.parametrize('platform, expected', [('linux', 2048), ('darwin', 2)])
+def test_peakMemoryUsage(monkeypatch, platform, expected):
+  monkeypatch.setattr(logger, 'resource', Resource())
+  monkeypatch.setattr(logger.sys, 'platform', platform)
+  assert peakMemoryUsage() == expected
+
+def test_peakMemoryUsageIsUnavailable(monkeypatch):
+  monkeypatch.setattr(logger, 'resource', None)
+  assert peakMemoryUsage() is None
+
+def test_countRows():
+  assert countRows(dt.Frame(a=[1, 2, 3])) == 3
+  assert countRows([{}, {}]) == 2
+  assert countRows(None) is None
+
+def test_processingStep():
+  cosaslogs = cosasLogger(silent=True)
+  cosaslogs.start()
+
+  @cosaslogs.processingStep('Filtering', tablename='subjects')
+  def removeEmpty(data):
+    return data[:2, :]
+
+  removeEmpty(dt.Frame(a=[1, 2, 3]))
+  with pytest.raises(ValueError):
+    with cosaslogs.step('Import', 'import-subjects', 'subjects', rowsIn=2):
+      raise ValueError('failed')
+
+  steps = cosaslogs.processingStepLogs
+  assert [(step['name'], step['status'], step['rowsIn'], step['rowsOut']) for step in steps] == [
+    ('removeEmpty', 'Success', 3, 2),
+    ('import-subjects', 'Error', 2, None)
+  ]
+  assert steps[1]['comment'] == 'failed'
+  assert all(step['elapsedTime'] is not None and step['cpuTime'] is not None for step in steps)
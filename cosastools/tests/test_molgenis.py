@@ -0,0 +1,43 @@
+from cosastools.molgenis import Molgenis
+from cosastools.molgenisserver import MolgenisServer
+from cosastools.datatable import summarizeFrame
+from datatable import dt
+
+clinical = [
+  {'clinicalID': 'C1', 'belongsToSubject': 'S1', 'observedPhenotype': ['HP:0001250', 'HP:0000252']},
+  {'clinicalID': 'C2', 'belongsToSubject': 'S2', 'observedPhenotype': []},
+  {'clinicalID': 'C3', 'observedPhenotype': ['HP:0001250']},
+  {'clinicalID': 'C4'}
+]
+
+def test_countValuesMatchesLocalCounts():
+  attributes = ['clinicalID', 'belongsToSubject', 'observedPhenotype']
+  with MolgenisServer() as server:
+    server.addTable('umdm_subjects', [{'subjectID': 'S1'}, {'subjectID': 'S2'}])
+    server.addTable('umdm_hpo', [{'code': 'HP:0001250'}, {'code': 'HP:0000252'}])
+    server.addTable(
+      'umdm_clinical',
+      clinical,
+      refs={'belongsToSubject': 'umdm_subjects', 'observedPhenotype': 'umdm_hpo'}
+    )
+    session = Molgenis(url=f"{server.url}api/", token=server.token)
+    counts = session.countValues('umdm_clinical', attributes)
+    assert session.count('umdm_clinical') == 4
+
+    # flatten rows in the same way as the attribute summary job
+    rows = session.get('umdm_clinical', attributes=','.join(attributes))
+    for row in rows:
+      row['belongsToSubject'] = row.get('belongsToSubject', {}).get('subjectID')
+      row['observedPhenotype'] = len(row.get('observedPhenotype')) if row.get('observedPhenotype') else None
+    data = dt.Frame(rows)
+    del data['_href']
+
+  local = summarizeFrame(data)[:, ['databaseColumn', 'countOfValues', 'totalValues']]
+  assert [
+    (row['attribute'], row['countOfValues'], row['totalValues']) for row in counts
+  ] == local.to_tuples()
+  assert local.to_tuples() == [
+    ('clinicalID', 4, 4),
+    ('belongsToSubject', 2, 4),
+    ('observedPhenotype', 2, 4)
+  ]
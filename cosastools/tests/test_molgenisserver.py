@@ -0,0 +1,49 @@
+from cosastools.molgenis import Molgenis
+from cosastools.molgenisserver import MolgenisServer, _matchValue, _matchRow
+from cosastools.snapshot import parseRsql
+from datatable import dt
+import pytest
+
+@pytest.mark.parametrize('value, op, query, expected', [
+  (10, '==', '10', True),
+  (10, '=ge=', '9.5', True),
+  (10, '=lt=', '10', False),
+  ('abc', '=like=', 'B', True),
+  (True, '==', 'true', True),
+  (None, '==', '', True),
+  ('a', '!=', '', True),
+  (['a', 'b'], '==', 'b', True),
+  (['a', 'b'], '!=', 'b', False),
+  (['a', 'b'], '=in=', ['c', 'a'], True),
+  ('a', '=out=', ['a'], False),
+  (None, '=out=', ['a'], True)
+])
+def test_matchValue(value, op, query, expected):
+  assert _matchValue(value, op, query) is expected
+
+def test_matchRow():
+  row = {'subjectID': '1', 'age': 10, 'family': 'A'}
+  assert _matchRow(row, parseRsql('family==A;age=gt=5'))
+  assert _matchRow(row, parseRsql('family==B,subjectID==1'))
+  assert not _matchRow(row, parseRsql('family==B;(subjectID==1,age==10)'))
+
+def test_getAndImport():
+  subjects = [{'subjectID': str(id), 'age': id * 10} for id in range(1, 6)]
+  with MolgenisServer() as server:
+    server.addTable('umdm_subjects', subjects)
+    session = Molgenis(url=f"{server.url}api/", token=server.token)
+    rows = session.get('umdm_subjects', q='age=ge=30', batch_size=2)
+    assert [row['subjectID'] for row in rows] == ['3', '4', '5']
+    assert session.count('umdm_subjects', q='age=lt=30') == 2
+
+    response = session.importDatatableAsCsv(
+      'umdm_subjects',
+      dt.Frame(subjectID=['5', '6'], age=[55, 60])
+    )
+    assert response.status_code // 100 == 2
+
+  # stopping the server waits for import jobs
+  rows = {row['subjectID']: row for row in server.rows('umdm_subjects')}
+  assert rows['5']['age'] == '55'
+  assert rows['6']['age'] == '60'
+  assert len(rows) == 6
@@ -0,0 +1,67 @@
+from cosastools.pedigree import Pedigree
+from datatable import dt
+
+def familyFrame():
+  return dt.Frame(
+    subjectID=['1', '2', '3', '4', '5'],
+    belongsToFamily=['A', 'A', 'A', 'B', 'B'],
+    belongsToMother=['2', None, None, None, None],
+    belongsToFather=[None, None, None, None, None],
+    genderAtBirth=['male', 'female', 'male', 'female', 'male'],
+    age=[5, 35, 38, 40, None],
+    types=[dt.Type.str32] * 5 + [dt.Type.int32]
+  )
+
+def test_inferProbands():
+  pedigree = Pedigree(familyFrame())
+  probands = pedigree.inferProbands(verbose=False)
+  assert probands['1'] is True
+  assert probands['2'] is False
+  assert probands['3'] is False
+  assert probands['4'] is None
+  assert probands['5'] is None
+
+def test_familiesToRemove():
+  pedigree = Pedigree(familyFrame())
+  pedigree.inferProbands(verbose=False)
+  assert pedigree.familiesToRemove() == {'B'}
+
+def test_inferParents():
+  pedigree = Pedigree(familyFrame())
+  pedigree.inferProbands(verbose=False)
+  parents = pedigree.inferParents()
+  assert parents['1'] == ('2', '3')
+  assert parents['2'] == (None, None)
+
+def test_update():
+  data = familyFrame()
+  pedigree = Pedigree(data)
+  pedigree.inferProbands(verbose=False)
+  pedigree.inferParents()
+  pedigree.update(data)
+  assert data['index'].to_list()[0] == [True, False, False, None, None]
+  assert data['belongsToFather'].to_list()[0] == ['3', None, None, None, None]
+  assert data['removeFamily'].to_list()[0] == [False, False, False, True, True]
+
+def test_duplicateSubjectsAreIgnored():
+  data = dt.rbind(familyFrame(), familyFrame()[0, :])
+  pedigree = Pedigree(data)
+  assert len(pedigree.subjects) == 5
+  assert pedigree.families['A'] == ['1', '2', '3']
+
+def test_validateParents():
+  data = dt.Frame(
+    subjectID=['1', '2', '3', '4'],
+    belongsToFamily=['A', 'A', 'A', 'B'],
+    belongsToMother=['3', None, None, '4'],
+    belongsToFather=['9', None, None, None],
+    genderAtBirth=['female', 'female', 'male', 'female'],
+    age=[10, 40, 42, 30],
+    types=[dt.Type.str32] * 5 + [dt.Type.int32]
+  )
+  issues = Pedigree(data).validateParents()
+  assert issues[:, ['subjectID', 'issue']].to_tuples() == [
+    ('1', 'unexpected sex'),
+    ('1', 'parent not registered'),
+    ('4', 'subject is own parent')
+  ]
@@ -0,0 +1,197 @@
+from cosastools.logger import cosasLogger
+from cosastools.pipeline import Pipeline, Stage, fingerprintValue
+from datatable import dt
+import importlib
+import json
+import pytest
+import os
+import sys
+
+def test_profilingRunsStagesInMainProcess():
+  cosaslogs = cosasLogger(silent=True, profile=True)
+  cosaslogs.start()
+  pipeline = Pipeline(logger=cosaslogs, workers=2, executor='process')
+
+  @pipeline.stage(outputs='values')
+  def buildValues(size):
+    return [str(value) for value in range(size)]
+
+  @pipeline.stage(outputs='total')
+  def countValues(values):
+    return dt.Frame(value=values).nrows
+
+  results = pipeline.run({'size': 50000})
+  cosaslogs.stop()
+  assert results['total'] == 50000
+  assert [profile['name'] for profile in cosaslogs.profileLogs] == ['buildValues', 'countValues']
+  allocations = cosaslogs.profileLogs[0]['allocations']
+  assert any(__file__ in allocation['location'] for allocation in allocations)
+
+def test_profileReportListsStageFrames(tmp_path):
+  cosaslogs = cosasLogger(silent=True, profile=True)
+  cosaslogs.start()
+  pipeline = Pipeline(logger=cosaslogs)
+
+  @pipeline.stage(outputs='subjects')
+  def buildSubjects(raw_subjects):
+    return raw_subjects[dt.f.age > 18, :]
+
+  pipeline.run({'raw_subjects': dt.Frame(subjectID=['1', '2', '3'], age=[10, 20, 30])})
+  cosaslogs.stop()
+  cosaslogs.writeProfileReport(str(tmp_path / 'profile.json'))
+  with open(tmp_path / 'profile.json', 'r') as file:
+    report = json.load(file)
+
+  frames = {frame['name']: frame for frame in report['steps'][0]['frames']}
+  assert (frames['subjects']['nrows'], frames['subjects']['ncols']) == (2, 2)
+  assert (frames['raw_subjects']['nrows'], frames['raw_subjects']['ncols']) == (3, 2)
+
+def test_fingerprintValue():
+  data = dt.Frame(id=['1', '2', None], value=[1, None, 3])
+  sliced = dt.Frame(id=['0', '1', '2', None], value=[0, 1, None, 3])[1:, :]
+  combined = dt.rbind(dt.Frame(id=['1'], value=[1]), dt.Frame(id=['2', None], value=[None, 3]))
+  fingerprint = fingerprintValue(data)
+  sliced.max()
+  assert fingerprintValue(sliced) == fingerprint
+  assert fingerprintValue(combined) == fingerprint
+  assert fingerprintValue(dt.Frame(id=['1', '2', None], value=[1, None, 4])) != fingerprint
+
+  objects = dt.Frame(value=[{'id': 1}], types=[dt.Type.obj64])
+  assert fingerprintValue(objects) == fingerprintValue(objects.copy())
+  assert fingerprintValue({'a': 1}) == fingerprintValue({'a': 1})
+
+def writeStages(directory, suffix):
+  (directory / 'stages.py').write_text(
+    'def formatId(value):\n'
+    f'  return value + "{suffix}"\n'
+    '\n'
+    'def buildIds(ids):\n'
+    '  return [formatId(id) for id in ids]\n'
+  )
+  sys.modules.pop('stages', None)
+  return importlib.import_module('stages')
+
+def test_cacheIsInvalidatedWhenHelpersChange(tmp_path, monkeypatch):
+  monkeypatch.syspath_prepend(str(tmp_path))
+  pipeline = Pipeline(cacheDir=str(tmp_path / 'cache'))
+  stages = writeStages(tmp_path, '-a')
+  pipeline.add(Stage(stages.buildIds, outputs='subjects'))
+  assert pipeline.run({'ids': ['1']})['subjects'] == ['1-a']
+
+  stages = writeStages(tmp_path, '-b')
+  pipeline.add(Stage(stages.buildIds, outputs='subjects'))
+  assert pipeline.run({'ids': ['1']})['subjects'] == ['1-b']
+
+def test_cacheIsInvalidatedWhenVersionChanges():
+  def buildIds(ids):
+    return ids
+
+  data = {'ids': ['1']}
+  assert Stage(buildIds, outputs='subjects').fingerprint(data) == (
+    Stage(buildIds, outputs='subjects').fingerprint(data)
+  )
+  assert Stage(buildIds, outputs='subjects').fingerprint(data) != (
+    Stage(buildIds, outputs='subjects', version='2').fingerprint(data)
+  )
+
+def test_stagesWithoutInputsAreNotCached(tmp_path):
+  exports = [dt.Frame(id=['1'])]
+  pipeline = Pipeline(cacheDir=str(tmp_path))
+
+  @pipeline.stage(outputs='raw_subjects', local=True)
+  def fetchSubjects():
+    return exports[-1]
+
+  @pipeline.stage(outputs='subjects')
+  def buildSubjects(raw_subjects):
+    return raw_subjects.nrows
+
+  assert pipeline.run()['subjects'] == 1
+  exports.append(dt.Frame(id=['1', '2']))
+  assert pipeline.run()['subjects'] == 2
+  assert 'fetchSubjects_manifest.json' not in [file.name for file in tmp_path.iterdir()]
+
+def test_resumeFromFailedImport(tmp_path):
+  calls = {'fetchSubjects': 0, 'buildSubjects': 0, 'importSubjects': 0}
+  failImport = [True]
+
+  def buildPipeline():
+    pipeline = Pipeline(checkpointDir=str(tmp_path))
+
+    @pipeline.stage(outputs='raw_subjects', local=True)
+    def fetchSubjects():
+      calls['fetchSubjects'] += 1
+      return dt.Frame(id=['1', '2', None])
+
+    @pipeline.stage(outputs='subjects')
+    def buildSubjects(raw_subjects):
+      calls['buildSubjects'] += 1
+      return raw_subjects[dt.f.id != None, :]
+
+    @pipeline.stage(outputs='imported', local=True)
+    def importSubjects(subjects):
+      calls['importSubjects'] += 1
+      if failImport[0]:
+        raise ConnectionError('import failed')
+      return subjects.nrows
+
+    return pipeline
+
+  with pytest.raises(ConnectionError):
+    buildPipeline().run()
+  assert calls == {'fetchSubjects': 1, 'buildSubjects': 1, 'importSubjects': 1}
+
+  failImport[0] = False
+  pipeline = buildPipeline()
+  results = pipeline.run(resumeFrom='importSubjects')
+  assert results['imported'] == 2
+  assert results['subjects'].to_list() == [['1', '2']]
+  assert calls == {'fetchSubjects': 1, 'buildSubjects': 1, 'importSubjects': 2}
+
+  # all outputs can be restored without running any stages
+  assert pipeline.restore()['imported'] == 2
+
+def test_processExecutor():
+  cosaslogs = cosasLogger(silent=True)
+  cosaslogs.start()
+  pipeline = Pipeline(logger=cosaslogs, workers=2, executor='process')
+
+  @pipeline.stage(outputs=['subjects', 'subjectIDs'])
+  def buildSubjects(raw_subjects):
+    subjects = raw_subjects[dt.f.subjectID != None, :]
+    return subjects, subjects['subjectID'].to_list()[0]
+
+  @pipeline.stage(outputs='samples')
+  def buildSamples(raw_samples, subjectIDs):
+    return raw_samples[dt.f.belongsToSubject.re_match('|'.join(subjectIDs)), :]
+
+  @pipeline.stage(outputs='clinical')
+  def buildClinical(subjects):
+    return subjects[:, {'subjectID': dt.f.subjectID, 'isAdult': dt.f.age >= 18}]
+
+  @pipeline.stage(outputs='workerID')
+  def getWorkerID(clinical):
+    return os.getpid()
+
+  results = pipeline.run({
+    'raw_subjects': dt.Frame(
+      subjectID=['1', '2', None],
+      age=[10, 40, 50],
+      dateOfBirth=['2015-01-01', '1985-01-01', None],
+      types={'dateOfBirth': dt.Type.date32}
+    ),
+    'raw_samples': dt.Frame(sampleID=['a', 'b', 'c'], belongsToSubject=['1', '3', '2'])
+  })
+  cosaslogs.stop()
+
+  assert results['subjects'].types == [dt.Type.str32, dt.Type.int32, dt.Type.date32]
+  assert results['subjects'].to_tuples()[0][:2] == ('1', 10)
+  assert results['subjectIDs'] == ['1', '2']
+  assert results['samples'].to_tuples() == [('a', '1'), ('c', '2')]
+  assert results['clinical'].to_tuples() == [('1', False), ('2', True)]
+  assert results['workerID'] != os.getpid()
+
+  # each stage ran in a worker and measured its own cpu time
+  steps = {step['name']: step for step in cosaslogs.processingStepLogs}
+  assert all(steps[name]['status'] == 'Success' for name in steps)
+  assert all(steps[name]['cpuTime'] is not None for name in steps)
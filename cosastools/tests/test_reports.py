@@ -0,0 +1,181 @@
+from cosastools.reports import (
+  buildCompletenessSnapshot,
+  getCompletenessHistory,
+  JOB_DURATION_BINS,
+  parseTimestamp,
+  durationPercentile,
+  getJobStatistics,
+  getJobWatermark,
+  getPendingExecutions,
+  getJobExecutions,
+  updateJobStatistics,
+  jobStatisticsToFrame,
+  analyseProcessingSteps
+)
+from datatable import dt
+from datetime import datetime, timedelta, timezone
+
+class Session:
+  """Records queries and returns the rows of a table"""
+  def __init__(self, rows: list = None):
+    self.rows = rows or []
+    self.queries = []
+
+  def get(self, entity, q=None, **kwargs):
+    self.queries.append(q)
+    if q and q.startswith('identifier=in='):
+      ids = q.split('(')[1].split(')')[0].split(',')
+      return [row for row in self.rows if str(row.get('identifier')) in ids]
+    return self.rows
+
+def timestamp(hours: float):
+  """ISO timestamp relative to now"""
+  value = datetime.now(timezone.utc) + timedelta(hours=hours)
+  return value.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def execution(identifier, name, status, submitted: float, duration: float = 30):
+  return {
+    'identifier': identifier,
+    'name': name,
+    'status': status,
+    'submissionDate': timestamp(submitted),
+    'startDate': timestamp(submitted),
+    'endDate': timestamp(submitted + duration / 3600) if status != 'RUNNING' else None
+  }
+
+def test_buildCompletenessSnapshot():
+  summary = dt.Frame(
+    identifier=['subjects_subjectID'],
+    databaseTable=['subjects'],
+    databaseColumn=['subjectID'],
+    countOfValues=[9],
+    totalValues=[10],
+    percentComplete=[0.9],
+    dateLastUpdated=['2023-07-01']
+  )
+  snapshot = buildCompletenessSnapshot(summary, date='2023-07-02')
+  assert snapshot.names == (
+    'identifier', 'date', 'attribute', 'databaseTable', 'databaseColumn',
+    'countOfValues', 'totalValues', 'percentComplete'
+  )
+  assert snapshot[0, :].to_tuples() == [(
+    'subjects_subjectID_2023-07-02', '2023-07-02', 'subjects_subjectID',
+    'subjects', 'subjectID', 9, 10, 0.9
+  )]
+
+def test_getCompletenessHistory():
+  session = Session([
+    {'_href': '/2', 'attribute': 'b', 'date': '2023-07-01', 'percentComplete': 0.5},
+    {'_href': '/1', 'attribute': 'a', 'date': '2023-07-02', 'percentComplete': 0.9},
+    {'_href': '/0', 'attribute': 'a', 'date': '2023-07-01', 'percentComplete': 0.8}
+  ])
+  history = getCompletenessHistory(session, attribute='a', days=7, today='2023-07-02')
+  assert session.queries == ['date=ge=2023-06-26;date=le=2023-07-02;attribute==a']
+  assert history[:, ['attribute', 'date']].to_tuples() == [
+    ('a', '2023-07-01'), ('a', '2023-07-02'), ('b', '2023-07-01')
+  ]
+
+def test_parseTimestamp():
+  assert parseTimestamp('2023-07-01T00:00:00Z') == parseTimestamp('2023-07-01T02:00:00+02:00')
+  assert parseTimestamp('2023-07-01T00:00:00') == parseTimestamp('2023-07-01T00:00:00.000Z')
+  assert parseTimestamp(None) is None
+
+def test_getJobWatermark():
+  statistics = {
+    'a': {'lastSubmissionDate': '2023-07-01T10:00:00Z'},
+    'b': {'lastSubmissionDate': '2023-07-01T11:30:00+02:00'},
+    'c': {}
+  }
+  assert getJobWatermark(statistics) == '2023-07-01T10:00:00Z'
+  assert getJobWatermark({}) is None
+
+def test_durationPercentile():
+  histogram = [0] * (len(JOB_DURATION_BINS) + 1)
+  assert durationPercentile(histogram, 0.5) is None
+  histogram[3] = 9
+  histogram[-1] = 1
+  assert durationPercentile(histogram, 0.5) == 10
+  assert durationPercentile(histogram, 0.95) == JOB_DURATION_BINS[-1]
+
+def test_getJobExecutions():
+  session = Session()
+  getJobExecutions(session)
+  getJobExecutions(session, watermark='2023-07-01T00:00:00Z', exclude=['TEST'], pending=['7', '9'])
+  assert session.queries == [
+    None,
+    'submissionDate=gt=2023-07-01T00:00:00Z;name!=TEST',
+    'identifier=in=(7,9);name!=TEST'
+  ]
+
+def test_updateJobStatistics():
+  statistics = updateJobStatistics({}, [
+    execution(1, 'daily', 'SUCCESS', -50, duration=4),
+    execution(2, 'daily', 'FAILED', -26, duration=50),
+    execution(3, 'daily', 'SUCCESS', -2, duration=4),
+    execution(4, 'daily', 'RUNNING', -1),
+    execution(5, 'daily', 'SUCCESS', -0.5)
+  ])
+  job = statistics['daily']
+  assert job['numberOfRuns'] == 3
+  assert job['numberOfSuccessfulRuns'] == 2
+  assert job['successRate'] == 0.6667
+  assert job['durationMedian'] == 5
+  assert job['lastStatus'] == 'SUCCESS'
+  assert job['lastSubmissionDate'] == timestamp(-2)
+
+def test_pendingExecutionsAreRetrievedUntilFinished():
+  stuck = execution(1, 'daily', 'RUNNING', -72)
+  session = Session([stuck, execution(2, 'daily', 'SUCCESS', -24)])
+  statistics = updateJobStatistics({}, getJobExecutions(session))
+  assert statistics['daily']['numberOfRuns'] == 1
+  assert statistics['daily']['pendingExecutions'] == ['1']
+
+  # statistics are stored and retrieved before the next run
+  data = jobStatisticsToFrame(statistics)
+  assert data[:, 'pendingExecutions'].to_list() == [['1']]
+  statistics = getJobStatistics(Session([dict(zip(data.names, row)) for row in data.to_tuples()]))
+  watermark = getJobWatermark(statistics)
+  assert watermark == timestamp(-24)
+  assert getPendingExecutions(statistics) == ['1']
+
+  # the execution that was pending has finished
+  stuck.update(status='FAILED', endDate=timestamp(-71))
+  session.rows = [stuck, execution(3, 'daily', 'SUCCESS', -1)]
+  executions = getJobExecutions(session, watermark, pending=getPendingExecutions(statistics))
+  statistics = updateJobStatistics(statistics, executions)
+  job = statistics['daily']
+  assert job['numberOfRuns'] == 3
+  assert job['numberOfSuccessfulRuns'] == 2
+  assert job['pendingExecutions'] == []
+  assert job['lastSubmissionDate'] == timestamp(-1)
+  assert job['lastStatus'] == 'SUCCESS'
+
+def test_analyseProcessingSteps():
+  steps = [
+    {
+      'identifier': index, 'date': f'2023-07-0{index}', 'name': 'build-subjects',
+      'step': {'value': 'Data Processing'}, 'databaseTable': 'subjects',
+      'startTime': f'2023-07-0{index}T01:00:00Z', 'elapsedTime': elapsedTime,
+      'rowsOut': 100, 'comment': 'Rows removed 5'
+    }
+    for index, elapsedTime in [(1, 2.0), (2, 2.5), (3, 9.0)]
+  ] + [
+    {'identifier': 4, 'date': '2023-07-03', 'name': 'import-subjects', 'step': 'Import',
+     'databaseTable': 'subjects', 'elapsedTime': 5.0, 'rowsIn': 50},
+    {'identifier': 5, 'date': '2023-07-02', 'name': 'import-subjects', 'step': 'Import',
+     'databaseTable': 'subjects', 'elapsedTime': 5.0},
+    {'identifier': 6, 'date': '2023-07-02', 'name': 'filter', 'step': 'Filtering',
+     'databaseTable': 'subjects', 'elapsedTime': 1.0, 'comment': 'Identified 12 new codes'}
+  ]
+  imports = [{'date': '2023-07-02', 'subjects': 20}]
+  trends = analyseProcessingSteps(steps, imports, window=2, threshold=1.5)
+  rows = {
+    row[0]: row[1:]
+    for row in trends[:, ['identifier', 'trailingMedian', 'rowCount', 'rowsPerSecond', 'isRegression']].to_tuples()
+  }
+  assert rows[1] == (None, 100, 50.0, False)
+  assert rows[2] == (2.0, 100, 40.0, False)
+  assert rows[3] == (2.25, 100, 11.11, True)
+  assert rows[4][1] == 50
+  assert rows[5][1] == 20
+  assert rows[6][1] is None
@@ -0,0 +1,84 @@
+from cosastools.snapshot import parseRsql, rowsToFrame, createSnapshot, MolgenisSnapshot
+from datatable import dt
+import pytest
+
+def test_parseRsql():
+  assert parseRsql('') is None
+  assert parseRsql("subjectID==1") == ('subjectID', '==', '1')
+  assert parseRsql("a==1;b=in=(x,'y')") == (
+    'and', [('a', '==', '1'), ('b', '=in=', ['x', 'y'])]
+  )
+  assert parseRsql("a==1;b==2,c==3") == (
+    'or', [('and', [('a', '==', '1'), ('b', '==', '2')]), ('c', '==', '3')]
+  )
+  assert parseRsql("a==1;(b==2,c=='x y')") == (
+    'and', [('a', '==', '1'), ('or', [('b', '==', '2'), ('c', '==', 'x y')])]
+  )
+
+@pytest.mark.parametrize('q', ["(a==1", "a==1;", "a==1)"])
+def test_parseRsqlErrors(q):
+  with pytest.raises(ValueError):
+    parseRsql(q)
+
+def test_rowsToFrame():
+  data, encoded = rowsToFrame([
+    {'id': '1', 'age': 10, 'family': {'id': 'A'}},
+    {'id': '2', 'tags': [{'id': 'x'}], 'age': 'unknown'}
+  ])
+  assert data.names == ('id', 'age', 'family', 'tags')
+  assert encoded == ['family', 'tags']
+  assert data.to_tuples() == [
+    ('1', '10', '{"id": "A"}', None),
+    ('2', 'unknown', None, '[{"id": "x"}]')
+  ]
+  assert rowsToFrame([])[0].shape == (0, 0)
+
+class Session:
+  """Returns the rows and metadata of a single table"""
+  rows = [
+    {'_href': '/api/v2/umdm_subjects/1', 'subjectID': '1', 'age': 10, 'family': {'familyID': 'A'}},
+    {'_href': '/api/v2/umdm_subjects/2', 'subjectID': '2', 'age': 40, 'family': {'familyID': 'A'}},
+    {'_href': '/api/v2/umdm_subjects/3', 'subjectID': '3', 'family': {'familyID': 'B'}}
+  ]
+
+  def get(self, entity, **kwargs):
+    return self.rows
+
+  def get_meta(self, entity, **kwargs):
+    return {'attributes': {'items': [
+      {'data': {'name': 'subjectID'}},
+      {'data': {'name': 'family', 'refEntityType': {'attributes': {'items': [
+        {'data': {'name': 'familyID', 'idAttribute': True}}
+      ]}}}}
+    ]}}
+
+@pytest.fixture
+def snapshot(tmp_path):
+  manifest = createSnapshot(Session(), str(tmp_path / 'snapshot'), entities=['umdm_subjects'])
+  assert manifest['entities']['umdm_subjects'] == {
+    'rows': 3,
+    'refs': {'family': 'familyID'},
+    'json': ['family']
+  }
+  return MolgenisSnapshot(str(tmp_path / 'snapshot'), outputDir=str(tmp_path / 'output'))
+
+def test_snapshotGet(snapshot):
+  assert snapshot.get('umdm_subjects') == Session.rows
+  assert snapshot.get('umdm_subjects', q='age=ge=20', attributes='subjectID') == [
+    {'_href': '/api/v2/umdm_subjects/2', 'subjectID': '2'}
+  ]
+  assert snapshot.get('umdm_subjects', q='family==A;age=lt=20', uploadable=True) == [
+    {'subjectID': '1', 'age': 10, 'family': 'A'}
+  ]
+  assert snapshot.count('umdm_subjects', q="age==''") == 1
+  assert snapshot.count('umdm_subjects', q='family=in=(B,C),subjectID==1') == 2
+  assert snapshot.countValues('umdm_subjects', ['age']) == [
+    {'attribute': 'age', 'countOfValues': 2, 'totalValues': 3}
+  ]
+  with pytest.raises(ValueError):
+    snapshot.get('umdm_samples')
+
+def test_snapshotImport(snapshot, tmp_path):
+  snapshot.importDatatableAsCsv('umdm_files', dt.Frame(fileID=['a']))
+  snapshot.importData('umdm_files', [{'fileID': 'b'}])
+  assert dt.fread(str(tmp_path / 'output' / 'umdm_files.jay')).to_tuples() == [('a',), ('b',)]
@@ -0,0 +1,58 @@
+from cosastools.synthetic import (
+  generatePortalChunk,
+  generatePortalData,
+  generateCartageniaPayload,
+  generateConsentData,
+  generateFileListings,
+  writePortalSnapshot
+)
+from cosastools.snapshot import MolgenisSnapshot
+import ast
+
+def withoutDates(data):
+  """Remove the portal record dates (the time the data was generated)"""
+  return {
+    entity: [
+      {key: value for key, value in row.items() if key != 'dateRecordCreated'}
+      for row in rows
+    ]
+    for entity, rows in data.items()
+  }
+
+def test_generatePortalChunkIsReproducible():
+  chunk = withoutDates(generatePortalChunk(start=0, count=20, seed=1))
+  assert chunk == withoutDates(generatePortalChunk(start=0, count=20, seed=1))
+  assert chunk != withoutDates(generatePortalChunk(start=0, count=20, seed=2))
+  assert len(chunk['cosasportal_patients']) >= 20
+
+def test_generatePortalDataIsBuiltFromChunks():
+  data = withoutDates(generatePortalData(subjects=20, chunkSize=10))
+  chunk = withoutDates(generatePortalChunk(start=10, count=10, seed=1))
+  patients = data['cosasportal_patients']
+  assert patients[-len(chunk['cosasportal_patients']):] == chunk['cosasportal_patients']
+  assert len({row['id'] for row in patients}) == len(patients)
+  assert 'cosasmappings_genderatbirth' in data
+
+def test_generatePayloads():
+  data = generatePortalData(subjects=50)
+  payload = generateCartageniaPayload(data['cosasportal_cartagenia'])
+  assert payload == generateCartageniaPayload(data['cosasportal_cartagenia'])
+  records = ast.literal_eval(payload['Output'])
+  assert len(records) >= len(data['cosasportal_cartagenia'])
+  assert all(len(record) == 7 for record in records)
+
+  consent = generateConsentData(data['cosasportal_patients'], ratio=1)
+  assert consent == generateConsentData(data['cosasportal_patients'], ratio=1)
+  assert all('F' not in row['MDN_umcgnr'] for row in consent)
+
+  files = generateFileListings(data['cosasportal_samples'])
+  assert files == generateFileListings(data['cosasportal_samples'])
+  assert {row['filetype'] for row in files} <= {'vcf', 'tbi', 'cram', 'bam', 'fastq'}
+
+def test_writePortalSnapshot(tmp_path):
+  manifest = writePortalSnapshot(str(tmp_path), subjects=30, chunkSize=10)
+  data = generatePortalData(subjects=30, chunkSize=10)
+  snapshot = MolgenisSnapshot(str(tmp_path))
+  for entity, rows in data.items():
+    assert manifest['entities'][entity]['rows'] == len(rows)
+    assert snapshot.count(entity) == len(rows)
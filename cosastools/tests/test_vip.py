@@ -0,0 +1,96 @@
+from cosastools.vip import (
+  flattenXref,
+  getSequencingMethod,
+  getLabProcedureMetadata,
+  buildSamplesheet
+)
+from datatable import dt
+
+def keyed(data, key):
+  data.key = key
+  return data
+
+def reference(withCram: bool = True):
+  """Two families of three (A, B) and a single subject (C)"""
+  subjects = ['1', '2', '3', '4', '5', '6', '7']
+  return {
+    'samplePreparation': dt.Frame(
+      belongsToSample=[f'DNA-{id}' for id in subjects],
+      belongsToLabProcedure=['NX154'] * 7
+    ),
+    'samples': keyed(dt.Frame(
+      sampleID=[f'DNA-{id}' for id in subjects],
+      belongsToSubject=subjects
+    ), 'sampleID'),
+    'subjects': keyed(dt.Frame(
+      subjectID=subjects,
+      belongsToFamily=['A', 'A', 'A', 'B', 'B', 'B', 'C'],
+      belongsToMother=['2', None, None, None, None, None, None],
+      belongsToFather=[None] * 7,
+      genderAtBirth=['male', 'female', 'male', 'female', 'female', 'male', 'male'],
+      yearOfBirth=[2015, 1985, 1983, 2010, None, None, 1990],
+      age=[10, 40, 42, 15, None, None, 35],
+      types={
+        'belongsToMother': dt.Type.str32,
+        'belongsToFather': dt.Type.str32,
+        'yearOfBirth': dt.Type.int16
+      }
+    ), 'subjectID'),
+    'clinical': keyed(dt.Frame(
+      subjectID=['1'],
+      observedPhenotype=['HP:0001250'],
+      affected=[True]
+    ), 'subjectID'),
+    'cram': keyed(dt.Frame(
+      subjectID=subjects if withCram else [],
+      cram=[f'/data/{id}_DNA-{id}.bam.cram' for id in subjects] if withCram else [],
+      types=[dt.Type.str32, dt.Type.str32]
+    ), 'subjectID'),
+    'vcf': keyed(dt.Frame(
+      subjectID=subjects,
+      vcf=[f'/data/{id}_DNA-{id}.vcf.gz' for id in subjects]
+    ), 'subjectID'),
+    'sequencing': dt.Frame(
+      belongsToLabProcedure=['NX154', 'NX154', 'NX154'],
+      referenceGenomeUsed=['GRCh37', 'GRCh37', 'GRCh38']
+    ),
+    'labProcedures': dt.Frame(
+      code=['NX154', 'NX155'],
+      description=['Exoom analyse', 'Genoom analyse']
+    )
+  }
+
+def test_flattenXref():
+  data = dt.Frame(ref=[{'id': 'a'}, None, {}], types=[dt.Type.obj64])
+  flattenXref(data, 'ref', 'id')
+  flattenXref(data, 'missing', 'id')
+  assert data['ref'].to_list()[0] == ['a', None, None]
+  assert data['missing'].to_list()[0] == [None, None, None]
+
+def test_getSequencingMethod():
+  assert getSequencingMethod('Exoom sequencing') == 'WES'
+  assert getSequencingMethod('Whole genome') == 'WGS'
+  assert getSequencingMethod('Array') is None
+  assert getSequencingMethod(None) is None
+
+def test_getLabProcedureMetadata():
+  metadata = getLabProcedureMetadata(reference())
+  assert metadata.to_tuples() == [('NX154', 'GRCh37', 'WES')]
+
+def test_buildSamplesheet():
+  samplesheet = buildSamplesheet(reference(), 'NX154')
+  rows = samplesheet[
+    :, ['family_id', 'individual_id', 'maternal_id', 'paternal_id', 'proband', 'affected']
+  ].to_tuples()
+  assert rows == [
+    ('A', '1_DNA-1', '2_DNA-2', '3_DNA-3', 'true', 'true'),
+    ('A', '2_DNA-2', None, None, 'false', 'false'),
+    ('A', '3_DNA-3', None, None, 'false', 'false'),
+  ]
+  assert samplesheet['project_id'].to_list()[0] == ['NX154_A'] * 3
+
+def test_buildSamplesheetWithoutSamples():
+  assert buildSamplesheet(reference(), 'NX155').shape == (0, 0)
+
+def test_buildSamplesheetWhenAllFamiliesAreRemoved():
+  assert buildSamplesheet(reference(withCram=False), 'NX154').shape == (0, 0)